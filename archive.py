@@ -0,0 +1,157 @@
+import asyncio
+import gzip
+import json
+import logging
+import os
+import zlib
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+from pagination import date_key, order_key
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PREFIX = 'appointments_'
+SEGMENT_SUFFIX = '.jsonl.gz'
+
+
+class AppointmentArchive:
+    """Архив записей: сжатые сегменты по месяцам даты приёма.
+
+    Сегмент ``appointments_ГГГГММ.jsonl.gz`` - записи JSON по одной в
+    строке. Каждый перенос дописывает в сегмент отдельный блок gzip,
+    поэтому старые данные не перечитываются и не перезаписываются.
+    Если запись попала в архив дважды (сбой между записью в архив и
+    удалением из базы), при чтении остаётся последняя версия.
+    """
+
+    def __init__(self, directory: str = 'archive'):
+        self.directory = directory
+
+    def _segment_path(self, month: str) -> str:
+        return os.path.join(self.directory, f"{SEGMENT_PREFIX}{month}{SEGMENT_SUFFIX}")
+
+    def append(self, appointments: List[Dict]):
+        """Дописывание записей в сегменты их месяцев (с fsync)"""
+        by_month: Dict[str, List[Dict]] = {}
+        for appointment in appointments:
+            by_month.setdefault(date_key(appointment['date'])[:6], []).append(appointment)
+        os.makedirs(self.directory, exist_ok=True)
+        for month, items in by_month.items():
+            payload = b''.join(
+                json.dumps(item, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
+                for item in items
+            )
+            with open(self._segment_path(month), 'ab') as f:
+                f.write(gzip.compress(payload, mtime=0))
+                f.flush()
+                os.fsync(f.fileno())
+
+    def months(self) -> List[str]:
+        """Месяцы 'ГГГГММ', за которые есть сегменты"""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]
+            for name in os.listdir(self.directory)
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)
+        )
+
+    def _read_segment(self, month: str) -> Dict[int, Dict]:
+        appointments = {}
+        try:
+            with gzip.open(self._segment_path(month), 'rb') as f:
+                for line in f:
+                    appointment = json.loads(line)
+                    appointments[appointment['id']] = appointment
+        except (EOFError, gzip.BadGzipFile, zlib.error, ValueError) as e:
+            # Недописанный последний блок - след сбоя во время переноса;
+            # его записи остались в базе и будут перенесены снова
+            logger.warning("Сегмент архива %s прочитан не полностью: %s", month, e)
+        return appointments
+
+    def iter_range(self, from_date: Optional[str] = None,
+                   to_date: Optional[str] = None) -> Iterator[Dict]:
+        """Потоковый обход архива за период 'ГГГГММДД' (границы включаются).
+
+        В памяти одновременно находится только один месячный сегмент.
+        """
+        for month in self.months():
+            if (from_date and month < from_date[:6]) or (to_date and month > to_date[:6]):
+                continue
+            appointments = [
+                appointment for appointment in self._read_segment(month).values()
+                if (not from_date or date_key(appointment['date']) >= from_date)
+                and (not to_date or date_key(appointment['date']) <= to_date)
+            ]
+            appointments.sort(key=order_key)
+            yield from appointments
+
+
+class Archiver:
+    """Фоновый перенос прошедших и отменённых записей в архив.
+
+    В базе остаются только активные записи с сегодняшнего дня. Прошедшие
+    активные записи попадают в архив со статусом 'completed'. Записи
+    переносятся пачками по batch_size: сначала пишутся в архив, затем
+    удаляются из базы.
+    """
+
+    def __init__(self, database, archive: AppointmentArchive, interval: float = 3600,
+                 batch_size: int = 1000):
+        self.database = database
+        self.archive = archive
+        self.interval = interval
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+
+    async def run_once(self) -> int:
+        """Перенос всех записей, подлежащих архивации; возвращает их число"""
+        today = datetime.now().strftime("%Y%m%d")
+        moved = 0
+        while True:
+            batch = self.database.archivable_appointments(today, limit=self.batch_size)
+            if not batch:
+                break
+            # Копии: запись в архив идёт в потоке, а записи в базе могут меняться
+            snapshot = [dict(appointment) for appointment in batch]
+            archived = [
+                dict(appointment, status='completed') if appointment['status'] == 'active'
+                else appointment
+                for appointment in snapshot
+            ]
+            await asyncio.to_thread(self.archive.append, archived)
+            # Изменённые за время записи остаются в базе до следующего переноса
+            unchanged = [appointment['id'] for appointment in snapshot
+                         if self.database.get_appointment(appointment['id']) == appointment]
+            moved += self.database.remove_archived(unchanged)
+            if len(batch) < self.batch_size or len(unchanged) < len(batch):
+                break
+        if moved:
+            await self.database.durable()
+            logger.info("В архив перенесено записей: %d", moved)
+        return moved
+
+    def start(self):
+        """Запуск периодического переноса"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановка фоновой задачи"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("Ошибка переноса записей в архив")
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Микробенчмарк клавиатур: построение с нуля против кэша.
+
+Пример:
+    python bench_keyboards.py --number 2000
+"""
+
+import argparse
+import timeit
+from datetime import datetime
+
+import keyboards
+
+CASES = [
+    ("get_main_keyboard(admin)", keyboards.get_main_keyboard, (True,)),
+    ("get_doctors_keyboard", keyboards.get_doctors_keyboard, ()),
+    ("get_procedures_keyboard", keyboards.get_procedures_keyboard, (0,)),
+    ("get_dates_keyboard", keyboards._build_dates_keyboard, (datetime.now().date(), 0)),
+    ("get_times_keyboard", keyboards.get_times_keyboard, (0b00100101,)),
+    ("get_appointment_actions_keyboard", keyboards.get_appointment_actions_keyboard, (42, True)),
+    ("get_confirmation_keyboard", keyboards.get_confirmation_keyboard, ()),
+    ("get_cancel_keyboard", keyboards.get_cancel_keyboard, ()),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение построения и кэширования клавиатур")
+    parser.add_argument('--number', type=int, default=2000, help="повторов на замер")
+    args = parser.parse_args()
+
+    print(f"{'клавиатура':<36}{'без кэша, мкс':>16}{'с кэшем, мкс':>16}{'ускорение':>12}")
+    for name, func, func_args in CASES:
+        build = func.__wrapped__
+        cold = min(timeit.repeat(lambda: build(*func_args), number=args.number, repeat=3))
+        func(*func_args)
+        warm = min(timeit.repeat(lambda: func(*func_args), number=args.number, repeat=3))
+        cold_us = cold / args.number * 1e6
+        warm_us = warm / args.number * 1e6
+        print(f"{name:<36}{cold_us:>16.2f}{warm_us:>16.3f}{cold_us / warm_us:>11.0f}x")
+
+    # get_dates_keyboard дополнительно вычисляет текущую дату на каждый вызов
+    keyboards.get_dates_keyboard()
+    total = min(timeit.repeat(keyboards.get_dates_keyboard, number=args.number, repeat=3))
+    print(f"{'get_dates_keyboard (с datetime.now)':<36}{'':>16}{total / args.number * 1e6:>16.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Нагрузочный бенчмарк: полные сценарии записи через dp.feed_update.
+
+Тысячи условных пользователей параллельно проходят сценарий
+/start → «Записаться» → имя → врач → процедура → дата → время →
+подтверждение → «Мои записи» → просмотр → отмена записи. Кнопки
+выбираются из клавиатур, которые бот прислал в ответ, поэтому сценарий
+идёт по настоящим обработчикам, базе и хранилищу состояний. Вместо
+Bot API - локальная сессия без сети (задержку ответа можно задать
+через --api-latency). Отмена в конце сценария освобождает время, так
+что число пользователей не ограничено количеством слотов.
+
+Выводится пропускная способность и p50/p95/p99 задержки обработки
+обновления на каждом шаге (шаг соответствует одному обработчику).
+С --save-baseline результаты сохраняются в JSON, с --baseline
+сравниваются с сохранёнными: если p50 или p95 какого-либо шага выросли
+больше чем на --tolerance (или упала пропускная способность), скрипт
+завершается с кодом 1.
+
+Хранилище задаётся теми же переменными окружения, что и для бота
+(DATABASE_BACKEND, FSM_STORAGE, ASYNC_WRITES и т. д.); файлы базы
+создаются во временном каталоге.
+
+Пример:
+    python bench_load.py --users 2000 --concurrency 100 --save-baseline baseline.json
+    python bench_load.py --users 2000 --concurrency 100 --baseline baseline.json
+"""
+
+import argparse
+import asyncio
+import importlib
+import itertools
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+# Шаги сценария (по одному обработчику на шаг) в порядке выполнения
+STEPS = [
+    'start', 'make_appointment', 'patient_name', 'select_doctor', 'select_procedure',
+    'select_date', 'select_time', 'confirm', 'my_appointments', 'view_appointment',
+    'cancel_appointment',
+]
+
+# Сколько раз пользователь выбирает другое время, если выбранное заняли
+TIME_ATTEMPTS = 3
+
+
+def prepare_environment(directory: str):
+    """Файлы базы и состояний во временном каталоге (до импорта config)"""
+    os.environ.setdefault('BOT_TOKEN', '123456:bench')
+    os.environ['DATABASE_FILE'] = os.path.join(directory, 'appointments.json')
+    os.environ['SQLITE_DATABASE_FILE'] = os.path.join(directory, 'appointments.db')
+    os.environ['FSM_DATABASE_FILE'] = os.path.join(directory, 'fsm.db')
+
+
+def create_session_class():
+    from aiogram.client.session.base import BaseSession
+    from aiogram.methods import EditMessageText, SendDocument, SendMessage
+    from aiogram.types import Chat, Document, Message
+
+    class FakeSession(BaseSession):
+        """Локальная замена Bot API: ответы без сети, исходящие запросы по чатам"""
+
+        def __init__(self, latency: float = 0.0):
+            super().__init__()
+            self.latency = latency
+            self.outbox: Dict[int, list] = defaultdict(list)
+            self.calls = Counter()
+            self._message_ids = itertools.count(1)
+
+        async def make_request(self, bot, method, timeout=None):
+            self.calls[type(method).__name__] += 1
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            chat_id = getattr(method, 'chat_id', None)
+            if chat_id is not None:
+                self.outbox[chat_id].append(method)
+            if isinstance(method, (SendMessage, EditMessageText, SendDocument)):
+                extra = {}
+                if isinstance(method, SendDocument):
+                    extra['document'] = Document(file_id='bench', file_unique_id='bench')
+                return Message(message_id=next(self._message_ids), date=0,
+                               chat=Chat(id=chat_id, type='private'),
+                               text=getattr(method, 'text', None), **extra)
+            return True
+
+        async def close(self):
+            pass
+
+        async def stream_content(self, *args, **kwargs):
+            yield b''
+
+    return FakeSession
+
+
+class LoadGenerator:
+    """Условные пользователи, отправляющие обновления в диспетчер"""
+
+    def __init__(self, dp, bot, session, seed: int = 0):
+        self.dp = dp
+        self.bot = bot
+        self.session = session
+        self.rng = random.Random(seed)
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.outcomes = Counter()
+        self.updates = 0
+        self._update_ids = itertools.count(1)
+
+    def _user(self, user_id: int):
+        from aiogram.types import User
+        return User(id=user_id, is_bot=False, first_name=f"User{user_id}")
+
+    async def _feed(self, step: str, update):
+        started = time.perf_counter()
+        await self.dp.feed_update(self.bot, update)
+        self.latencies[step].append(time.perf_counter() - started)
+        self.updates += 1
+
+    async def message(self, user_id: int, step: str, text: str):
+        from aiogram.types import Chat, Message, Update
+        message = Message(message_id=1, date=0, chat=Chat(id=user_id, type='private'),
+                          from_user=self._user(user_id), text=text)
+        await self._feed(step, Update(update_id=next(self._update_ids), message=message))
+
+    async def callback(self, user_id: int, step: str, data: str):
+        from aiogram.types import CallbackQuery, Chat, Message, Update
+        update_id = next(self._update_ids)
+        message = Message(message_id=1, date=0, chat=Chat(id=user_id, type='private'), text='bench')
+        query = CallbackQuery(id=str(update_id), from_user=self._user(user_id),
+                              chat_instance='bench', message=message, data=data)
+        await self._feed(step, Update(update_id=update_id, callback_query=query))
+
+    def buttons(self, user_id: int, prefix: str) -> List[str]:
+        """callback_data кнопок последней клавиатуры чата с префиксом prefix"""
+        for method in reversed(self.session.outbox[user_id]):
+            markup = getattr(method, 'reply_markup', None)
+            if markup is not None:
+                return [button.callback_data for row in markup.inline_keyboard for button in row
+                        if button.callback_data and button.callback_data.split(':')[0] == prefix]
+        return []
+
+    def choose(self, user_id: int, prefix: str) -> Optional[str]:
+        buttons = self.buttons(user_id, prefix)
+        return self.rng.choice(buttons) if buttons else None
+
+    async def booking_flow(self, user_id: int) -> str:
+        """Полный сценарий записи и отмены; возвращает итог сценария"""
+        await self.message(user_id, 'start', '/start')
+        await self.callback(user_id, 'make_appointment', 'make_appointment')
+        await self.message(user_id, 'patient_name', f"Пациент {user_id}")
+
+        for step, prefix in (('select_doctor', 'd'), ('select_procedure', 'p'), ('select_date', 'dt')):
+            data = self.choose(user_id, prefix)
+            if data is None:
+                return f"no_{step}"
+            await self.callback(user_id, step, data)
+
+        for _ in range(TIME_ATTEMPTS):
+            data = self.choose(user_id, 't')
+            if data is None:
+                return 'no_free_time'
+            await self.callback(user_id, 'select_time', data)
+            # Время заняли - бот снова показывает выбор времени
+            if not self.buttons(user_id, 'confirm'):
+                continue
+            await self.callback(user_id, 'confirm', 'confirm')
+            if not self.buttons(user_id, 't'):
+                break
+        else:
+            return 'slot_conflict'
+
+        await self.callback(user_id, 'my_appointments', 'my_appointments')
+        data = self.choose(user_id, 'v')
+        if data is None:
+            return 'no_appointment'
+        await self.callback(user_id, 'view_appointment', data)
+        data = self.choose(user_id, 'c')
+        if data is None:
+            return 'no_cancel'
+        await self.callback(user_id, 'cancel_appointment', data)
+        return 'ok'
+
+    async def run(self, users: int, concurrency: int, first_user_id: int = 10 ** 6) -> float:
+        """Прогон всех пользователей; возвращает время в секундах"""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def simulate(user_id: int):
+            async with semaphore:
+                try:
+                    outcome = await self.booking_flow(user_id)
+                except Exception:
+                    logging.getLogger(__name__).exception("Ошибка сценария пользователя %s", user_id)
+                    outcome = 'error'
+                self.outcomes[outcome] += 1
+                # Ответы бота больше не нужны: не копим их в памяти
+                self.session.outbox.pop(user_id, None)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(simulate(first_user_id + i) for i in range(users)))
+        return time.perf_counter() - started
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """p50/p95/p99 в миллисекундах"""
+    if len(samples) < 2:
+        value = samples[0] * 1000 if samples else 0.0
+        return {'p50': value, 'p95': value, 'p99': value}
+    cuts = statistics.quantiles(samples, n=100, method='inclusive')
+    return {'p50': cuts[49] * 1000, 'p95': cuts[94] * 1000, 'p99': cuts[98] * 1000}
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Шаги и метрики, ухудшившиеся относительно базовых значений"""
+    regressions = []
+    for step, current in results['steps'].items():
+        expected = baseline['steps'].get(step)
+        if expected is None:
+            continue
+        for metric in ('p50', 'p95'):
+            if current[metric] > expected[metric] * (1 + tolerance):
+                regressions.append(f"{step} {metric}: {expected[metric]:.2f} → {current[metric]:.2f} мс")
+    if results['updates_per_second'] < baseline['updates_per_second'] * (1 - tolerance):
+        regressions.append(f"пропускная способность: {baseline['updates_per_second']:.0f} → "
+                           f"{results['updates_per_second']:.0f} обновлений/с")
+    return regressions
+
+
+async def run(args) -> Dict:
+    from aiogram import Bot, Dispatcher
+    from aiogram.fsm.storage.memory import MemoryStorage
+
+    config = importlib.import_module('config')
+    handlers = importlib.import_module('handlers')
+    from database import db
+    from fsm_storage import SQLiteStorage
+    from scheduler import setup_scheduler
+
+    if config.FSM_STORAGE == 'sqlite':
+        storage = SQLiteStorage(config.FSM_DATABASE_FILE, ttl=config.FSM_STATE_TTL,
+                                cache_size=config.FSM_CACHE_SIZE)
+    else:
+        storage = MemoryStorage()
+    dp = Dispatcher(storage=storage)
+    handlers.register_handlers(dp)
+    if config.CHAT_QUEUE_DEPTH > 0:
+        setup_scheduler(dp, max_active=config.MAX_CONCURRENT_UPDATES,
+                        max_chat_queue=config.CHAT_QUEUE_DEPTH,
+                        stale_after=config.STALE_CALLBACK_SECONDS)
+
+    session = create_session_class()(latency=args.api_latency / 1000)
+    bot = Bot(token=config.BOT_TOKEN, session=session)
+    if config.ASYNC_WRITES:
+        db.start_writer(delay=config.WRITE_COALESCE_DELAY)
+
+    generator = LoadGenerator(dp, bot, session, seed=args.seed)
+    # Прогрев: импорт, кэши клавиатур, первые записи в базу
+    await generator.run(min(args.users, 20), min(args.concurrency, 20), first_user_id=10 ** 5)
+    generator.latencies.clear()
+    generator.outcomes.clear()
+    generator.updates = 0
+    session.calls.clear()
+
+    elapsed = await generator.run(args.users, args.concurrency)
+
+    await db.stop_writer()
+    await storage.close()
+
+    return {
+        'backend': config.DATABASE_BACKEND,
+        'fsm_storage': config.FSM_STORAGE,
+        'users': args.users,
+        'concurrency': args.concurrency,
+        'api_latency_ms': args.api_latency,
+        'elapsed': elapsed,
+        'updates': generator.updates,
+        'updates_per_second': generator.updates / elapsed,
+        'flows_per_second': args.users / elapsed,
+        'outcomes': dict(generator.outcomes),
+        'api_calls': dict(session.calls),
+        'steps': {step: dict(percentiles(generator.latencies[step]), count=len(generator.latencies[step]))
+                  for step in STEPS if generator.latencies[step]},
+    }
+
+
+def print_results(results: Dict):
+    print(f"Хранилище: {results['backend']}, состояния: {results['fsm_storage']}, "
+          f"пользователей: {results['users']}, одновременно: {results['concurrency']}, "
+          f"задержка API: {results['api_latency_ms']} мс")
+    print(f"{results['updates']} обновлений за {results['elapsed']:.2f} с: "
+          f"{results['updates_per_second']:.0f} обновлений/с, "
+          f"{results['flows_per_second']:.1f} сценариев/с")
+    print("Итоги сценариев: " + ", ".join(f"{name}={count}" for name, count in
+                                          sorted(results['outcomes'].items())))
+    print(f"\n{'шаг':<22}{'обновлений':>12}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}")
+    for step, stats in results['steps'].items():
+        print(f"{step:<22}{stats['count']:>12}{stats['p50']:>10.2f}{stats['p95']:>10.2f}{stats['p99']:>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест сценариев записи")
+    parser.add_argument('--users', type=int, default=2000, help="число пользователей")
+    parser.add_argument('--concurrency', type=int, default=100,
+                        help="сколько пользователей проходят сценарий одновременно")
+    parser.add_argument('--api-latency', type=float, default=0.0,
+                        help="задержка ответа Bot API, мс")
+    parser.add_argument('--seed', type=int, default=0, help="зерно выбора кнопок")
+    parser.add_argument('--save-baseline', metavar='FILE', help="сохранить результаты как базовые")
+    parser.add_argument('--baseline', metavar='FILE', help="сравнить с базовыми результатами")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="допустимое ухудшение относительно базовых значений (доля)")
+    args = parser.parse_args()
+
+    # Журнал INFO на каждое обновление исказил бы замеры
+    logging.disable(logging.INFO)
+    with tempfile.TemporaryDirectory() as directory:
+        prepare_environment(directory)
+        results = asyncio.run(run(args))
+    print_results(results)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\nБазовые результаты сохранены в {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        # Сравнивать имеет смысл только прогоны с одинаковыми параметрами
+        mismatched = [key for key in ('backend', 'fsm_storage', 'users', 'concurrency', 'api_latency_ms')
+                      if baseline.get(key) != results[key]]
+        if mismatched:
+            print("\n⚠️ Параметры отличаются от базовых: " +
+                  ", ".join(f"{key}={baseline.get(key)}→{results[key]}" for key in mismatched))
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n❌ Ухудшение больше {args.tolerance:.0%} относительно {args.baseline}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\n✅ Без ухудшений относительно {args.baseline} (допуск {args.tolerance:.0%})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Бенчмарк маршрутизации callback-запросов: цепочка лямбда-фильтров
+против CallbackRouter.
+
+Оба диспетчера получают одинаковые обновления через dp.feed_update,
+обработчики пустые, поэтому разница - это накладные расходы на выбор
+обработчика. Синхронные лямбда-фильтры aiogram выполняет в пуле потоков,
+поэтому каждый проверенный фильтр заметно удорожает обновление.
+
+Пример:
+    python bench_routing.py --number 5000
+"""
+
+import argparse
+import asyncio
+import time
+
+from aiogram import Bot, Dispatcher
+from aiogram.filters import StateFilter
+from aiogram.filters.callback_data import CallbackData
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.types import CallbackQuery, Chat, Message, Update, User
+
+from callback_router import CallbackRouter
+
+
+class States(StatesGroup):
+    doctor = State()
+    procedure = State()
+    date = State()
+    time = State()
+    confirmation = State()
+
+
+# (действие, есть ли аргумент, состояние) в порядке прежней регистрации
+ACTIONS = [
+    ('main_menu', False, None),
+    ('make_appointment', False, None),
+    ('my_appointments', False, None),
+    ('doctors_list', False, None),
+    ('about', False, None),
+    ('select_doctor', True, States.doctor),
+    ('select_procedure', True, States.procedure),
+    ('select_date', True, States.date),
+    ('select_time', True, States.time),
+    ('confirm', False, States.confirmation),
+    ('view_appointment', True, None),
+    ('cancel_appointment', True, None),
+    ('add_to_calendar', True, None),
+    ('apts', True, None),
+    ('apts_dates', True, None),
+    ('all_appointments', False, None),
+    ('admin_view', True, None),
+    ('delete_appointment', True, None),
+    ('edit_appointment', True, None),
+    ('users_list', False, None),
+    ('users', True, None),
+    ('export', True, None),
+    ('cancel', False, None),
+]
+
+# Нажатия без состояния FSM: от первого зарегистрированного до последнего
+CASES = ['main_menu', 'view_appointment:42', 'admin_view:42', 'export:users', 'cancel']
+
+
+async def noop(callback: CallbackQuery, **kwargs):
+    return None
+
+
+def value_codec(action: str):
+    """Класс CallbackData с одним строковым аргументом для действия"""
+    return type(f"{action}_callback", (CallbackData,), {'__annotations__': {'value': str}},
+                prefix=action)
+
+
+def build_router() -> CallbackRouter:
+    router = CallbackRouter()
+    for action, has_arg, state in ACTIONS:
+        router.route(value_codec(action) if has_arg else action, noop,
+                     state=None if state is None else [state])
+    return router
+
+
+def build_lambda_dispatcher() -> Dispatcher:
+    """Регистрация в прежнем виде: по обработчику с фильтром на каждое действие"""
+    dp = Dispatcher()
+    for action, has_arg, state in ACTIONS:
+        if has_arg:
+            prefix = action + ':'
+            data_filter = lambda c, prefix=prefix: c.data.startswith(prefix)
+        else:
+            data_filter = lambda c, action=action: c.data == action
+        filters = [data_filter]
+        if state is not None:
+            filters.append(StateFilter(state))
+        elif action == 'cancel':
+            filters.append(StateFilter('*'))
+        dp.callback_query.register(noop, *filters)
+    return dp
+
+
+def build_router_dispatcher() -> Dispatcher:
+    dp = Dispatcher()
+    build_router().register(dp)
+    return dp
+
+
+def make_update(update_id: int, data: str) -> Update:
+    user = User(id=1, is_bot=False, first_name='Bench')
+    message = Message(message_id=1, date=0, chat=Chat(id=1, type='private'), text='x')
+    return Update(update_id=update_id, callback_query=CallbackQuery(
+        id=str(update_id), from_user=user, chat_instance='bench', message=message, data=data
+    ))
+
+
+async def measure(dp: Dispatcher, bot: Bot, update: Update, number: int) -> float:
+    """Среднее время dp.feed_update в микросекундах"""
+    for _ in range(100):
+        await dp.feed_update(bot, update)
+    best = float('inf')
+    for _ in range(3):
+        started = time.perf_counter()
+        for _ in range(number):
+            await dp.feed_update(bot, update)
+        best = min(best, time.perf_counter() - started)
+    return best / number * 1e6
+
+
+async def run(number: int):
+    bot = Bot(token='123456:bench')
+    lambda_dp = build_lambda_dispatcher()
+    router_dp = build_router_dispatcher()
+
+    print(f"{'callback_data':<24}{'лямбды, мкс':>14}{'роутер, мкс':>14}{'разница':>12}")
+    for update_id, data in enumerate(CASES, 1):
+        update = make_update(update_id, data)
+        old = await measure(lambda_dp, bot, update, number)
+        new = await measure(router_dp, bot, update, number)
+        print(f"{data:<24}{old:>14.1f}{new:>14.1f}{old - new:>+12.1f}")
+
+    # Чистая стоимость выбора обработчика без диспетчера
+    router = build_router()
+    started = time.perf_counter()
+    for _ in range(number):
+        for data in CASES:
+            router.resolve(data, None)
+    resolve_us = (time.perf_counter() - started) / (number * len(CASES)) * 1e6
+    print(f"\nCallbackRouter.resolve: {resolve_us:.2f} мкс на нажатие")
+
+    await bot.session.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение маршрутизации callback-запросов")
+    parser.add_argument('--number', type=int, default=5000, help="обновлений на замер")
+    args = parser.parse_args()
+    asyncio.run(run(args.number))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Бенчмарк запуска: загрузка базы из JSON и из двоичного снимка.
+
+Для каждого размера генерируются записи и пользователи, сохраняются в
+обоих форматах (как их пишет Database.save_data), после чего замеряются
+размер файла, разбор файла (json.load / snapshot.load), полная загрузка
+Database (разбор и построение индексов - то, что бот делает в db.open
+перед приёмом обновлений) и сохранение. Берётся лучший из --repeat
+замеров.
+
+Пример:
+    python bench_startup.py --sizes 10000 100000 1000000
+"""
+
+import argparse
+import gc
+import importlib
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+from typing import Callable, Dict
+
+FORMATS = ('json', 'binary')
+
+
+def prepare_environment(directory: str):
+    """Файлы базы во временном каталоге (до импорта config)"""
+    os.environ.setdefault('BOT_TOKEN', '123456:bench')
+    os.environ['DATABASE_BACKEND'] = 'json'
+    os.environ['DATABASE_FILE'] = os.path.join(directory, 'appointments.json')
+
+
+def generate_data(appointments: int, seed: int = 0) -> Dict:
+    """Данные в формате Database.data: записи по врачам, датам и времени"""
+    config = importlib.import_module('config')
+    rng = random.Random(seed)
+    doctors = list(config.DOCTORS)
+    procedures = [procedure for items in config.PROCEDURES.values() for procedure in items]
+    times = list(config.AVAILABLE_TIMES)
+    first_day = date.today()
+    users = {
+        str(1000000 + i): {
+            'username': f"user{i}" if i % 3 else None,
+            'first_name': rng.choice(("Анна", "Иван", "Мария", "Пётр", "Ольга")),
+            'registered_at': f"2024-01-01T00:00:{i % 60:02d}.{i:06d}",
+        }
+        for i in range(max(appointments // 4, 1))
+    }
+    user_ids = [int(user_id) for user_id in users]
+    slots_per_day = len(doctors) * len(times)
+    data = {'appointments': [], 'users': users, 'next_id': appointments + 1}
+    for i in range(appointments):
+        day, slot = divmod(i, slots_per_day)
+        data['appointments'].append({
+            'id': i + 1,
+            'user_id': rng.choice(user_ids),
+            'patient_name': f"Пациент {rng.randrange(10 ** 6)}",
+            'doctor': doctors[slot // len(times)],
+            'procedure': rng.choice(procedures),
+            'date': (first_day + timedelta(days=day)).strftime('%d.%m.%Y'),
+            'time': times[slot % len(times)],
+            'created_at': f"2024-01-01T12:00:00.{i % 10 ** 6:06d}",
+            'status': 'deleted' if rng.random() < 0.1 else 'active',
+        })
+    return data
+
+
+def best_time(func: Callable, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def measure(size: int, directory: str, repeat: int) -> Dict[str, Dict[str, float]]:
+    database = importlib.import_module('database')
+    snapshot = importlib.import_module('snapshot')
+    writer = database.Database(os.path.join(directory, 'bench'), lazy=True)
+    writer.data = generate_data(size)
+    results = {}
+    for snapshot_format in FORMATS:
+        writer.filename = os.path.join(directory, f"bench_{size}_{snapshot_format}")
+        writer.snapshot_format = snapshot_format
+        results[snapshot_format] = {'save': best_time(writer.save_data, repeat)}
+    # Сгенерированные данные больше не нужны: при 1 млн записей память на счету
+    del writer
+
+    for snapshot_format in FORMATS:
+        filename = os.path.join(directory, f"bench_{size}_{snapshot_format}")
+        if snapshot_format == 'binary':
+            def decode():
+                return snapshot.load(filename)
+        else:
+            def decode():
+                with open(filename, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+
+        results[snapshot_format].update(
+            size_mb=os.path.getsize(filename) / 2 ** 20,
+            decode=best_time(decode, repeat),
+            load=best_time(lambda: database.Database(filename, snapshot_format=snapshot_format),
+                           repeat),
+        )
+        os.remove(filename)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Время загрузки базы: JSON против двоичного снимка")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000],
+                        help="число записей")
+    parser.add_argument('--repeat', type=int, default=3, help="замеров на каждый размер")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        prepare_environment(directory)
+        print(f"{'записей':>10} {'формат':<8}{'файл, МБ':>10}{'разбор, с':>12}"
+              f"{'загрузка, с':>14}{'запись, с':>12}")
+        for size in args.sizes:
+            results = measure(size, directory, args.repeat)
+            for snapshot_format in FORMATS:
+                result = results[snapshot_format]
+                print(f"{size:>10} {snapshot_format:<8}{result['size_mb']:>10.1f}"
+                      f"{result['decode']:>12.3f}{result['load']:>14.3f}{result['save']:>12.3f}")
+            speedup = results['json']['load'] / results['binary']['load']
+            print(f"{'':>10} загрузка снимка быстрее JSON в {speedup:.1f} раза")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,293 @@
+import asyncio
+import json
+import logging
+import os
+import time as time_module
+from collections import deque
+from datetime import datetime
+from functools import partial
+from typing import Callable, Deque, Dict, Optional, Tuple
+
+from aiogram.exceptions import TelegramForbiddenError
+from aiogram.methods import EditMessageText, SendMessage
+from aiogram.types import InlineKeyboardMarkup
+
+from send_queue import SendQueue
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+
+class BroadcastLock:
+    """Исключительная блокировка файла: одна рассылка на все процессы.
+
+    Нужна, когда бот работает в нескольких процессах с общим файлом
+    состояния рассылки. Блокировку снимает ОС при завершении процесса,
+    поэтому после сбоя обработчика рассылку можно запустить снова.
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self._file = None
+
+    def acquire(self) -> bool:
+        """Захват блокировки без ожидания; False, если она у другого процесса"""
+        if self._file is not None:
+            return True
+        f = open(self.filename, 'a+b')
+        try:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            f.close()
+            return False
+        self._file = f
+        return True
+
+    def release(self):
+        if self._file is None:
+            return
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        self._file.close()
+        self._file = None
+
+
+class Broadcaster:
+    """Рассылка сообщения всем пользователям.
+
+    Получатели читаются потоком из базы (iter_users) от сохранённого
+    курсора, сообщения уходят через очередь отправки, при этом ожидающих
+    отправки сообщений не больше concurrency. Курсор сохраняется в файл
+    состояния только до последнего получателя, для которого завершены
+    все предыдущие отправки, поэтому после перезапуска рассылка
+    продолжается с места остановки (повторно могут получить сообщение
+    лишь те, чья отправка не успела завершиться). Пользователи,
+    заблокировавшие бота, помечаются в базе и дальше пропускаются.
+    С lock рассылка идёт, только пока удерживается блокировка, - так
+    процессы с общим файлом состояния не запускают рассылки одновременно.
+    """
+
+    # Как часто обновлять сообщение с прогрессом и сохранять курсор (секунды)
+    PROGRESS_INTERVAL = 3.0
+    CHECKPOINT_INTERVAL = 1.0
+
+    def __init__(self, database, send_queue: SendQueue, state_file: str,
+                 concurrency: int = 50,
+                 progress_markup: Optional[InlineKeyboardMarkup] = None,
+                 lock: Optional[BroadcastLock] = None,
+                 clock: Callable[[], float] = time_module.monotonic):
+        self.database = database
+        self.send_queue = send_queue
+        self.state_file = state_file
+        self.concurrency = concurrency
+        # Клавиатура сообщения с прогрессом, пока рассылка идёт (кнопка остановки)
+        self.progress_markup = progress_markup
+        self.lock = lock
+        self.clock = clock
+        self.state: Optional[Dict] = None
+        self._stopping = False
+        self._task: Optional[asyncio.Task] = None
+        self._last_report = ''
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def acquire(self) -> bool:
+        """Захват права на рассылку; False, если её ведёт другой процесс.
+
+        Вызывается перед отправкой сообщения с прогрессом, чтобы не
+        оставлять его, если рассылка не начнётся. start() захватывает
+        блокировку сам, если это не сделано заранее.
+        """
+        return self.lock is None or self.lock.acquire()
+
+    def release(self):
+        """Снятие захвата, если рассылка так и не была запущена"""
+        if self.lock is not None and not self.running:
+            self.lock.release()
+
+    def start(self, text: str, chat_id: int, message_id: int) -> bool:
+        """Запуск новой рассылки; False, если рассылка уже идёт"""
+        if self.running or not self.acquire():
+            return False
+        self.state = {
+            'text': text,
+            'chat_id': chat_id,
+            'message_id': message_id,
+            'cursor': None,
+            'sent': 0,
+            'failed': 0,
+            'blocked': 0,
+            'skipped': 0,
+            'status': 'running',
+            'started_at': datetime.now().isoformat()
+        }
+        self._save_state()
+        self._launch()
+        return True
+
+    def resume(self, owns_chat: Optional[Callable[[int], bool]] = None) -> bool:
+        """Продолжение рассылки, прерванной перезапуском.
+
+        owns_chat - проверка, что чат администратора обслуживает этот
+        процесс (при нескольких обработчиках рассылку продолжает один).
+        """
+        if self.running or not os.path.exists(self.state_file):
+            return False
+        with open(self.state_file, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        if state.get('status') != 'running':
+            return False
+        if owns_chat is not None and not owns_chat(state['chat_id']):
+            return False
+        if not self.acquire():
+            return False
+        self.state = state
+        logger.info("Продолжение рассылки с курсора %s", state['cursor'])
+        self._launch()
+        return True
+
+    def stop(self):
+        """Остановка рассылки по запросу администратора"""
+        self._stopping = True
+
+    async def shutdown(self):
+        """Прерывание при остановке бота: рассылка продолжится после перезапуска"""
+        if not self.running:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    def _release_lock(self):
+        if self.lock is not None:
+            self.lock.release()
+
+    def _launch(self):
+        self._stopping = False
+        self._last_report = ''
+        self._task = asyncio.create_task(self._run())
+
+    def _save_state(self):
+        """Атомарная запись состояния рассылки"""
+        temp_file = f"{self.state_file}.tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, ensure_ascii=False)
+        os.replace(temp_file, self.state_file)
+
+    def progress_text(self) -> str:
+        state = self.state
+        title = {
+            'running': "📣 Идёт рассылка...",
+            'done': "✅ Рассылка завершена",
+            'stopped': "⏹ Рассылка остановлена",
+            'failed': "❌ Рассылка прервана из-за ошибки",
+        }[state['status']]
+        return (
+            f"{title}\n\n"
+            f"📨 Отправлено: {state['sent']}\n"
+            f"⚠️ Ошибок: {state['failed']}\n"
+            f"🚫 Заблокировали бота: {state['blocked'] + state['skipped']}"
+        )
+
+    def _report(self):
+        """Обновление сообщения с прогрессом (только если текст изменился)"""
+        text = self.progress_text()
+        if text == self._last_report:
+            return
+        self._last_report = text
+        running = self.state['status'] == 'running'
+        self.send_queue.submit(EditMessageText(
+            chat_id=self.state['chat_id'],
+            message_id=self.state['message_id'],
+            text=text,
+            reply_markup=self.progress_markup if running else None
+        ))
+
+    def _on_result(self, user_id: int, future: asyncio.Future):
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is None:
+            self.state['sent'] += 1
+        elif isinstance(error, TelegramForbiddenError):
+            self.state['blocked'] += 1
+            self.database.set_user_blocked(user_id)
+        else:
+            self.state['failed'] += 1
+
+    def _advance(self, window: Deque[Tuple[int, Optional[asyncio.Future]]]):
+        """Сдвиг курсора за непрерывную завершённую часть окна"""
+        while window and (window[0][1] is None or window[0][1].done()):
+            self.state['cursor'] = window.popleft()[0]
+
+    async def _run(self):
+        state = self.state
+        window: Deque[Tuple[int, Optional[asyncio.Future]]] = deque()
+        pending = set()
+        last_checkpoint = last_report = self.clock()
+
+        try:
+            for cursor, user_id, user in self.database.iter_users(after=state['cursor']):
+                if self._stopping:
+                    break
+                if user.get('blocked'):
+                    state['skipped'] += 1
+                    window.append((cursor, None))
+                else:
+                    future = self.send_queue.submit(SendMessage(chat_id=int(user_id), text=state['text']))
+                    future.add_done_callback(partial(self._on_result, int(user_id)))
+                    future.add_done_callback(pending.discard)
+                    pending.add(future)
+                    window.append((cursor, future))
+
+                if len(pending) >= self.concurrency:
+                    await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                else:
+                    # Отдаём управление циклу событий даже при подряд идущих пропусках
+                    await asyncio.sleep(0)
+
+                now = self.clock()
+                if now - last_checkpoint >= self.CHECKPOINT_INTERVAL:
+                    self._advance(window)
+                    self._save_state()
+                    last_checkpoint = now
+                if now - last_report >= self.PROGRESS_INTERVAL:
+                    self._report()
+                    last_report = now
+
+            if pending:
+                await asyncio.wait(pending)
+            self._advance(window)
+            state['status'] = 'stopped' if self._stopping else 'done'
+        except asyncio.CancelledError:
+            # Бот останавливается: сохраняем курсор, статус остаётся running
+            self._advance(window)
+            self._save_state()
+            self._release_lock()
+            raise
+        except Exception:
+            logger.exception("Ошибка рассылки")
+            self._advance(window)
+            state['status'] = 'failed'
+
+        self._save_state()
+        self._release_lock()
+        self._report()
+        logger.info("Рассылка завершена: отправлено %d, ошибок %d, заблокировали %d, пропущено %d",
+                    state['sent'], state['failed'], state['blocked'], state['skipped'])
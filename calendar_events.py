@@ -0,0 +1,208 @@
+import hashlib
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, NamedTuple, Optional, Tuple, Union
+
+from aiogram.types import BufferedInputFile
+
+logger = logging.getLogger(__name__)
+
+# Длительность приёма в календаре
+EVENT_DURATION = timedelta(hours=1)
+
+# Статус записи -> STATUS события
+EVENT_STATUS = {
+    'active': 'CONFIRMED',
+    'completed': 'CONFIRMED',
+    'deleted': 'CANCELLED',
+}
+
+# Поля записи, от которых зависит содержимое .ics
+EVENT_FIELDS = ('date', 'time', 'doctor', 'procedure', 'patient_name', 'status')
+
+
+def escape_text(value: str) -> str:
+    """Экранирование текстового значения iCalendar (RFC 5545, 3.3.11)"""
+    return (value.replace('\\', '\\\\').replace(';', '\\;')
+            .replace(',', '\\,').replace('\n', '\\n'))
+
+
+def event_version(appointment: Dict) -> Tuple:
+    """Версия события: меняется при любом изменении, видимом в календаре"""
+    return tuple(appointment.get(field) for field in EVENT_FIELDS)
+
+
+def render_event(appointment: Dict) -> str:
+    """Блок VEVENT для записи"""
+    start = datetime.strptime(f"{appointment['date']} {appointment['time']}", "%d.%m.%Y %H:%M")
+    # timedelta корректно переносит конец приёма на следующий день
+    end = start + EVENT_DURATION
+    description = (f"Пациент: {appointment['patient_name']}\n"
+                   f"Процедура: {appointment['procedure']}")
+
+    return "\r\n".join((
+        "BEGIN:VEVENT",
+        f"UID:{appointment['id']}@clinicbot",
+        f"DTSTAMP:{datetime.fromisoformat(appointment['created_at']):%Y%m%dT%H%M%S}",
+        f"DTSTART:{start:%Y%m%dT%H%M%S}",
+        f"DTEND:{end:%Y%m%dT%H%M%S}",
+        f"SUMMARY:{escape_text('Прием у ' + appointment['doctor'])}",
+        f"DESCRIPTION:{escape_text(description)}",
+        f"LOCATION:{escape_text('Клиника «Здоровье»')}",
+        f"STATUS:{EVENT_STATUS.get(appointment['status'], 'TENTATIVE')}",
+        "END:VEVENT",
+    ))
+
+
+def calendar_chunks(events: Iterable[str], name: Optional[str] = None) -> Iterator[str]:
+    """Календарь из готовых блоков VEVENT по частям"""
+    yield "BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//Clinic Bot//EN\r\n"
+    if name:
+        yield f"X-WR-CALNAME:{escape_text(name)}\r\n"
+    for event in events:
+        yield event
+        yield "\r\n"
+    yield "END:VCALENDAR\r\n"
+
+
+def render_calendar(appointment: Dict) -> bytes:
+    """Файл .ics с одной записью"""
+    return "".join(calendar_chunks([render_event(appointment)])).encode('utf-8')
+
+
+class CalendarFileCache:
+    """Кэш файлов .ics по номеру записи.
+
+    Для каждой записи хранится версия события (event_version), готовые
+    байты и file_id после первой загрузки в Telegram. Повторное нажатие
+    отправляет файл по file_id без генерации и загрузки; при изменении
+    записи версия не совпадает и файл генерируется заново.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        # appointment_id -> [версия, байты, file_id]
+        self._entries: 'OrderedDict[int, list]' = OrderedDict()
+
+    def document(self, appointment: Dict) -> Optional[Union[str, BufferedInputFile]]:
+        """file_id уже загруженного файла или новый файл в памяти"""
+        appointment_id = appointment['id']
+        version = event_version(appointment)
+        entry = self._entries.get(appointment_id)
+
+        if entry is None or entry[0] != version:
+            try:
+                content = render_calendar(appointment)
+            except (KeyError, ValueError) as e:
+                logger.error("Ошибка создания календаря для записи %s: %s", appointment_id, e)
+                return None
+            entry = [version, content, None]
+            self._entries[appointment_id] = entry
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        else:
+            self._entries.move_to_end(appointment_id)
+
+        if entry[2] is not None:
+            return entry[2]
+        return BufferedInputFile(entry[1], filename=f"appointment_{appointment_id}.ics")
+
+    def remember_file_id(self, appointment: Dict, file_id: str):
+        """Сохранение file_id после загрузки (если запись с тех пор не менялась)"""
+        entry = self._entries.get(appointment['id'])
+        if entry is not None and entry[0] == event_version(appointment):
+            entry[2] = file_id
+
+
+class CalendarFeed(NamedTuple):
+    kind: str
+    key: object
+    etag: str
+    content: bytes
+    # file_id календаря с этим ETag, если он уже загружался в Telegram
+    file_id: Optional[str]
+
+    @property
+    def filename(self) -> str:
+        return f"calendar_{self.kind}_{self.etag[:8]}.ics"
+
+
+class CalendarFeeds:
+    """Календари со всеми активными записями пользователя или врача.
+
+    Календарь собирается обходом индекса активных записей
+    (iter_active_appointments). Блоки VEVENT кэшируются по номеру записи
+    и её версии, поэтому при пересборке заново генерируются только
+    изменившиеся события. ETag - хэш номеров и версий всех событий:
+    пока он не изменился, отдаются готовые байты (и file_id в Telegram).
+    """
+
+    def __init__(self, database, maxsize: int = 1024, events_maxsize: int = 10000):
+        self.database = database
+        self.maxsize = maxsize
+        self.events_maxsize = events_maxsize
+        # appointment_id -> (версия, блок VEVENT)
+        self._events: 'OrderedDict[int, Tuple[Tuple, str]]' = OrderedDict()
+        # ('user'|'doctor', ключ) -> [ETag, байты, file_id]
+        self._feeds: 'OrderedDict[Tuple[str, object], list]' = OrderedDict()
+
+    def _event(self, appointment: Dict, version: Tuple) -> Optional[str]:
+        cached = self._events.get(appointment['id'])
+        if cached is not None and cached[0] == version:
+            self._events.move_to_end(appointment['id'])
+            return cached[1]
+        try:
+            event = render_event(appointment)
+        except (KeyError, ValueError) as e:
+            logger.error("Ошибка создания календаря для записи %s: %s", appointment['id'], e)
+            return None
+        self._events[appointment['id']] = (version, event)
+        if len(self._events) > self.events_maxsize:
+            self._events.popitem(last=False)
+        return event
+
+    def _feed(self, kind: str, key, appointments: Iterable[Dict], name: str) -> CalendarFeed:
+        digest = hashlib.sha1()
+        events = []
+        for appointment in appointments:
+            version = event_version(appointment)
+            digest.update(repr((appointment['id'], version)).encode('utf-8'))
+            event = self._event(appointment, version)
+            if event is not None:
+                events.append(event)
+        etag = digest.hexdigest()
+
+        feed_key = (kind, key)
+        entry = self._feeds.get(feed_key)
+        if entry is not None and entry[0] == etag:
+            self._feeds.move_to_end(feed_key)
+        else:
+            content = "".join(calendar_chunks(events, name)).encode('utf-8')
+            entry = [etag, content, None]
+            self._feeds[feed_key] = entry
+            if len(self._feeds) > self.maxsize:
+                self._feeds.popitem(last=False)
+        return CalendarFeed(kind, key, *entry)
+
+    def user_feed(self, user_id: int) -> CalendarFeed:
+        """Календарь пациента"""
+        return self._feed('user', user_id,
+                          self.database.iter_active_appointments(user_id=user_id),
+                          "Клиника «Здоровье»: мои записи")
+
+    def doctor_feed(self, doctor: str) -> CalendarFeed:
+        """Календарь врача"""
+        return self._feed('doctor', doctor,
+                          self.database.iter_active_appointments(doctor=doctor),
+                          f"Клиника «Здоровье»: {doctor}")
+
+    def document(self, feed: CalendarFeed) -> Union[str, BufferedInputFile]:
+        """file_id уже загруженного календаря или файл в памяти"""
+        return feed.file_id or BufferedInputFile(feed.content, filename=feed.filename)
+
+    def remember_file_id(self, feed: CalendarFeed, file_id: str):
+        """Сохранение file_id после загрузки (если календарь с тех пор не менялся)"""
+        entry = self._feeds.get((feed.kind, feed.key))
+        if entry is not None and entry[0] == feed.etag:
+            entry[2] = file_id
@@ -0,0 +1,51 @@
+import hashlib
+import hmac
+from typing import Optional
+
+from aiohttp import web
+
+from calendar_events import CalendarFeeds
+from config import CALENDAR_FEED_BASE_URL, CALENDAR_FEED_SECRET, DOCTORS
+
+# Календари по HTTP: /calendar/user/<user_id>.ics и /calendar/doctor/<индекс врача>.ics.
+# Ссылка содержит подпись (HMAC от CALENDAR_FEED_SECRET), поэтому чужой
+# календарь нельзя получить перебором идентификаторов.
+
+
+def feed_token(kind: str, key) -> str:
+    """Подпись ссылки на календарь"""
+    message = f"{kind}:{key}".encode('utf-8')
+    return hmac.new(CALENDAR_FEED_SECRET.encode('utf-8'), message, hashlib.sha256).hexdigest()[:32]
+
+
+def feed_url(kind: str, key) -> Optional[str]:
+    """Ссылка для подписки на календарь (None, если HTTP-доступ не настроен)"""
+    if not CALENDAR_FEED_SECRET or not CALENDAR_FEED_BASE_URL:
+        return None
+    return (f"{CALENDAR_FEED_BASE_URL.rstrip('/')}/calendar/{kind}/{key}.ics"
+            f"?token={feed_token(kind, key)}")
+
+
+def setup_calendar_routes(app: web.Application, feeds: CalendarFeeds):
+    """Регистрация маршрутов календарей в aiohttp-приложении"""
+
+    async def handle_feed(request: web.Request) -> web.Response:
+        kind, key = request.match_info['kind'], request.match_info['key']
+        if not hmac.compare_digest(request.query.get('token', ''), feed_token(kind, key)):
+            raise web.HTTPNotFound()
+
+        if kind == 'user' and key.isdigit():
+            feed = feeds.user_feed(int(key))
+        elif kind == 'doctor' and key.isdigit() and int(key) < len(DOCTORS):
+            feed = feeds.doctor_feed(DOCTORS[int(key)])
+        else:
+            raise web.HTTPNotFound()
+
+        etag = f'"{feed.etag}"'
+        headers = {'ETag': etag, 'Cache-Control': 'private, max-age=300'}
+        if etag in request.headers.get('If-None-Match', ''):
+            return web.Response(status=304, headers=headers)
+        return web.Response(body=feed.content, content_type='text/calendar',
+                            charset='utf-8', headers=headers)
+
+    app.router.add_get('/calendar/{kind}/{key}.ics', handle_feed)
@@ -0,0 +1,94 @@
+import inspect
+import logging
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Iterable, NamedTuple, Optional, Tuple, Type, Union
+
+from aiogram import Dispatcher
+from aiogram.dispatcher.event.bases import SkipHandler
+from aiogram.filters.callback_data import CallbackData
+from aiogram.fsm.state import State
+from aiogram.types import CallbackQuery
+
+logger = logging.getLogger(__name__)
+
+# Обработчик, выбранный последним вызовом CallbackRouter.dispatch в текущем
+# контексте (для middleware, которым нужно имя обработчика, а не dispatch)
+current_handler: ContextVar[Optional[Callable[..., Awaitable[Any]]]] = ContextVar('current_handler', default=None)
+
+
+class Route(NamedTuple):
+    handler: Callable[..., Awaitable[Any]]
+    codec: Optional[Type[CallbackData]]
+    states: Optional[frozenset]
+    # Данные диспетчера (state, bot, workflow data), которые принимает обработчик
+    params: frozenset
+
+
+class CallbackRouter:
+    """Маршрутизация callback-запросов по действию за одну операцию.
+
+    callback_data имеет вид ``префикс[:арг1[:арг2...]]``. Префикс
+    отделяется один раз и ищется в словаре маршрутов. Для действий с
+    аргументами маршрут хранит класс CallbackData (см. callbacks.py):
+    данные распаковываются и проверяются им один раз и передаются
+    обработчику параметром callback_data. Остальные данные диспетчера
+    (state, bot, значения dp['...']) передаются, если обработчик их
+    принимает. Вместо цепочки фильтров в диспетчере регистрируется один
+    обработчик.
+    """
+
+    def __init__(self):
+        self._routes: Dict[str, Route] = {}
+
+    def route(self, action: Union[str, Type[CallbackData]],
+              handler: Callable[..., Awaitable[Any]], state: Optional[Iterable] = None):
+        """Регистрация обработчика действия.
+
+        action - callback_data без аргументов или класс CallbackData,
+        state - допустимые состояния FSM (None - любое, как StateFilter('*')).
+        """
+        codec = None
+        if isinstance(action, type) and issubclass(action, CallbackData):
+            codec, action = action, action.__prefix__
+        if action in self._routes:
+            raise ValueError(f"Действие {action!r} уже зарегистрировано")
+        states = None
+        if state is not None:
+            states = frozenset(s.state if isinstance(s, State) else s for s in state)
+        params = frozenset(inspect.signature(handler).parameters) - {'callback_data'}
+        self._routes[action] = Route(handler, codec, states, params)
+
+    def register(self, dp: Dispatcher):
+        """Подключение маршрутизатора к диспетчеру"""
+        dp.callback_query.register(self.dispatch)
+
+    def resolve(self, data: str, raw_state: Optional[str]) -> Optional[Tuple[Route, Dict[str, Any]]]:
+        """Поиск маршрута и разбор аргументов callback_data"""
+        action, _, payload = data.partition(':')
+        route = self._routes.get(action)
+        if route is None:
+            return None
+        if route.states is not None and raw_state not in route.states:
+            return None
+
+        if route.codec is None:
+            return (route, {}) if not payload else None
+        try:
+            callback_data = route.codec.unpack(data)
+        except (TypeError, ValueError):
+            logger.warning("Некорректные аргументы в callback_data: %r", data)
+            return None
+        return route, {'callback_data': callback_data}
+
+    async def dispatch(self, callback: CallbackQuery, raw_state: Optional[str] = None,
+                       **data: Any):
+        resolved = self.resolve(callback.data or '', raw_state)
+        if resolved is None:
+            # Как при несработавших фильтрах: обновление остаётся необработанным
+            raise SkipHandler()
+        route, kwargs = resolved
+        current_handler.set(route.handler)
+        for name in route.params:
+            if name in data:
+                kwargs[name] = data[name]
+        return await route.handler(callback, **kwargs)
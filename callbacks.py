@@ -0,0 +1,122 @@
+from typing import List, Literal
+
+from aiogram.filters.callback_data import CallbackData
+from pydantic import Field, model_validator
+
+from config import AVAILABLE_TIMES, DOCTORS, PROCEDURES
+
+# Кодек callback_data: короткий префикс действия и числовые идентификаторы
+# вместо названий. Врач - индекс в DOCTORS, процедура - индекс в списке
+# процедур врача, время - индекс в AVAILABLE_TIMES. Значения проверяются
+# при распаковке, поэтому обработчики получают уже корректные данные.
+
+
+def doctor_procedures(doctor_id: int) -> List[str]:
+    """Процедуры врача по его индексу в DOCTORS"""
+    # Первая часть названия врача - ключ в PROCEDURES
+    doctor_key = DOCTORS[doctor_id].split()[0].lower()
+    return PROCEDURES.get(doctor_key, ["Консультация"])
+
+
+class DoctorCallback(CallbackData, prefix='d'):
+    """Выбор врача"""
+    id: int = Field(ge=0, lt=len(DOCTORS))
+
+    @property
+    def doctor(self) -> str:
+        return DOCTORS[self.id]
+
+
+class ProcedureCallback(CallbackData, prefix='p'):
+    """Выбор процедуры врача"""
+    doctor_id: int = Field(ge=0, lt=len(DOCTORS))
+    id: int = Field(ge=0)
+
+    @model_validator(mode='after')
+    def check_procedure(self):
+        if self.id >= len(doctor_procedures(self.doctor_id)):
+            raise ValueError(f"У врача {self.doctor_id} нет процедуры {self.id}")
+        return self
+
+    @property
+    def procedure(self) -> str:
+        return doctor_procedures(self.doctor_id)[self.id]
+
+
+class DateCallback(CallbackData, prefix='dt'):
+    """Выбор даты (дд.мм.гггг)"""
+    date: str = Field(pattern=r'^\d{2}\.\d{2}\.\d{4}$')
+
+
+class TimeCallback(CallbackData, prefix='t'):
+    """Выбор времени"""
+    slot: int = Field(ge=0, lt=len(AVAILABLE_TIMES))
+
+    @property
+    def time(self) -> str:
+        return AVAILABLE_TIMES[self.slot]
+
+
+class AppointmentCallback(CallbackData, prefix='a'):
+    """Действие над записью по её номеру (базовый класс)"""
+    id: int = Field(ge=1)
+
+
+class ViewAppointmentCallback(AppointmentCallback, prefix='v'):
+    """Просмотр записи пользователем"""
+
+
+class CancelAppointmentCallback(AppointmentCallback, prefix='c'):
+    """Отмена записи пользователем"""
+
+
+class CalendarCallback(AppointmentCallback, prefix='k'):
+    """Файл записи для календаря"""
+
+
+class AdminViewCallback(AppointmentCallback, prefix='av'):
+    """Просмотр записи админом"""
+
+
+class DeleteAppointmentCallback(AppointmentCallback, prefix='del'):
+    """Удаление записи админом"""
+
+
+class EditAppointmentCallback(AppointmentCallback, prefix='e'):
+    """Редактирование записи админом"""
+
+
+class AppointmentsPageCallback(CallbackData, prefix='ap'):
+    """Навигация по списку записей.
+
+    direction: 'n' - после записи cursor, 'p' - до записи cursor,
+    'd' - начиная с даты cursor (ГГГГММДД).
+    """
+    admin: bool
+    direction: Literal['n', 'p', 'd']
+    cursor: int = Field(ge=0)
+
+
+class AppointmentsDatesCallback(CallbackData, prefix='ad'):
+    """Выбор даты для перехода в списке записей"""
+    admin: bool
+
+
+class UsersPageCallback(CallbackData, prefix='up'):
+    """Навигация по списку пользователей"""
+    direction: Literal['n', 'p']
+    cursor: int = Field(ge=0)
+
+
+class DoctorCalendarCallback(CallbackData, prefix='dc'):
+    """Календарь записей врача (админ)"""
+    id: int = Field(ge=0, lt=len(DOCTORS))
+
+    @property
+    def doctor(self) -> str:
+        return DOCTORS[self.id]
+
+
+class ExportCallback(CallbackData, prefix='x'):
+    """Выгрузка таблицы в CSV"""
+    table: Literal['users', 'appointments']
@@ -10,6 +10,124 @@ BOT_TOKEN = os.getenv('BOT_TOKEN')
 # ID администраторов (можно несколько через запятую)
 ADMIN_IDS = [int(id) for id in os.getenv('ADMIN_IDS', '').split(',') if id]
 
+# Режим получения обновлений: polling (long polling) или webhook
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+
+# Настройки вебхука: публичный адрес, путь и секрет для проверки запросов Telegram
+WEBHOOK_BASE_URL = os.getenv('WEBHOOK_BASE_URL', '')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+# Адрес, на котором слушает встроенный HTTP-сервер
+WEBAPP_HOST = os.getenv('WEBAPP_HOST', '0.0.0.0')
+WEBAPP_PORT = int(os.getenv('WEBAPP_PORT', '8080'))
+# Сколько одновременных соединений Telegram может открыть к вебхуку (1-100)
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40'))
+
+# Максимум одновременно обрабатываемых обновлений (в обоих режимах)
+MAX_CONCURRENT_UPDATES = int(os.getenv('MAX_CONCURRENT_UPDATES', '100'))
+# Планировщик обновлений: обновления одного чата обрабатываются по очереди,
+# в очереди чата ждёт не больше CHAT_QUEUE_DEPTH обновлений, лишние и
+# повторные нажатия кнопок получают ответ «подождите» (0 - отключить)
+CHAT_QUEUE_DEPTH = int(os.getenv('CHAT_QUEUE_DEPTH', '5'))
+# Максимум принятых в работу обновлений при включённом планировщике
+# (ждущие в очередях чатов и обрабатываемые)
+MAX_PENDING_UPDATES = int(os.getenv('MAX_PENDING_UPDATES', '1000'))
+# Нажатие кнопки, прождавшее в очереди дольше стольких секунд, не обрабатывается
+STALE_CALLBACK_SECONDS = float(os.getenv('STALE_CALLBACK_SECONDS', '10'))
+
+# Число процессов-обработчиков. Больше 1: основной процесс только принимает
+# обновления и раскладывает их по обработчикам по id чата (нужны
+# DATABASE_BACKEND=sqlite и FSM_STORAGE=sqlite); /metrics каждого обработчика -
+# на порту WEBAPP_PORT + 1 + номер обработчика
+WORKERS = int(os.getenv('WORKERS', '1'))
+# Сколько обновлений может ждать в очереди одного обработчика
+WORKER_QUEUE_SIZE = int(os.getenv('WORKER_QUEUE_SIZE', '1000'))
+
+# Хранилище данных: json (полная перезапись файла), journal (журнал изменений)
+# или sqlite (база SQLite, перенос данных - migrate_to_sqlite.py)
+DATABASE_BACKEND = os.getenv('DATABASE_BACKEND', 'json')
+DATABASE_FILE = os.getenv('DATABASE_FILE', 'appointments.json')
+SQLITE_DATABASE_FILE = os.getenv('SQLITE_DATABASE_FILE', 'appointments.db')
+
+# Формат файла данных для json и journal: json или binary (двоичный снимок по
+# столбцам: файл втрое меньше и быстрее пишется, загружается почти как json).
+# При чтении формат определяется по файлу, поэтому после смены настройки файл
+# перепишется при следующем сохранении
+SNAPSHOT_FORMAT = os.getenv('SNAPSHOT_FORMAT', 'json')
+
+# Сжатие журнала в снимок после указанного числа изменений
+JOURNAL_COMPACT_EVERY = int(os.getenv('JOURNAL_COMPACT_EVERY', '1000'))
+# Сбрасывать журнал на диск (fsync) после каждого изменения
+JOURNAL_FSYNC = os.getenv('JOURNAL_FSYNC', '1') == '1'
+
+# Фоновая запись изменений на диск и окно объединения изменений (секунды)
+ASYNC_WRITES = os.getenv('ASYNC_WRITES', '1') == '1'
+WRITE_COALESCE_DELAY = float(os.getenv('WRITE_COALESCE_DELAY', '0.05'))
+
+# Сколько секунд выбранное время удерживается за пользователем до подтверждения
+SLOT_HOLD_TTL = int(os.getenv('SLOT_HOLD_TTL', '300'))
+
+# Хранилище состояний диалогов: sqlite (переживает перезапуск) или memory
+FSM_STORAGE = os.getenv('FSM_STORAGE', 'sqlite')
+FSM_DATABASE_FILE = os.getenv('FSM_DATABASE_FILE', 'fsm.db')
+# Через сколько секунд брошенный диалог забывается
+FSM_STATE_TTL = int(os.getenv('FSM_STATE_TTL', '86400'))
+# Сколько диалогов держать в памяти
+FSM_CACHE_SIZE = int(os.getenv('FSM_CACHE_SIZE', '1000'))
+
+# Сколько записей показывать на одной странице списка
+APPOINTMENTS_PAGE_SIZE = int(os.getenv('APPOINTMENTS_PAGE_SIZE', '10'))
+
+# Сколько пользователей показывать на одной странице списка
+USERS_PAGE_SIZE = int(os.getenv('USERS_PAGE_SIZE', '20'))
+
+# Лимиты исходящих сообщений (рассылки, напоминания, уведомления): сообщений
+# в секунду всего, в один личный чат и в одну группу (Telegram: 30, 1 и 20 в минуту)
+SEND_GLOBAL_RATE = float(os.getenv('SEND_GLOBAL_RATE', '30'))
+SEND_CHAT_RATE = float(os.getenv('SEND_CHAT_RATE', '1'))
+SEND_GROUP_RATE = float(os.getenv('SEND_GROUP_RATE', str(20 / 60)))
+# Сколько запросов к Bot API выполнять одновременно и сколько раз повторять при ошибках
+SEND_CONCURRENCY = int(os.getenv('SEND_CONCURRENCY', '8'))
+SEND_MAX_RETRIES = int(os.getenv('SEND_MAX_RETRIES', '5'))
+
+# За сколько часов до приёма напоминать пациенту (0 - не напоминать)
+REMINDER_HOURS = float(os.getenv('REMINDER_HOURS', '24'))
+# Файл отправленных напоминаний: после перезапуска они не повторяются
+REMINDER_STATE_FILE = os.getenv('REMINDER_STATE_FILE', 'reminders.json')
+
+# Файл состояния рассылки (курсор и счётчики): после перезапуска рассылка продолжается
+BROADCAST_STATE_FILE = os.getenv('BROADCAST_STATE_FILE', 'broadcast.json')
+# Сколько сообщений рассылки может одновременно ждать отправки в очереди
+BROADCAST_CONCURRENCY = int(os.getenv('BROADCAST_CONCURRENCY', '50'))
+
+# Сбор метрик обработчиков и хранилища и их вывод на /metrics встроенного
+# HTTP-сервера (WEBAPP_HOST:WEBAPP_PORT) в формате Prometheus
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '0') == '1'
+
+# Отладка задержек: обновления дольше указанного числа миллисекунд пишутся в журнал
+# с разбивкой времени (обработчик, база, клавиатуры, Bot API); 0 - выключено
+PROFILE_SLOW_UPDATE_MS = float(os.getenv('PROFILE_SLOW_UPDATE_MS', '0'))
+# Доля обновлений, выполняемых под cProfile (профиль сохраняется, если обновление медленное)
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+# Каталог для профилей и сколько последних профилей в нём хранить
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', '50'))
+
+# Сколько файлов .ics (и их file_id в Telegram) держать в кэше
+CALENDAR_CACHE_SIZE = int(os.getenv('CALENDAR_CACHE_SIZE', '1024'))
+# Сколько блоков событий держать в кэше для сборки календарей пациентов и врачей
+CALENDAR_EVENTS_CACHE_SIZE = int(os.getenv('CALENDAR_EVENTS_CACHE_SIZE', '10000'))
+# Секрет для подписи ссылок на календари; если задан, календари доступны по HTTP
+# на встроенном сервере (WEBAPP_HOST:WEBAPP_PORT, в режиме polling тоже)
+CALENDAR_FEED_SECRET = os.getenv('CALENDAR_FEED_SECRET', '')
+# Публичный адрес встроенного сервера для ссылок на календари
+CALENDAR_FEED_BASE_URL = os.getenv('CALENDAR_FEED_BASE_URL', WEBHOOK_BASE_URL)
+
+# Архив записей: прошедшие и отменённые записи раз в ARCHIVE_INTERVAL секунд
+# переносятся из базы в сжатые файлы по месяцам в ARCHIVE_DIR (0 - не переносить)
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', 'archive')
+ARCHIVE_INTERVAL = int(os.getenv('ARCHIVE_INTERVAL', '3600'))
+
 # Список врачей
 DOCTORS = [
     "Терапевт Иванова А.С.",
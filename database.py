@@ -1,19 +1,99 @@
+import asyncio
+import bisect
+import gc
+import itertools
 import json
+import logging
 import os
+import time
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import Iterator, List, Dict, Optional, Tuple
 
+import snapshot
+from config import (DATABASE_BACKEND, DATABASE_FILE, SQLITE_DATABASE_FILE, SNAPSHOT_FORMAT,
+                    JOURNAL_COMPACT_EVERY, JOURNAL_FSYNC, SLOT_HOLD_TTL, WORKERS)
+from listeners import ListenersMixin
+from metrics import DB_BYTES_WRITTEN, DB_SCAN_LENGTH, DB_WRITE_DURATION, observe_scan
+from pagination import AppointmentsPage, UsersPage, order_key
+from persistence import AsyncWriter
+from reservations import ReservationMixin, SlotReservations, SlotUnavailableError
+from slots import TIME_BITS
 
-class Database:
-    def __init__(self, filename='appointments.json'):
+logger = logging.getLogger(__name__)
+
+
+# Атрибуты, которые появляются при загрузке данных (см. Database.__getattr__)
+LOADED_ATTRIBUTES = frozenset((
+    'data', '_by_id', '_by_user', '_by_doctor', '_active', '_inactive', '_occupied',
+    '_day_masks', '_ordered', '_ordered_by_user', '_user_ids'
+))
+
+
+class Database(ReservationMixin, ListenersMixin):
+    """База данных в файле JSON или двоичном снимке (см. snapshot.py).
+
+    Формат файла при загрузке определяется по содержимому, при записи -
+    по snapshot_format, поэтому смена формата не требует переноса данных.
+    При lazy=True файл читается не в конструкторе, а в open() при запуске
+    бота или при первом обращении к данным.
+    """
+
+    # Сбрасывать снимок на диск (fsync) перед подменой файла
+    fsync = False
+
+    def __init__(self, filename='appointments.json', snapshot_format: str = 'json',
+                 lazy: bool = False):
+        if snapshot_format not in ('json', 'binary'):
+            raise ValueError(f"Неизвестный формат снимка: {snapshot_format}")
         self.filename = filename
-        self.load_data()
+        self.snapshot_format = snapshot_format
+        # Удержания слотов на время оформления записи
+        self.reservations = SlotReservations(SLOT_HOLD_TTL)
+        # Фоновая запись изменений (см. start_writer)
+        self._writer: Optional[AsyncWriter] = None
+        # Подписчики на изменения записей (см. add_listener)
+        self._listeners = []
+        if not lazy:
+            self._load()
+
+    def __getattr__(self, name: str):
+        # Вызывается только для отсутствующих атрибутов: данные ещё не загружены
+        if name in LOADED_ATTRIBUTES and not self.loaded:
+            self._load()
+            return getattr(self, name)
+        raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
+
+    @property
+    def loaded(self) -> bool:
+        return '_user_ids' in self.__dict__
+
+    async def open(self):
+        """Загрузка данных при запуске бота (в потоке, цикл событий не блокируется)"""
+        if not self.loaded:
+            started = time.perf_counter()
+            await asyncio.to_thread(self._load)
+            logger.info("Данные загружены за %.2f с: записей %d, пользователей %d",
+                        time.perf_counter() - started, len(self._by_id), len(self._user_ids))
+
+    def _load(self):
+        # Загрузка создаёт по объекту на каждое поле записи, но не создаёт
+        # циклов ссылок: сборщик мусора на это время только замедляет её
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            self.load_data()
+        finally:
+            if enabled:
+                gc.enable()
 
     def load_data(self):
         """Загрузка данных из файла"""
         if os.path.exists(self.filename):
-            with open(self.filename, 'r', encoding='utf-8') as f:
-                self.data = json.load(f)
+            if snapshot.is_snapshot(self.filename):
+                self.data = snapshot.load(self.filename)
+            else:
+                with open(self.filename, 'r', encoding='utf-8') as f:
+                    self.data = json.load(f)
         else:
             self.data = {
                 'appointments': [],
@@ -21,84 +101,604 @@ class Database:
                 'next_id': 1
             }
             self.save_data()
+        self._build_indexes()
+
+    def _build_indexes(self):
+        """Построение индексов по загруженным данным"""
+        # id -> запись (все записи, включая удалённые)
+        self._by_id: Dict[int, Dict] = {}
+        # user_id -> {id: запись} (только активные записи)
+        self._by_user: Dict[int, Dict[int, Dict]] = {}
+        # врач -> {id: запись} (только активные записи)
+        self._by_doctor: Dict[str, Dict[int, Dict]] = {}
+        # id -> запись (только активные записи, в порядке создания)
+        self._active: Dict[int, Dict] = {}
+        # id -> запись (отменённые и удалённые записи - кандидаты в архив)
+        self._inactive: Dict[int, Dict] = {}
+        # Занятые слоты (врач, дата, время) -> число активных записей на слот
+        self._occupied: Dict[Tuple[str, str, str], int] = {}
+        # (врач, дата) -> битовая маска занятого времени из AVAILABLE_TIMES
+        self._day_masks: Dict[Tuple[str, str], int] = {}
+        # Отсортированные ключи (дата, время, id) активных записей для постраничного вывода
+        self._ordered: List[Tuple[str, str, int]] = []
+        self._ordered_by_user: Dict[int, List[Tuple[str, str, int]]] = {}
+        # user_id в порядке регистрации (позиция в списке - курсор пользователя)
+        self._user_ids: List[str] = list(self.data['users'])
+
+        # Ключи добавляются в конец и сортируются один раз: вставка с
+        # сохранением порядка на каждую запись делает загрузку квадратичной
+        for appointment in self.data['appointments']:
+            self._by_id[appointment['id']] = appointment
+            self._index_appointment(appointment, add_key=list.append)
+        self._ordered.sort()
+        for keys in self._ordered_by_user.values():
+            keys.sort()
+
+    def _index_appointment(self, appointment: Dict, add_key=bisect.insort):
+        """Добавление записи в индексы"""
+        if appointment['status'] != 'active':
+            self._inactive[appointment['id']] = appointment
+            return
+        self._active[appointment['id']] = appointment
+        self._by_user.setdefault(appointment['user_id'], {})[appointment['id']] = appointment
+        self._by_doctor.setdefault(appointment['doctor'], {})[appointment['id']] = appointment
+        key = order_key(appointment)
+        add_key(self._ordered, key)
+        add_key(self._ordered_by_user.setdefault(appointment['user_id'], []), key)
+        slot = (appointment['doctor'], appointment['date'], appointment['time'])
+        self._occupied[slot] = self._occupied.get(slot, 0) + 1
+        bit = TIME_BITS.get(appointment['time'])
+        if bit:
+            day = (appointment['doctor'], appointment['date'])
+            self._day_masks[day] = self._day_masks.get(day, 0) | bit
+
+    def _unindex_appointment(self, appointment: Dict):
+        """Удаление записи из индексов"""
+        if self._active.pop(appointment['id'], None) is None:
+            self._inactive.pop(appointment['id'], None)
+            return
+        user_appointments = self._by_user.get(appointment['user_id'])
+        if user_appointments is not None:
+            user_appointments.pop(appointment['id'], None)
+            if not user_appointments:
+                del self._by_user[appointment['user_id']]
+        doctor_appointments = self._by_doctor.get(appointment['doctor'])
+        if doctor_appointments is not None:
+            doctor_appointments.pop(appointment['id'], None)
+            if not doctor_appointments:
+                del self._by_doctor[appointment['doctor']]
+        key = order_key(appointment)
+        self._remove_ordered(self._ordered, key)
+        user_ordered = self._ordered_by_user.get(appointment['user_id'])
+        if user_ordered is not None:
+            self._remove_ordered(user_ordered, key)
+            if not user_ordered:
+                del self._ordered_by_user[appointment['user_id']]
+        slot = (appointment['doctor'], appointment['date'], appointment['time'])
+        count = self._occupied.get(slot, 0) - 1
+        if count > 0:
+            self._occupied[slot] = count
+            return
+        self._occupied.pop(slot, None)
+        bit = TIME_BITS.get(appointment['time'])
+        if bit:
+            day = (appointment['doctor'], appointment['date'])
+            mask = self._day_masks.get(day, 0) & ~bit
+            if mask:
+                self._day_masks[day] = mask
+            else:
+                self._day_masks.pop(day, None)
+
+    @staticmethod
+    def _remove_ordered(keys: List[Tuple[str, str, int]], key: Tuple[str, str, int]):
+        i = bisect.bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            del keys[i]
 
     def save_data(self):
         """Сохранение данных в файл"""
-        with open(self.filename, 'w', encoding='utf-8') as f:
-            json.dump(self.data, f, ensure_ascii=False, indent=2)
+        # Пишем во временный файл и атомарно подменяем им основной,
+        # чтобы сбой во время записи не оставил обрезанный файл
+        started = time.perf_counter()
+        tmp_filename = f"{self.filename}.tmp"
+        if self.snapshot_format == 'binary':
+            payload = snapshot.encode(self.data)
+            self._write_snapshot(payload)
+            DB_BYTES_WRITTEN.inc('save_data', amount=len(payload))
+        else:
+            with open(tmp_filename, 'w', encoding='utf-8') as f:
+                json.dump(self.data, f, ensure_ascii=False, indent=2)
+                self._sync_file(f)
+            DB_BYTES_WRITTEN.inc('save_data', amount=os.path.getsize(tmp_filename))
+            self._replace_file(tmp_filename)
+        DB_WRITE_DURATION.observe(time.perf_counter() - started, 'save_data')
+
+    async def save_data_async(self):
+        """Сохранение данных в файл без блокировки цикла событий"""
+        # В цикле событий только копируются записи (они меняются на месте),
+        # сериализация и запись копии идут в потоке
+        started = time.perf_counter()
+        data = {
+            'appointments': [dict(appointment) for appointment in self.data['appointments']],
+            'users': {user_id: dict(user) for user_id, user in self.data['users'].items()},
+            'next_id': self.data['next_id']
+        }
+        DB_WRITE_DURATION.observe(time.perf_counter() - started, 'copy')
+        size = await asyncio.to_thread(self._save_copy, data)
+        DB_BYTES_WRITTEN.inc('save_data', amount=size)
+        DB_WRITE_DURATION.observe(time.perf_counter() - started, 'save_data_async')
+
+    def _save_copy(self, data: Dict) -> int:
+        """Сериализация и запись копии данных (в потоке); возвращает размер"""
+        if self.snapshot_format == 'binary':
+            payload = snapshot.encode(data)
+        else:
+            payload = self._encode_json(data)
+        self._write_snapshot(payload)
+        return len(payload)
+
+    @staticmethod
+    def _encode_json(data: Dict) -> bytes:
+        # По записи за вызов: один json.dumps на все данные не отпускает
+        # GIL, и цикл событий стоял бы всё время сериализации
+        dumps = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+        appointments = ','.join(dumps(appointment) for appointment in data['appointments'])
+        users = ','.join(f"{dumps(user_id)}:{dumps(user)}" for user_id, user in data['users'].items())
+        return (f'{{"appointments":[{appointments}],"users":{{{users}}},'
+                f'"next_id":{data["next_id"]}}}').encode('utf-8')
+
+    def _write_snapshot(self, payload: bytes):
+        """Запись снимка во временный файл и подмена им основного"""
+        tmp_filename = f"{self.filename}.tmp"
+        with open(tmp_filename, 'wb') as f:
+            f.write(payload)
+            self._sync_file(f)
+        self._replace_file(tmp_filename)
+
+    def _sync_file(self, f):
+        # Данные снимка должны оказаться на диске раньше переименования:
+        # иначе при отключении питания можно получить пустой снимок и уже
+        # очищенный журнал
+        if self.fsync:
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _replace_file(self, tmp_filename: str):
+        os.replace(tmp_filename, self.filename)
+        if self.fsync:
+            # Переименование сохраняется на диске вместе с каталогом
+            fd = os.open(os.path.dirname(os.path.abspath(self.filename)), os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def start_writer(self, delay: float = 0.05):
+        """Переход на фоновую запись изменений (нужен запущенный цикл событий)"""
+        if self._writer is None:
+            self._writer = AsyncWriter(self, delay=delay)
+            self._writer.start()
+
+    async def stop_writer(self):
+        """Запись накопленных изменений и возврат к синхронной записи"""
+        if self._writer is not None:
+            await self._writer.stop()
+            self._writer = None
+
+    async def durable(self):
+        """Ожидание записи на диск всех сделанных до вызова изменений"""
+        if self._writer is not None:
+            await self._writer.durable()
+
+    def _persist(self, record: Dict):
+        """Сохранение изменения, описанного записью журнала"""
+        if self._writer is not None:
+            self._writer.submit(record)
+        else:
+            self._write_records([record])
+
+    def _write_records(self, records: List[Dict]):
+        """Синхронная запись пачки изменений"""
+        self.save_data()
+
+    async def _write_records_async(self, records: List[Dict]):
+        """Запись пачки изменений из фоновой задачи"""
+        await self.save_data_async()
+
+    def _apply(self, record: Dict):
+        """Применение изменения к данным в памяти и индексам"""
+        op = record['op']
+        if op == 'add_user':
+            if record['user_id'] not in self.data['users']:
+                self.data['users'][record['user_id']] = record['user']
+                self._user_ids.append(record['user_id'])
+        elif op == 'update_user':
+            self.data['users'][record['user_id']].update(record['fields'])
+        elif op == 'create':
+            appointment = record['appointment']
+            # Повторное применение (при восстановлении из журнала) игнорируем
+            if appointment['id'] in self._by_id:
+                return
+            self.data['appointments'].append(appointment)
+            self._by_id[appointment['id']] = appointment
+            self._index_appointment(appointment)
+            self.data['next_id'] = max(self.data['next_id'], appointment['id'] + 1)
+        elif op == 'update':
+            appointment = self._by_id[record['id']]
+            # Поля, входящие в индексы, могут измениться - переиндексируем запись
+            self._unindex_appointment(appointment)
+            appointment.update(record['fields'])
+            self._index_appointment(appointment)
+        elif op == 'archive':
+            ids = set(record['ids'])
+            for appointment_id in ids:
+                appointment = self._by_id.pop(appointment_id, None)
+                if appointment is not None:
+                    self._unindex_appointment(appointment)
+            # Новый список: уже начатые обходы iter_appointments дойдут по старому
+            self.data['appointments'] = [appointment for appointment in self.data['appointments']
+                                         if appointment['id'] not in ids]
+        else:
+            raise ValueError(f"Неизвестная операция журнала: {op}")
 
     def add_user(self, user_id: int, username: str, first_name: str):
         """Добавление нового пользователя"""
         if str(user_id) not in self.data['users']:
-            self.data['users'][str(user_id)] = {
-                'username': username,
-                'first_name': first_name,
-                'registered_at': datetime.now().isoformat()
+            record = {
+                'op': 'add_user',
+                'user_id': str(user_id),
+                'user': {
+                    'username': username,
+                    'first_name': first_name,
+                    'registered_at': datetime.now().isoformat()
+                }
             }
-            self.save_data()
+            self._apply(record)
+            self._persist(record)
+        elif self.data['users'][str(user_id)].get('blocked'):
+            # Пользователь вернулся - снова получает рассылки
+            self.set_user_blocked(user_id, False)
+
+    def set_user_blocked(self, user_id: int, blocked: bool = True) -> bool:
+        """Пометка пользователя, заблокировавшего бота (рассылки его пропускают)"""
+        user = self.data['users'].get(str(user_id))
+        if user is None or bool(user.get('blocked')) == blocked:
+            return False
+        record = {'op': 'update_user', 'user_id': str(user_id), 'fields': {'blocked': blocked}}
+        self._apply(record)
+        self._persist(record)
+        return True
 
     def create_appointment(self, user_id: int, patient_name: str,
                            doctor: str, procedure: str,
                            date: str, time: str) -> int:
         """Создание новой записи"""
+        if not self.is_appointment_available(doctor, date, time):
+            raise SlotUnavailableError(f"{doctor} {date} {time}")
         appointment_id = self.data['next_id']
-        appointment = {
-            'id': appointment_id,
-            'user_id': user_id,
-            'patient_name': patient_name,
-            'doctor': doctor,
-            'procedure': procedure,
-            'date': date,
-            'time': time,
-            'created_at': datetime.now().isoformat(),
-            'status': 'active'
+        record = {
+            'op': 'create',
+            'appointment': {
+                'id': appointment_id,
+                'user_id': user_id,
+                'patient_name': patient_name,
+                'doctor': doctor,
+                'procedure': procedure,
+                'date': date,
+                'time': time,
+                'created_at': datetime.now().isoformat(),
+                'status': 'active'
+            }
         }
-        self.data['appointments'].append(appointment)
-        self.data['next_id'] += 1
-        self.save_data()
+        self._apply(record)
+        self._persist(record)
+        self._notify(record['appointment'])
         return appointment_id
 
     def get_appointments(self, user_id: Optional[int] = None) -> List[Dict]:
         """Получение записей (всех или для конкретного пользователя)"""
         if user_id:
-            return [a for a in self.data['appointments']
-                    if a['user_id'] == user_id and a['status'] == 'active']
-        return [a for a in self.data['appointments'] if a['status'] == 'active']
+            appointments = list(self._by_user.get(user_id, {}).values())
+        else:
+            appointments = list(self._active.values())
+        DB_SCAN_LENGTH.observe(len(appointments), 'get_appointments')
+        return appointments
 
     def get_appointment(self, appointment_id: int) -> Optional[Dict]:
         """Получение конкретной записи"""
-        for appointment in self.data['appointments']:
-            if appointment['id'] == appointment_id:
-                return appointment
-        return None
+        return self._by_id.get(appointment_id)
+
+    def get_appointments_page(self, user_id: Optional[int] = None,
+                              after: Optional[int] = None, before: Optional[int] = None,
+                              from_date: Optional[str] = None,
+                              limit: int = 10) -> AppointmentsPage:
+        """Страница активных записей (всех или пользователя) по курсору.
+
+        after/before - номер записи, после/до которой начинается страница,
+        from_date - дата 'ГГГГММДД', с которой начинается страница (если
+        после неё записей нет, возвращается последняя страница).
+        """
+        keys = self._ordered_by_user.get(user_id, []) if user_id else self._ordered
+        cursor = after if after is not None else before
+        cursor_appointment = self._by_id.get(cursor) if cursor is not None else None
+
+        if cursor_appointment is not None and after is not None:
+            start = bisect.bisect_right(keys, order_key(cursor_appointment))
+            end = start + limit
+        elif cursor_appointment is not None:
+            end = bisect.bisect_left(keys, order_key(cursor_appointment))
+            start = max(0, end - limit)
+        elif from_date:
+            start = bisect.bisect_left(keys, (from_date,))
+            if start >= len(keys):
+                start = max(0, len(keys) - limit)
+            end = start + limit
+        else:
+            start, end = 0, limit
+
+        page = keys[start:end]
+        return AppointmentsPage(
+            items=[self._by_id[key[2]] for key in page],
+            prev_cursor=page[0][2] if page and start > 0 else None,
+            next_cursor=page[-1][2] if page and start + len(page) < len(keys) else None
+        )
 
     def update_appointment(self, appointment_id: int, **kwargs) -> bool:
-        """Обновление записи"""
-        for appointment in self.data['appointments']:
-            if appointment['id'] == appointment_id:
-                appointment.update(kwargs)
-                self.save_data()
-                return True
-        return False
+        """Обновление записи (SlotUnavailableError, если новый слот занят)"""
+        appointment = self._by_id.get(appointment_id)
+        if appointment is None:
+            return False
+        updated = dict(appointment, **kwargs)
+        if updated['status'] == 'active':
+            slot = (updated['doctor'], updated['date'], updated['time'])
+            # Слот самой записи, если она уже активна и остаётся в нём, не в счёт
+            own = appointment['status'] == 'active' and slot == (
+                appointment['doctor'], appointment['date'], appointment['time'])
+            if self._occupied.get(slot, 0) > own:
+                raise SlotUnavailableError(f"{updated['doctor']} {updated['date']} {updated['time']}")
+        record = {'op': 'update', 'id': appointment_id, 'fields': kwargs}
+        self._apply(record)
+        self._persist(record)
+        self._notify(self._by_id[appointment_id])
+        return True
 
     def delete_appointment(self, appointment_id: int) -> bool:
         """Удаление записи"""
         return self.update_appointment(appointment_id, status='deleted')
 
+    def archivable_appointments(self, before_date: str, limit: int = 1000) -> List[Dict]:
+        """Записи для переноса в архив: отменённые и с датой раньше 'ГГГГММДД'"""
+        # Прошедшие активные записи - начало _ordered, неактивные - свой индекс,
+        # поэтому пачка стоит O(limit), а не обхода всех записей
+        past = bisect.bisect_left(self._ordered, (before_date,))
+        appointments = [self._by_id[key[2]] for key in self._ordered[:min(past, limit)]]
+        appointments.extend(itertools.islice(self._inactive.values(), limit - len(appointments)))
+        return appointments
+
+    def remove_archived(self, appointment_ids: List[int]) -> int:
+        """Удаление перенесённых в архив записей; возвращает число удалённых"""
+        ids = [appointment_id for appointment_id in appointment_ids if appointment_id in self._by_id]
+        if ids:
+            record = {'op': 'archive', 'ids': ids}
+            self._apply(record)
+            self._persist(record)
+        return len(ids)
+
     def get_users(self) -> Dict:
         """Получение всех пользователей"""
         return self.data['users']
 
+    def get_users_page(self, after: Optional[int] = None, before: Optional[int] = None,
+                       limit: int = 20) -> UsersPage:
+        """Страница пользователей в порядке регистрации (курсор - позиция)"""
+        if after is not None:
+            start, end = after + 1, after + 1 + limit
+        elif before is not None:
+            start, end = max(0, before - limit), before
+        else:
+            start, end = 0, limit
+
+        user_ids = self._user_ids[start:end]
+        users = self.data['users']
+        return UsersPage(
+            items=[(user_id, users[user_id]) for user_id in user_ids],
+            prev_cursor=start if user_ids and start > 0 else None,
+            next_cursor=start + len(user_ids) - 1
+            if user_ids and start + len(user_ids) < len(self._user_ids) else None
+        )
+
+    @observe_scan('iter_users')
+    def iter_users(self, after: Optional[int] = None) -> Iterator[Tuple[int, str, Dict]]:
+        """Потоковый обход пользователей: (курсор, user_id, данные)"""
+        position = after + 1 if after is not None else 0
+        # Список только дополняется, поэтому обход по позиции безопасен
+        # даже при регистрации новых пользователей во время обхода
+        while position < len(self._user_ids):
+            user_id = self._user_ids[position]
+            yield position, user_id, self.data['users'][user_id]
+            position += 1
+
+    @observe_scan('iter_appointments')
+    def iter_appointments(self) -> Iterator[Dict]:
+        """Потоковый обход всех записей, включая отменённые"""
+        appointments = self.data['appointments']
+        position = 0
+        while position < len(appointments):
+            yield appointments[position]
+            position += 1
+
+    @observe_scan('iter_active_appointments')
+    def iter_active_appointments(self, user_id: Optional[int] = None,
+                                 doctor: Optional[str] = None) -> Iterator[Dict]:
+        """Потоковый обход активных записей пользователя или врача по индексу"""
+        if user_id is not None:
+            appointments = self._by_user.get(user_id, {})
+        else:
+            appointments = self._by_doctor.get(doctor, {})
+        # Копия значений защищает обход от изменений индекса между шагами
+        yield from list(appointments.values())
+
+    @observe_scan('iter_upcoming_appointments')
+    def iter_upcoming_appointments(self, from_date: str) -> Iterator[Dict]:
+        """Потоковый обход активных записей с даты 'ГГГГММДД' в порядке времени приёма"""
+        position = bisect.bisect_left(self._ordered, (from_date,))
+        for key in self._ordered[position:]:
+            yield self._by_id[key[2]]
+
     def is_appointment_available(self, doctor: str, date: str, time: str) -> bool:
         """Проверка доступности времени"""
-        for appointment in self.data['appointments']:
-            if (appointment['status'] == 'active' and
-                    appointment['doctor'] == doctor and
-                    appointment['date'] == date and
-                    appointment['time'] == time):
-                return False
+        return (doctor, date, time) not in self._occupied
+
+    def occupied_mask(self, doctor: str, date: str) -> int:
+        """Маска занятого времени врача на дату (см. slots.TIME_BITS)"""
+        return self._day_masks.get((doctor, date), 0)
+
+
+class JournaledDatabase(Database):
+    """База данных с журналом изменений.
+
+    Каждое изменение дописывается одной компактной строкой в журнал
+    (``<filename>.log``), а полный снимок ``filename`` перезаписывается
+    только при периодическом сжатии журнала. При запуске данные
+    восстанавливаются из снимка и повторного применения журнала.
+    """
+
+    def __init__(self, filename='appointments.json', compact_every: int = 1000,
+                 fsync: bool = True, snapshot_format: str = 'json', lazy: bool = False):
+        self.journal_filename = f"{filename}.log"
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self._journal = None
+        self._journal_records = 0
+        super().__init__(filename, snapshot_format=snapshot_format, lazy=lazy)
+
+    def load_data(self):
+        """Загрузка снимка и восстановление изменений из журнала"""
+        super().load_data()
+        self._replay_journal()
+        self._journal = open(self.journal_filename, 'ab')
+
+    def _replay_journal(self):
+        """Повторное применение записей журнала к снимку"""
+        if not os.path.exists(self.journal_filename):
+            return
+        snapshot_next_id = self.data['next_id']
+        valid_size = 0
+        with open(self.journal_filename, 'rb') as f:
+            for line in f:
+                # Недописанная последняя строка - след сбоя во время записи
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if self._replayable(record, snapshot_next_id):
+                    self._apply(record)
+                self._journal_records += 1
+                valid_size += len(line)
+        if valid_size != os.path.getsize(self.journal_filename):
+            with open(self.journal_filename, 'r+b') as f:
+                f.truncate(valid_size)
+
+    def _replayable(self, record: Dict, snapshot_next_id: int) -> bool:
+        """Нужно ли применять запись журнала к загруженному снимку.
+
+        Журнал, оставшийся от сбоя между записью снимка и очисткой журнала,
+        уже учтён в снимке, но может ссылаться на записи, которые с тех пор
+        перенесены в архив. Номера записей только растут, поэтому запись с
+        номером меньше next_id снимка, которой нет в базе, - архивная: её
+        не создаём заново и не обновляем.
+        """
+        op = record['op']
+        if op == 'create':
+            return record['appointment']['id'] >= snapshot_next_id
+        if op == 'update':
+            return record['id'] in self._by_id
         return True
 
+    @staticmethod
+    def _encode_records(records: List[Dict]) -> bytes:
+        return b''.join(
+            json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
+            for record in records
+        )
+
+    def _append_journal(self, payload: bytes):
+        """Дописывание строк в журнал (один fsync на пачку)"""
+        self._journal.write(payload)
+        self._journal.flush()
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+
+    def _truncate_journal(self):
+        # Если сбой произойдёт до очистки журнала, его записи применятся
+        # к новому снимку повторно; записи, перенесённые с тех пор в архив,
+        # при этом пропускаются (см. _replayable)
+        self._journal.truncate(0)
+        self._journal.flush()
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+        self._journal_records = 0
+
+    def _write_records(self, records: List[Dict]):
+        """Дописывание изменений в журнал"""
+        started = time.perf_counter()
+        payload = self._encode_records(records)
+        self._append_journal(payload)
+        DB_WRITE_DURATION.observe(time.perf_counter() - started, 'journal_append')
+        DB_BYTES_WRITTEN.inc('journal_append', amount=len(payload))
+        self._journal_records += len(records)
+        if self._journal_records >= self.compact_every:
+            self.compact()
+
+    async def _write_records_async(self, records: List[Dict]):
+        """Дописывание изменений в журнал из фоновой задачи"""
+        started = time.perf_counter()
+        payload = self._encode_records(records)
+        await asyncio.to_thread(self._append_journal, payload)
+        DB_WRITE_DURATION.observe(time.perf_counter() - started, 'journal_append')
+        DB_BYTES_WRITTEN.inc('journal_append', amount=len(payload))
+        self._journal_records += len(records)
+        if self._journal_records >= self.compact_every:
+            await self.compact_async()
+
+    def compact(self):
+        """Сохранение полного снимка и очистка журнала"""
+        self.save_data()
+        self._truncate_journal()
+
+    async def compact_async(self):
+        """Сжатие журнала без блокировки цикла событий"""
+        await self.save_data_async()
+        await asyncio.to_thread(self._truncate_journal)
+
+    def close(self):
+        """Закрытие журнала"""
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+
+def create_database():
+    """Создание базы данных с учётом настроек хранилища"""
+    if WORKERS > 1 and DATABASE_BACKEND != 'sqlite':
+        # Файл JSON и журнал принадлежат одному процессу
+        raise ValueError("Для нескольких процессов (WORKERS > 1) нужен DATABASE_BACKEND=sqlite")
+    # Файл читается при запуске бота (db.open), а не при импорте модуля
+    if DATABASE_BACKEND == 'json':
+        return Database(DATABASE_FILE, snapshot_format=SNAPSHOT_FORMAT, lazy=True)
+    if DATABASE_BACKEND == 'journal':
+        return JournaledDatabase(DATABASE_FILE,
+                                 compact_every=JOURNAL_COMPACT_EVERY,
+                                 fsync=JOURNAL_FSYNC,
+                                 snapshot_format=SNAPSHOT_FORMAT,
+                                 lazy=True)
+    if DATABASE_BACKEND == 'sqlite':
+        from sqlite_database import SQLiteDatabase
+        return SQLiteDatabase(SQLITE_DATABASE_FILE, shared_reservations=WORKERS > 1)
+    raise ValueError(f"Неизвестный тип хранилища: {DATABASE_BACKEND}")
+
 
 # Создаем глобальный экземпляр базы данных
-db = Database()
\ No newline at end of file
+db = create_database()
\ No newline at end of file
@@ -0,0 +1,75 @@
+import asyncio
+import csv
+import io
+import itertools
+from typing import AsyncGenerator, Callable, Dict, Iterable, Iterator, Optional, Sequence
+
+from aiogram.types import InputFile
+
+USER_COLUMNS = ('user_id', 'username', 'first_name', 'registered_at')
+APPOINTMENT_COLUMNS = (
+    'id', 'user_id', 'patient_name', 'doctor', 'procedure',
+    'date', 'time', 'created_at', 'status'
+)
+
+
+def csv_chunks(header: Sequence[str], rows: Iterable[Sequence],
+               rows_per_chunk: int = 1000) -> Iterator[bytes]:
+    """Построчная генерация CSV фрагментами по rows_per_chunk строк"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM, чтобы Excel корректно открыл кириллицу
+    buffer.write('\ufeff')
+    writer.writerow(header)
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if count % rows_per_chunk == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate(0)
+    yield buffer.getvalue().encode('utf-8')
+
+
+def users_csv(database) -> Iterator[bytes]:
+    """CSV со всеми пользователями"""
+    return csv_chunks(USER_COLUMNS, (
+        (user_id, user['username'] or '', user['first_name'], user['registered_at'])
+        for _, user_id, user in database.iter_users()
+    ))
+
+
+def _appointment_rows(appointments: Iterable[Dict]) -> Iterator[tuple]:
+    return (tuple(appointment.get(column, '') for column in APPOINTMENT_COLUMNS)
+            for appointment in appointments)
+
+
+def appointments_csv(database, archive=None) -> Iterator[bytes]:
+    """CSV со всеми записями, включая отменённые (и архивные, если передан архив)"""
+    appointments = database.iter_appointments()
+    if archive is not None:
+        appointments = itertools.chain(archive.iter_range(), appointments)
+    return csv_chunks(APPOINTMENT_COLUMNS, _appointment_rows(appointments))
+
+
+def archive_csv(archive, from_date: Optional[str] = None,
+                to_date: Optional[str] = None) -> Iterator[bytes]:
+    """CSV с архивными записями за период 'ГГГГММДД'"""
+    return csv_chunks(APPOINTMENT_COLUMNS, _appointment_rows(archive.iter_range(from_date, to_date)))
+
+
+class StreamingInputFile(InputFile):
+    """Файл, содержимое которого генерируется по частям во время загрузки.
+
+    Документ не собирается целиком ни в памяти, ни на диске: каждый
+    фрагмент уходит в Telegram сразу после генерации.
+    """
+
+    def __init__(self, chunks_factory: Callable[[], Iterable[bytes]], filename: str):
+        super().__init__(filename=filename)
+        self.chunks_factory = chunks_factory
+
+    async def read(self, bot) -> AsyncGenerator[bytes, None]:
+        for chunk in self.chunks_factory():
+            yield chunk
+            # Отдаём управление циклу событий между фрагментами
+            await asyncio.sleep(0)
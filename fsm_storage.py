@@ -0,0 +1,134 @@
+import asyncio
+import copy
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fsm (
+    key TEXT PRIMARY KEY,
+    state TEXT,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_fsm_updated_at ON fsm (updated_at);
+"""
+
+
+class SQLiteStorage(BaseStorage):
+    """Хранилище состояний FSM в SQLite.
+
+    Состояния переживают перезапуск бота, а незавершённые диалоги, к
+    которым не возвращались дольше ``ttl`` секунд, удаляются. Перед базой
+    стоит ограниченный LRU-кэш, поэтому расход памяти не растёт с числом
+    пользователей. Все запросы к SQLite выполняются по очереди в отдельном
+    потоке и не блокируют цикл событий.
+    """
+
+    def __init__(self, filename: str = 'fsm.db', ttl: float = 86400,
+                 cache_size: int = 1000, sweep_interval: float = 600,
+                 key_builder: Optional[KeyBuilder] = None):
+        self.filename = filename
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self.sweep_interval = sweep_interval
+        self.key_builder = key_builder or DefaultKeyBuilder(with_destiny=True)
+        # key -> (state, data, updated_at)
+        self._cache: 'OrderedDict[str, Tuple[Optional[str], Dict[str, Any], float]]' = OrderedDict()
+        self._last_sweep = time.time()
+        # Один поток: запросы выполняются строго в порядке вызова
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='fsm-storage')
+        self._conn = sqlite3.connect(filename, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _load(self, key: str) -> Optional[Tuple[Optional[str], Dict[str, Any], float]]:
+        row = self._conn.execute(
+            "SELECT state, data, updated_at FROM fsm WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1]), row[2]
+
+    def _save(self, key: str, state: Optional[str], data: Dict[str, Any], updated_at: float):
+        with self._conn:
+            if state is None and not data:
+                self._conn.execute("DELETE FROM fsm WHERE key = ?", (key,))
+            else:
+                self._conn.execute(
+                    "INSERT INTO fsm (key, state, data, updated_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET state = excluded.state, "
+                    "data = excluded.data, updated_at = excluded.updated_at",
+                    (key, state, json.dumps(data, ensure_ascii=False), updated_at)
+                )
+
+    def _delete_expired(self, deadline: float):
+        with self._conn:
+            self._conn.execute("DELETE FROM fsm WHERE updated_at < ?", (deadline,))
+
+    def _remember(self, key: str, entry: Tuple[Optional[str], Dict[str, Any], float]):
+        """Помещение записи в LRU-кэш с вытеснением самых старых"""
+        self._cache[key] = entry
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def _get(self, key: StorageKey) -> Tuple[Optional[str], Dict[str, Any]]:
+        storage_key = self.key_builder.build(key)
+        entry = self._cache.get(storage_key)
+        if entry is None:
+            entry = await self._run(self._load, storage_key)
+            if entry is None:
+                return None, {}
+            self._remember(storage_key, entry)
+        else:
+            self._cache.move_to_end(storage_key)
+        state, data, updated_at = entry
+        if time.time() - updated_at > self.ttl:
+            # Брошенный диалог: считаем его завершённым
+            self._cache.pop(storage_key, None)
+            return None, {}
+        return state, data
+
+    async def _set(self, key: StorageKey, state: Optional[str], data: Dict[str, Any]):
+        storage_key = self.key_builder.build(key)
+        now = time.time()
+        if state is None and not data:
+            self._cache.pop(storage_key, None)
+        else:
+            self._remember(storage_key, (state, data, now))
+        await self._run(self._save, storage_key, state, data, now)
+        if now - self._last_sweep > self.sweep_interval:
+            self._last_sweep = now
+            await self._run(self._delete_expired, now - self.ttl)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        _, data = await self._get(key)
+        await self._set(key, state.state if isinstance(state, State) else state, data)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _ = await self._get(key)
+        return state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        state, _ = await self._get(key)
+        await self._set(key, state, copy.deepcopy(dict(data)))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data = await self._get(key)
+        return copy.deepcopy(data)
+
+    async def close(self) -> None:
+        await self._run(self._conn.close)
+        self._executor.shutdown(wait=True)
@@ -1,14 +1,32 @@
 import logging
+from datetime import datetime
+from typing import Optional
+
 from aiogram import Dispatcher, types
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.filters import Command, StateFilter
 from aiogram.types import CallbackQuery, Message
 
-from config import ADMIN_IDS, DOCTORS
+from archive import AppointmentArchive
+from broadcast import Broadcaster
+from calendar_events import CalendarFeed, CalendarFeeds, CalendarFileCache
+from calendar_http import feed_url
+from callback_router import CallbackRouter
+from callbacks import (
+    AdminViewCallback, AppointmentsDatesCallback, AppointmentsPageCallback,
+    CalendarCallback, CancelAppointmentCallback, DateCallback, DeleteAppointmentCallback,
+    DoctorCalendarCallback, DoctorCallback, EditAppointmentCallback, ExportCallback,
+    ProcedureCallback, TimeCallback, UsersPageCallback, ViewAppointmentCallback
+)
+from config import (ADMIN_IDS, DOCTORS, APPOINTMENTS_PAGE_SIZE, USERS_PAGE_SIZE,
+                    CALENDAR_CACHE_SIZE, CALENDAR_EVENTS_CACHE_SIZE, ARCHIVE_DIR)
 from database import db
+from export import StreamingInputFile, appointments_csv, archive_csv, users_csv
 from keyboards import *
-from utils import format_appointment, generate_calendar_event
+from persistence import WriteError
+from slots import FULL_MASK
+from utils import format_appointment, format_user
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
@@ -30,6 +48,25 @@ class EditStates(StatesGroup):
     waiting_for_new_date = State()
     waiting_for_new_time = State()
 
+class BroadcastStates(StatesGroup):
+    waiting_for_text = State()
+    waiting_for_confirmation = State()
+
+def get_free_dates_keyboard(doctor: str):
+    """Клавиатура дат без полностью занятых дней врача"""
+    hidden_mask = 0
+    for i, date in enumerate(get_booking_dates()):
+        if db.occupied_mask(doctor, date) == FULL_MASK:
+            hidden_mask |= 1 << i
+    return get_dates_keyboard(hidden_mask)
+
+# Файлы .ics для кнопки «В календарь»
+calendar_files = CalendarFileCache(CALENDAR_CACHE_SIZE)
+# Календари со всеми записями пациента или врача
+calendar_feeds = CalendarFeeds(db, CALENDAR_CACHE_SIZE, CALENDAR_EVENTS_CACHE_SIZE)
+# Прошедшие и отменённые записи, перенесённые из базы (см. archive.Archiver)
+archive = AppointmentArchive(ARCHIVE_DIR)
+
 # Обработчики команд
 async def cmd_start(message: Message):
     """Обработчик команды /start - приветствие пользователя по имени"""
@@ -115,52 +152,55 @@ async def process_patient_name(message: Message, state: FSMContext):
     )
     await state.set_state(AppointmentStates.waiting_for_doctor)
 
-async def process_callback_select_doctor(callback: CallbackQuery, state: FSMContext):
+async def process_callback_select_doctor(callback: CallbackQuery, state: FSMContext,
+                                         callback_data: DoctorCallback):
     """Выбор врача"""
-    doctor = callback.data.split(':', 1)[1]
+    doctor = callback_data.doctor
     await state.update_data(doctor=doctor)
 
     await callback.message.edit_text(
         f"💉 Выберите процедуру для {doctor}:",
-        reply_markup=get_procedures_keyboard(doctor)
+        reply_markup=get_procedures_keyboard(callback_data.id)
     )
     await state.set_state(AppointmentStates.waiting_for_procedure)
     await callback.answer()
 
-async def process_callback_select_procedure(callback: CallbackQuery, state: FSMContext):
+async def process_callback_select_procedure(callback: CallbackQuery, state: FSMContext,
+                                            callback_data: ProcedureCallback):
     """Выбор процедуры"""
-    procedure = callback.data.split(':', 1)[1]
-    await state.update_data(procedure=procedure)
+    data = await state.update_data(procedure=callback_data.procedure)
 
     await callback.message.edit_text(
         "📅 Выберите дату:",
-        reply_markup=get_dates_keyboard()
+        reply_markup=get_free_dates_keyboard(data['doctor'])
     )
     await state.set_state(AppointmentStates.waiting_for_date)
     await callback.answer()
 
-async def process_callback_select_date(callback: CallbackQuery, state: FSMContext):
+async def process_callback_select_date(callback: CallbackQuery, state: FSMContext,
+                                       callback_data: DateCallback):
     """Выбор даты"""
-    date = callback.data.split(':', 1)[1]
-    await state.update_data(date=date)
+    date = callback_data.date
+    data = await state.update_data(date=date)
 
     await callback.message.edit_text(
         "⏰ Выберите время:",
-        reply_markup=get_times_keyboard()
+        reply_markup=get_times_keyboard(db.occupied_mask(data['doctor'], date))
     )
     await state.set_state(AppointmentStates.waiting_for_time)
     await callback.answer()
 
-async def process_callback_select_time(callback: CallbackQuery, state: FSMContext):
+async def process_callback_select_time(callback: CallbackQuery, state: FSMContext,
+                                       callback_data: TimeCallback):
     """Выбор времени"""
-    time = callback.data.split(':', 1)[1]
+    time = callback_data.time
     data = await state.get_data()
 
-    # Проверка доступности времени
-    if not db.is_appointment_available(data['doctor'], data['date'], time):
+    # Удерживаем время за пользователем до подтверждения записи
+    if not db.reserve_slot(callback.from_user.id, data['doctor'], data['date'], time):
         await callback.message.edit_text(
             "❌ Это время уже занято. Пожалуйста, выберите другое время:",
-            reply_markup=get_times_keyboard()
+            reply_markup=get_times_keyboard(db.occupied_mask(data['doctor'], data['date']))
         )
         await callback.answer()
         return
@@ -185,13 +225,28 @@ async def process_callback_select_time(callback: CallbackQuery, state: FSMContex
     await state.set_state(AppointmentStates.waiting_for_confirmation)
     await callback.answer()
 
+async def wait_durable(callback: CallbackQuery) -> bool:
+    """Ожидание записи изменений на диск; при ошибке хранилища - сообщение пользователю"""
+    try:
+        await db.durable()
+    except WriteError:
+        logger.error("Изменения пользователя %s не записаны на диск", callback.from_user.id)
+        await callback.message.edit_text(
+            "⚠️ Не удалось сохранить изменения: ошибка хранилища. "
+            "Бот продолжит попытки, но если изменение не появится, повторите его позже.",
+            reply_markup=get_main_keyboard(callback.from_user.id in ADMIN_IDS)
+        )
+        await callback.answer()
+        return False
+    return True
+
 async def process_callback_confirm(callback: CallbackQuery, state: FSMContext):
     """Подтверждение записи"""
     data = await state.get_data()
     user = callback.from_user
 
-    # Создаем запись в базе данных
-    appointment_id = db.create_appointment(
+    # Создаем запись в базе данных из удерживаемого слота
+    appointment_id = db.book_reserved_slot(
         user_id=user.id,
         patient_name=data['patient_name'],
         doctor=data['doctor'],
@@ -200,6 +255,19 @@ async def process_callback_confirm(callback: CallbackQuery, state: FSMContext):
         time=data['time']
     )
 
+    if appointment_id is None:
+        await callback.message.edit_text(
+            "❌ Время брони истекло или его уже заняли. Пожалуйста, выберите другое время:",
+            reply_markup=get_times_keyboard(db.occupied_mask(data['doctor'], data['date']))
+        )
+        await state.set_state(AppointmentStates.waiting_for_time)
+        await callback.answer()
+        return
+    # Сообщаем об успехе только после записи на диск
+    if not await wait_durable(callback):
+        await state.clear()
+        return
+
     success_text = (
         f"✅ Запись успешно создана!\n\n"
         f"Номер записи: #{appointment_id}\n"
@@ -227,6 +295,7 @@ async def process_callback_cancel(callback: CallbackQuery, state: FSMContext):
     user = callback.from_user
     is_admin = user.id in ADMIN_IDS
 
+    db.release_slot(user.id)
     await state.clear()
     await callback.message.edit_text(
         "❌ Действие отменено.\n\nГлавное меню:",
@@ -234,29 +303,73 @@ async def process_callback_cancel(callback: CallbackQuery, state: FSMContext):
     )
     await callback.answer()
 
-async def process_callback_my_appointments(callback: CallbackQuery):
-    """Просмотр записей пользователя"""
+async def show_appointments_page(callback: CallbackQuery, is_admin: bool = False, **page_args):
+    """Показ страницы записей пользователя или всех записей (для админа)"""
     user = callback.from_user
-    appointments = db.get_appointments(user.id)
+    page = db.get_appointments_page(
+        None if is_admin else user.id,
+        limit=APPOINTMENTS_PAGE_SIZE,
+        **page_args
+    )
 
-    if not appointments:
+    if not page.items:
+        if is_admin:
+            text = "📭 Нет записей."
+        else:
+            text = ("📭 У вас пока нет записей.\n\n"
+                    "Чтобы создать новую запись, нажмите «Записаться».")
         await callback.message.edit_text(
-            "📭 У вас пока нет записей.\n\n"
-            "Чтобы создать новую запись, нажмите «Записаться».",
+            text,
             reply_markup=get_main_keyboard(user.id in ADMIN_IDS)
         )
         await callback.answer()
         return
 
     await callback.message.edit_text(
-        "📋 Ваши записи:",
-        reply_markup=get_appointments_keyboard(appointments)
+        "📋 Все записи:" if is_admin else "📋 Ваши записи:",
+        reply_markup=get_appointments_keyboard(
+            page.items, is_admin, page.prev_cursor, page.next_cursor
+        )
+    )
+    await callback.answer()
+
+async def process_callback_my_appointments(callback: CallbackQuery):
+    """Просмотр записей пользователя"""
+    await show_appointments_page(callback)
+
+async def process_callback_appointments_page(callback: CallbackQuery,
+                                             callback_data: AppointmentsPageCallback):
+    """Переход по страницам списка записей"""
+    is_admin = callback_data.admin
+    if is_admin and callback.from_user.id not in ADMIN_IDS:
+        await callback.answer("⛔ Доступ запрещен")
+        return
+
+    cursor = callback_data.cursor
+    if callback_data.direction == 'n':
+        await show_appointments_page(callback, is_admin, after=cursor)
+    elif callback_data.direction == 'p':
+        await show_appointments_page(callback, is_admin, before=cursor)
+    else:
+        await show_appointments_page(callback, is_admin, from_date=f"{cursor:08d}")
+
+async def process_callback_appointments_dates(callback: CallbackQuery,
+                                              callback_data: AppointmentsDatesCallback):
+    """Выбор даты для перехода в списке записей"""
+    is_admin = callback_data.admin
+    if is_admin and callback.from_user.id not in ADMIN_IDS:
+        await callback.answer("⛔ Доступ запрещен")
+        return
+
+    await callback.message.edit_text(
+        "📅 Выберите дату:",
+        reply_markup=get_jump_dates_keyboard(is_admin)
     )
     await callback.answer()
 
-async def process_callback_view_appointment(callback: CallbackQuery):
+async def process_callback_view_appointment(callback: CallbackQuery, callback_data: ViewAppointmentCallback):
     """Просмотр конкретной записи"""
-    appointment_id = int(callback.data.split(':')[1])
+    appointment_id = callback_data.id
     appointment = db.get_appointment(appointment_id)
     user = callback.from_user
 
@@ -277,11 +390,13 @@ async def process_callback_view_appointment(callback: CallbackQuery):
     )
     await callback.answer()
 
-async def process_callback_cancel_appointment(callback: CallbackQuery):
+async def process_callback_cancel_appointment(callback: CallbackQuery, callback_data: CancelAppointmentCallback):
     """Отмена записи пользователем"""
-    appointment_id = int(callback.data.split(':')[1])
+    appointment_id = callback_data.id
 
     if db.delete_appointment(appointment_id):
+        if not await wait_durable(callback):
+            return
         await callback.message.edit_text(
             "✅ Запись успешно отменена.",
             reply_markup=get_main_keyboard(callback.from_user.id in ADMIN_IDS)
@@ -293,27 +408,51 @@ async def process_callback_cancel_appointment(callback: CallbackQuery):
         )
     await callback.answer()
 
-async def process_callback_add_to_calendar(callback: CallbackQuery):
+async def process_callback_add_to_calendar(callback: CallbackQuery, callback_data: CalendarCallback):
     """Добавление записи в календарь"""
-    appointment_id = int(callback.data.split(':')[1])
+    appointment_id = callback_data.id
     appointment = db.get_appointment(appointment_id)
 
     if not appointment:
         await callback.answer("❌ Запись не найдена")
         return
 
-    # Генерируем файл для календаря
-    calendar_file = generate_calendar_event(appointment)
+    # Файл генерируется в памяти; повторно отправляется по file_id
+    document = calendar_files.document(appointment)
 
-    if calendar_file:
-        with open(calendar_file, 'rb') as f:
-            await callback.message.answer_document(
-                types.FSInputFile(calendar_file),
-                caption="📅 Файл для добавления в календарь"
-            )
+    if document:
+        message = await callback.message.answer_document(
+            document,
+            caption="📅 Файл для добавления в календарь"
+        )
+        if message.document:
+            calendar_files.remember_file_id(appointment, message.document.file_id)
 
     await callback.answer("✅ Файл для календаря создан")
 
+async def send_calendar_feed(callback: CallbackQuery, feed: CalendarFeed, caption: str,
+                             url: Optional[str] = None):
+    """Отправка календаря документом (повторно - по file_id)"""
+    if url:
+        caption += f"\n\n🔗 Ссылка для подписки в календаре:\n{url}"
+    message = await callback.message.answer_document(
+        calendar_feeds.document(feed),
+        caption=caption
+    )
+    if message.document:
+        calendar_feeds.remember_file_id(feed, message.document.file_id)
+    await callback.answer()
+
+async def process_callback_my_calendar(callback: CallbackQuery):
+    """Календарь со всеми активными записями пользователя"""
+    user_id = callback.from_user.id
+    await send_calendar_feed(
+        callback,
+        calendar_feeds.user_feed(user_id),
+        "🗓 Календарь ваших записей",
+        feed_url('user', user_id)
+    )
+
 async def process_callback_doctors_list(callback: CallbackQuery):
     """Список врачей"""
     text = "👨‍⚕️ Наши врачи:\n\n"
@@ -349,29 +488,15 @@ async def process_callback_all_appointments(callback: CallbackQuery):
         await callback.answer("⛔ Доступ запрещен")
         return
 
-    appointments = db.get_appointments()
-
-    if not appointments:
-        await callback.message.edit_text(
-            "📭 Нет записей.",
-            reply_markup=get_main_keyboard(True)
-        )
-        await callback.answer()
-        return
-
-    await callback.message.edit_text(
-        "📋 Все записи:",
-        reply_markup=get_appointments_keyboard(appointments, is_admin=True)
-    )
-    await callback.answer()
+    await show_appointments_page(callback, is_admin=True)
 
-async def process_callback_admin_view(callback: CallbackQuery):
+async def process_callback_admin_view(callback: CallbackQuery, callback_data: AdminViewCallback):
     """Просмотр записи админом"""
     if callback.from_user.id not in ADMIN_IDS:
         await callback.answer("⛔ Доступ запрещен")
         return
 
-    appointment_id = int(callback.data.split(':')[1])
+    appointment_id = callback_data.id
     appointment = db.get_appointment(appointment_id)
 
     if not appointment:
@@ -390,15 +515,17 @@ async def process_callback_admin_view(callback: CallbackQuery):
     )
     await callback.answer()
 
-async def process_callback_delete_appointment(callback: CallbackQuery):
+async def process_callback_delete_appointment(callback: CallbackQuery, callback_data: DeleteAppointmentCallback):
     """Удаление записи админом"""
     if callback.from_user.id not in ADMIN_IDS:
         await callback.answer("⛔ Доступ запрещен")
         return
 
-    appointment_id = int(callback.data.split(':')[1])
+    appointment_id = callback_data.id
 
     if db.delete_appointment(appointment_id):
+        if not await wait_durable(callback):
+            return
         await callback.message.edit_text(
             "✅ Запись успешно удалена.",
             reply_markup=get_main_keyboard(True)
@@ -410,13 +537,13 @@ async def process_callback_delete_appointment(callback: CallbackQuery):
         )
     await callback.answer()
 
-async def process_callback_edit_appointment(callback: CallbackQuery):
+async def process_callback_edit_appointment(callback: CallbackQuery, callback_data: EditAppointmentCallback):
     """Начало редактирования записи"""
     if callback.from_user.id not in ADMIN_IDS:
         await callback.answer("⛔ Доступ запрещен")
         return
 
-    appointment_id = int(callback.data.split(':')[1])
+    appointment_id = callback_data.id
 
     await callback.message.edit_text(
         "✏️ Что вы хотите отредактировать?",
@@ -424,15 +551,36 @@ async def process_callback_edit_appointment(callback: CallbackQuery):
     )
     await callback.answer()
 
-async def process_callback_users_list(callback: CallbackQuery):
-    """Список пользователей для админа"""
+async def process_callback_doctor_calendars(callback: CallbackQuery):
+    """Выбор врача для выгрузки календаря (для админа)"""
+    if callback.from_user.id not in ADMIN_IDS:
+        await callback.answer("⛔ Доступ запрещен")
+        return
+
+    await callback.message.edit_text(
+        "🗓 Выберите врача:",
+        reply_markup=get_doctor_calendars_keyboard()
+    )
+    await callback.answer()
+
+async def process_callback_doctor_calendar(callback: CallbackQuery, callback_data: DoctorCalendarCallback):
+    """Календарь со всеми активными записями врача (для админа)"""
     if callback.from_user.id not in ADMIN_IDS:
         await callback.answer("⛔ Доступ запрещен")
         return
 
-    users = db.get_users()
+    await send_calendar_feed(
+        callback,
+        calendar_feeds.doctor_feed(callback_data.doctor),
+        f"🗓 Записи: {callback_data.doctor}",
+        feed_url('doctor', callback_data.id)
+    )
+
+async def show_users_page(callback: CallbackQuery, **page_args):
+    """Показ страницы списка пользователей"""
+    page = db.get_users_page(limit=USERS_PAGE_SIZE, **page_args)
 
-    if not users:
+    if not page.items:
         await callback.message.edit_text(
             "👥 Нет зарегистрированных пользователей.",
             reply_markup=get_main_keyboard(True)
@@ -441,17 +589,156 @@ async def process_callback_users_list(callback: CallbackQuery):
         return
 
     text = "👥 Список пользователей:\n\n"
-    for user_id, user_data in users.items():
-        text += f"ID: {user_id}\n"
-        text += f"Имя: {user_data['first_name']}\n"
-        if user_data['username']:
-            text += f"Username: @{user_data['username']}\n"
-        text += f"Регистрация: {user_data['registered_at'][:10]}\n"
-        text += "-" * 20 + "\n"
-
-    await callback.message.edit_text(text)
+    for user_id, user_data in page.items:
+        text += format_user(user_id, user_data)
+
+    await callback.message.edit_text(
+        text,
+        reply_markup=get_users_keyboard(page.prev_cursor, page.next_cursor)
+    )
+    await callback.answer()
+
+async def process_callback_users_list(callback: CallbackQuery):
+    """Список пользователей для админа"""
+    if callback.from_user.id not in ADMIN_IDS:
+        await callback.answer("⛔ Доступ запрещен")
+        return
+
+    await show_users_page(callback)
+
+async def process_callback_users_page(callback: CallbackQuery, callback_data: UsersPageCallback):
+    """Переход по страницам списка пользователей"""
+    if callback.from_user.id not in ADMIN_IDS:
+        await callback.answer("⛔ Доступ запрещен")
+        return
+
+    if callback_data.direction == 'n':
+        await show_users_page(callback, after=callback_data.cursor)
+    else:
+        await show_users_page(callback, before=callback_data.cursor)
+
+async def start_broadcast_input(message: Message, state: FSMContext, broadcaster: Broadcaster,
+                                edit: bool = False):
+    """Запрос текста рассылки (или сообщение, что рассылка уже идёт)"""
+    if broadcaster.running:
+        await message.answer(broadcaster.progress_text())
+        return
+
+    text = (
+        "📣 Отправьте текст рассылки одним сообщением.\n"
+        "Его получат все пользователи бота, кроме заблокировавших его."
+    )
+    if edit:
+        await message.edit_text(text, reply_markup=get_cancel_keyboard())
+    else:
+        await message.answer(text, reply_markup=get_cancel_keyboard())
+    await state.set_state(BroadcastStates.waiting_for_text)
+
+async def cmd_broadcast(message: Message, state: FSMContext, broadcaster: Broadcaster):
+    """Обработчик команды /broadcast (для админа)"""
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer("⛔ Доступ запрещен")
+        return
+
+    await start_broadcast_input(message, state, broadcaster)
+
+async def process_callback_broadcast(callback: CallbackQuery, state: FSMContext, broadcaster: Broadcaster):
+    """Кнопка «Рассылка» в главном меню админа"""
+    if callback.from_user.id not in ADMIN_IDS:
+        await callback.answer("⛔ Доступ запрещен")
+        return
+
+    await start_broadcast_input(callback.message, state, broadcaster, edit=True)
     await callback.answer()
 
+async def process_broadcast_text(message: Message, state: FSMContext):
+    """Текст рассылки: показ предпросмотра с подтверждением"""
+    if message.from_user.id not in ADMIN_IDS:
+        await state.clear()
+        return
+
+    if not message.text:
+        await message.answer("❌ Рассылка поддерживает только текстовые сообщения. Попробуйте снова:",
+                             reply_markup=get_cancel_keyboard())
+        return
+
+    # html_text сохраняет форматирование исходного сообщения
+    await state.update_data(broadcast_text=message.html_text)
+    await message.answer("👀 Так сообщение увидят пользователи:")
+    await message.answer(message.html_text, reply_markup=get_broadcast_confirm_keyboard())
+    await state.set_state(BroadcastStates.waiting_for_confirmation)
+
+async def process_callback_broadcast_send(callback: CallbackQuery, state: FSMContext,
+                                          broadcaster: Broadcaster):
+    """Запуск рассылки после подтверждения"""
+    if callback.from_user.id not in ADMIN_IDS:
+        await callback.answer("⛔ Доступ запрещен")
+        return
+
+    data = await state.get_data()
+    await state.clear()
+    await callback.message.edit_reply_markup(reply_markup=None)
+
+    # Рассылку может вести и другой процесс бота (WORKERS > 1)
+    if broadcaster.running or not broadcaster.acquire():
+        await callback.answer("Рассылка уже идёт", show_alert=True)
+        return
+
+    try:
+        progress = await callback.message.answer("📣 Идёт рассылка...",
+                                                 reply_markup=get_broadcast_progress_keyboard())
+    except BaseException:
+        broadcaster.release()
+        raise
+    broadcaster.start(data['broadcast_text'], progress.chat.id, progress.message_id)
+    await callback.answer("Рассылка запущена")
+
+async def process_callback_broadcast_stop(callback: CallbackQuery, broadcaster: Broadcaster):
+    """Остановка рассылки"""
+    if callback.from_user.id not in ADMIN_IDS:
+        await callback.answer("⛔ Доступ запрещен")
+        return
+
+    if broadcaster.running:
+        broadcaster.stop()
+        await callback.answer("Рассылка останавливается...")
+    else:
+        await callback.answer("Рассылка уже завершена")
+
+async def process_callback_export(callback: CallbackQuery, callback_data: ExportCallback):
+    """Выгрузка пользователей или записей в CSV (для админа)"""
+    if callback.from_user.id not in ADMIN_IDS:
+        await callback.answer("⛔ Доступ запрещен")
+        return
+
+    stamp = datetime.now().strftime("%Y%m%d_%H%M")
+    if callback_data.table == 'users':
+        document = StreamingInputFile(lambda: users_csv(db), f"users_{stamp}.csv")
+    else:
+        document = StreamingInputFile(lambda: appointments_csv(db, archive), f"appointments_{stamp}.csv")
+
+    # Отвечаем на нажатие сразу: выгрузка большой таблицы может занять время
+    await callback.answer("⏳ Готовлю выгрузку...")
+    await callback.message.answer_document(document, caption="📤 Выгрузка данных")
+
+async def cmd_archive(message: Message):
+    """Обработчик команды /archive ДД.ММ.ГГГГ ДД.ММ.ГГГГ - архивные записи за период (для админа)"""
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer("⛔ Доступ запрещен")
+        return
+
+    try:
+        from_date, to_date = (datetime.strptime(value, "%d.%m.%Y").strftime("%Y%m%d")
+                              for value in message.text.split()[1:3])
+    except ValueError:
+        await message.answer("📦 Архив записей за период:\n/archive 01.01.2024 31.12.2024")
+        return
+
+    # Архив читается по месяцам во время загрузки файла
+    filename = f"archive_{from_date}_{to_date}.csv"
+    document = StreamingInputFile(lambda: archive_csv(archive, from_date, to_date), filename)
+    await message.answer_document(document, caption="📦 Архив записей")
+
 # Функция регистрации обработчиков для aiogram 3.x
 def register_handlers(dp: Dispatcher):
     """Регистрация всех обработчиков"""
@@ -461,56 +748,63 @@ def register_handlers(dp: Dispatcher):
     dp.message.register(cmd_help, Command(commands=['help']))
     dp.message.register(cmd_menu, Command(commands=['menu']))
     dp.message.register(cmd_stop, Command(commands=['stop']))
+    dp.message.register(cmd_broadcast, Command(commands=['broadcast']))
+    dp.message.register(cmd_archive, Command(commands=['archive']))
+
+    # Callback'и: действие из callback_data ищется в словаре маршрутов,
+    # аргументы распаковываются классами из callbacks.py
+    router = CallbackRouter()
 
     # Основные callback'и
-    dp.callback_query.register(process_callback_main_menu, lambda c: c.data == 'main_menu')
-    dp.callback_query.register(process_callback_make_appointment, lambda c: c.data == 'make_appointment')
-    dp.callback_query.register(process_callback_my_appointments, lambda c: c.data == 'my_appointments')
-    dp.callback_query.register(process_callback_doctors_list, lambda c: c.data == 'doctors_list')
-    dp.callback_query.register(process_callback_about, lambda c: c.data == 'about')
+    router.route('main_menu', process_callback_main_menu)
+    router.route('make_appointment', process_callback_make_appointment)
+    router.route('my_appointments', process_callback_my_appointments)
+    router.route('doctors_list', process_callback_doctors_list)
+    router.route('about', process_callback_about)
 
     # Процесс записи
-    dp.callback_query.register(process_callback_select_doctor,
-                              lambda c: c.data.startswith('select_doctor:'),
-                              StateFilter(AppointmentStates.waiting_for_doctor))
-    dp.callback_query.register(process_callback_select_procedure,
-                              lambda c: c.data.startswith('select_procedure:'),
-                              StateFilter(AppointmentStates.waiting_for_procedure))
-    dp.callback_query.register(process_callback_select_date,
-                              lambda c: c.data.startswith('select_date:'),
-                              StateFilter(AppointmentStates.waiting_for_date))
-    dp.callback_query.register(process_callback_select_time,
-                              lambda c: c.data.startswith('select_time:'),
-                              StateFilter(AppointmentStates.waiting_for_time))
-    dp.callback_query.register(process_callback_confirm,
-                              lambda c: c.data == 'confirm',
-                              StateFilter(AppointmentStates.waiting_for_confirmation))
+    router.route(DoctorCallback, process_callback_select_doctor,
+                 state=[AppointmentStates.waiting_for_doctor])
+    router.route(ProcedureCallback, process_callback_select_procedure,
+                 state=[AppointmentStates.waiting_for_procedure])
+    router.route(DateCallback, process_callback_select_date,
+                 state=[AppointmentStates.waiting_for_date])
+    router.route(TimeCallback, process_callback_select_time,
+                 state=[AppointmentStates.waiting_for_time])
+    router.route('confirm', process_callback_confirm,
+                 state=[AppointmentStates.waiting_for_confirmation])
 
     # Управление записями
-    dp.callback_query.register(process_callback_view_appointment,
-                              lambda c: c.data.startswith('view_appointment:'))
-    dp.callback_query.register(process_callback_cancel_appointment,
-                              lambda c: c.data.startswith('cancel_appointment:'))
-    dp.callback_query.register(process_callback_add_to_calendar,
-                              lambda c: c.data.startswith('add_to_calendar:'))
+    router.route(ViewAppointmentCallback, process_callback_view_appointment)
+    router.route(CancelAppointmentCallback, process_callback_cancel_appointment)
+    router.route(CalendarCallback, process_callback_add_to_calendar)
+    router.route(AppointmentsPageCallback, process_callback_appointments_page)
+    router.route(AppointmentsDatesCallback, process_callback_appointments_dates)
+    router.route('my_calendar', process_callback_my_calendar)
 
     # Админские callback'и
-    dp.callback_query.register(process_callback_all_appointments,
-                              lambda c: c.data == 'all_appointments')
-    dp.callback_query.register(process_callback_admin_view,
-                              lambda c: c.data.startswith('admin_view:'))
-    dp.callback_query.register(process_callback_delete_appointment,
-                              lambda c: c.data.startswith('delete_appointment:'))
-    dp.callback_query.register(process_callback_edit_appointment,
-                              lambda c: c.data.startswith('edit_appointment:'))
-    dp.callback_query.register(process_callback_users_list,
-                              lambda c: c.data == 'users_list')
-
-    # Общий обработчик отмены
-    dp.callback_query.register(process_callback_cancel,
-                              lambda c: c.data == 'cancel',
-                              StateFilter('*'))
+    router.route('all_appointments', process_callback_all_appointments)
+    router.route(AdminViewCallback, process_callback_admin_view)
+    router.route(DeleteAppointmentCallback, process_callback_delete_appointment)
+    router.route(EditAppointmentCallback, process_callback_edit_appointment)
+    router.route('doctor_calendars', process_callback_doctor_calendars)
+    router.route(DoctorCalendarCallback, process_callback_doctor_calendar)
+    router.route('users_list', process_callback_users_list)
+    router.route(UsersPageCallback, process_callback_users_page)
+    router.route(ExportCallback, process_callback_export)
+    router.route('broadcast', process_callback_broadcast)
+    router.route('broadcast_send', process_callback_broadcast_send,
+                 state=[BroadcastStates.waiting_for_confirmation])
+    router.route('broadcast_stop', process_callback_broadcast_stop)
+
+    # Общий обработчик отмены (в любом состоянии)
+    router.route('cancel', process_callback_cancel)
+
+    router.register(dp)
 
     # Обработчик имени пациента
     dp.message.register(process_patient_name,
-                       StateFilter(AppointmentStates.waiting_for_patient_name))
\ No newline at end of file
+                       StateFilter(AppointmentStates.waiting_for_patient_name))
+    # Обработчик текста рассылки
+    dp.message.register(process_broadcast_text,
+                       StateFilter(BroadcastStates.waiting_for_text))
@@ -1,162 +1,278 @@
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from datetime import datetime, timedelta
-from config import DOCTORS, AVAILABLE_TIMES, PROCEDURES
-
+from datetime import date as date_type, datetime, timedelta
+from functools import lru_cache
+from typing import Optional, Tuple
 
-def get_main_keyboard(is_admin: bool = False):
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+from callbacks import (
+    AdminViewCallback, AppointmentsDatesCallback, AppointmentsPageCallback,
+    CalendarCallback, CancelAppointmentCallback, DateCallback, DeleteAppointmentCallback,
+    DoctorCalendarCallback, DoctorCallback, EditAppointmentCallback, ExportCallback,
+    ProcedureCallback, TimeCallback, UsersPageCallback, ViewAppointmentCallback,
+    doctor_procedures
+)
+from config import AVAILABLE_TIMES, DOCTORS
+from pagination import date_key
+from slots import TIME_BITS
+
+# Статические клавиатуры строятся один раз, параметризованные кэшируются
+# с вытеснением (lru_cache). Возвращаемые объекты общие для всех вызовов,
+# поэтому изменять их нельзя.
+
+
+@lru_cache(maxsize=2)
+def get_main_keyboard(is_admin: bool = False) -> InlineKeyboardMarkup:
     """Основная клавиатура с инлайн кнопками (минимум 4 кнопки)"""
-    keyboard = InlineKeyboardMarkup(row_width=2)
+    builder = InlineKeyboardBuilder()
 
-    buttons = [
-        InlineKeyboardButton("📅 Записаться", callback_data="make_appointment"),
-        InlineKeyboardButton("📋 Мои записи", callback_data="my_appointments"),
-        InlineKeyboardButton("👨‍⚕️ Врачи", callback_data="doctors_list"),
-        InlineKeyboardButton("ℹ️ О клинике", callback_data="about"),
-    ]
+    builder.button(text="📅 Записаться", callback_data="make_appointment")
+    builder.button(text="📋 Мои записи", callback_data="my_appointments")
+    builder.button(text="👨‍⚕️ Врачи", callback_data="doctors_list")
+    builder.button(text="ℹ️ О клинике", callback_data="about")
 
     # Дополнительные кнопки для администратора
     if is_admin:
-        buttons.extend([
-            InlineKeyboardButton("📊 Все записи", callback_data="all_appointments"),
-            InlineKeyboardButton("👥 Пользователи", callback_data="users_list"),
-        ])
+        builder.button(text="📊 Все записи", callback_data="all_appointments")
+        builder.button(text="👥 Пользователи", callback_data="users_list")
+        builder.button(text="📣 Рассылка", callback_data="broadcast")
 
-    keyboard.add(*buttons)
-    return keyboard
+    builder.adjust(2)
+    return builder.as_markup()
 
 
-def get_doctors_keyboard():
+@lru_cache(maxsize=1)
+def get_doctors_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура с врачами"""
-    keyboard = InlineKeyboardMarkup(row_width=1)
+    builder = InlineKeyboardBuilder()
+
+    for doctor_id, doctor in enumerate(DOCTORS):
+        builder.button(text=doctor, callback_data=DoctorCallback(id=doctor_id))
+
+    builder.button(text="◀️ Назад", callback_data="main_menu")
+    builder.adjust(1)
+    return builder.as_markup()
+
+
+@lru_cache(maxsize=64)
+def get_procedures_keyboard(doctor_id: int) -> InlineKeyboardMarkup:
+    """Клавиатура с процедурами для выбранного врача (индекс в DOCTORS)"""
+    builder = InlineKeyboardBuilder()
+
+    for procedure_id, procedure in enumerate(doctor_procedures(doctor_id)):
+        builder.button(text=procedure,
+                       callback_data=ProcedureCallback(doctor_id=doctor_id, id=procedure_id))
 
-    for doctor in DOCTORS:
-        keyboard.add(InlineKeyboardButton(
-            doctor,
-            callback_data=f"select_doctor:{doctor}"
-        ))
+    builder.button(text="◀️ Назад", callback_data="select_doctor")
+    builder.adjust(1)
+    return builder.as_markup()
 
-    keyboard.add(InlineKeyboardButton("◀️ Назад", callback_data="main_menu"))
-    return keyboard
 
+def get_booking_dates() -> Tuple[str, ...]:
+    """Даты, доступные для записи (ближайшие 7 дней)"""
+    return _booking_dates(datetime.now().date())
 
-def get_procedures_keyboard(doctor: str):
-    """Клавиатура с процедурами для выбранного врача"""
-    keyboard = InlineKeyboardMarkup(row_width=1)
 
-    # Получаем первую часть названия врача для поиска в PROCEDURES
-    doctor_key = doctor.split()[0].lower()
-    procedures = PROCEDURES.get(doctor_key, ["Консультация"])
+@lru_cache(maxsize=1)
+def _booking_dates(today: date_type) -> Tuple[str, ...]:
+    return tuple((today + timedelta(days=i)).strftime("%d.%m.%Y") for i in range(7))
 
-    for procedure in procedures:
-        keyboard.add(InlineKeyboardButton(
-            procedure,
-            callback_data=f"select_procedure:{procedure}"
-        ))
 
-    keyboard.add(InlineKeyboardButton("◀️ Назад", callback_data="select_doctor"))
-    return keyboard
+def get_dates_keyboard(hidden_mask: int = 0) -> InlineKeyboardMarkup:
+    """Клавиатура с датами на ближайшие 7 дней.
 
+    Бит i в hidden_mask скрывает i-й день из get_booking_dates()
+    (например, полностью занятый).
+    """
+    return _build_dates_keyboard(datetime.now().date(), hidden_mask)
 
-def get_dates_keyboard():
-    """Клавиатура с датами на ближайшие 7 дней"""
-    keyboard = InlineKeyboardMarkup(row_width=3)
 
-    today = datetime.now()
-    for i in range(7):
-        date = today + timedelta(days=i)
-        date_str = date.strftime("%d.%m.%Y")
-        day_name = date.strftime("%A")[:3]
+@lru_cache(maxsize=128)
+def _build_dates_keyboard(today: date_type, hidden_mask: int = 0) -> InlineKeyboardMarkup:
+    # Ключ кэша включает текущий день, поэтому клавиатура перестраивается
+    # только при смене дня или набора скрытых дат
+    builder = InlineKeyboardBuilder()
 
-        keyboard.insert(InlineKeyboardButton(
-            f"{date_str} ({day_name})",
-            callback_data=f"select_date:{date_str}"
-        ))
+    for i, date_str in enumerate(_booking_dates(today)):
+        if hidden_mask & (1 << i):
+            continue
+        day_name = (today + timedelta(days=i)).strftime("%A")[:3]
+        builder.button(text=f"{date_str} ({day_name})", callback_data=DateCallback(date=date_str))
 
-    keyboard.add(InlineKeyboardButton("◀️ Назад", callback_data="select_doctor"))
-    return keyboard
+    builder.adjust(3)
+    builder.row(InlineKeyboardButton(text="◀️ Назад", callback_data="select_doctor"))
+    return builder.as_markup()
 
 
-def get_times_keyboard():
-    """Клавиатура с доступным временем"""
-    keyboard = InlineKeyboardMarkup(row_width=3)
+@lru_cache(maxsize=256)
+def get_times_keyboard(occupied_mask: int = 0) -> InlineKeyboardMarkup:
+    """Клавиатура со свободным временем (occupied_mask - см. slots.TIME_BITS)"""
+    builder = InlineKeyboardBuilder()
 
-    for time in AVAILABLE_TIMES:
-        keyboard.insert(InlineKeyboardButton(
-            time,
-            callback_data=f"select_time:{time}"
-        ))
+    for slot, time in enumerate(AVAILABLE_TIMES):
+        if not occupied_mask & TIME_BITS[time]:
+            builder.button(text=time, callback_data=TimeCallback(slot=slot))
 
-    keyboard.add(InlineKeyboardButton("◀️ Назад", callback_data="select_date"))
-    return keyboard
+    builder.adjust(3)
+    builder.row(InlineKeyboardButton(text="◀️ Назад", callback_data="select_date"))
+    return builder.as_markup()
 
 
-def get_appointments_keyboard(appointments: list, is_admin: bool = False):
-    """Клавиатура со списком записей"""
-    keyboard = InlineKeyboardMarkup(row_width=1)
+def get_appointments_keyboard(appointments: list, is_admin: bool = False,
+                              prev_cursor: Optional[int] = None,
+                              next_cursor: Optional[int] = None) -> InlineKeyboardMarkup:
+    """Клавиатура со страницей списка записей и навигацией"""
+    builder = InlineKeyboardBuilder()
+    view_callback = AdminViewCallback if is_admin else ViewAppointmentCallback
 
     for apt in appointments:
         text = f"{apt['date']} {apt['time']} - {apt['doctor']}"
-        if is_admin:
-            callback = f"admin_view:{apt['id']}"
-        else:
-            callback = f"view_appointment:{apt['id']}"
-        keyboard.add(InlineKeyboardButton(text, callback_data=callback))
+        builder.button(text=text, callback_data=view_callback(id=apt['id']))
+    builder.adjust(1)
+
+    navigation = []
+    if prev_cursor is not None:
+        navigation.append(InlineKeyboardButton(text="⬅️", callback_data=AppointmentsPageCallback(
+            admin=is_admin, direction='p', cursor=prev_cursor).pack()))
+    navigation.append(InlineKeyboardButton(
+        text="📅 К дате", callback_data=AppointmentsDatesCallback(admin=is_admin).pack()))
+    if next_cursor is not None:
+        navigation.append(InlineKeyboardButton(text="➡️", callback_data=AppointmentsPageCallback(
+            admin=is_admin, direction='n', cursor=next_cursor).pack()))
+    builder.row(*navigation)
+
+    if is_admin:
+        builder.row(InlineKeyboardButton(text="🗓 Календари врачей", callback_data="doctor_calendars"))
+    else:
+        builder.row(InlineKeyboardButton(text="🗓 Все записи в календарь", callback_data="my_calendar"))
+    builder.row(InlineKeyboardButton(text="◀️ Назад", callback_data="main_menu"))
+    return builder.as_markup()
+
+
+@lru_cache(maxsize=1)
+def get_doctor_calendars_keyboard() -> InlineKeyboardMarkup:
+    """Клавиатура выбора врача для выгрузки календаря (админ)"""
+    builder = InlineKeyboardBuilder()
+
+    for doctor_id, doctor in enumerate(DOCTORS):
+        builder.button(text=doctor, callback_data=DoctorCalendarCallback(id=doctor_id))
+
+    builder.button(text="◀️ Назад", callback_data="all_appointments")
+    builder.adjust(1)
+    return builder.as_markup()
 
-    keyboard.add(InlineKeyboardButton("◀️ Назад", callback_data="main_menu"))
-    return keyboard
 
+def get_jump_dates_keyboard(is_admin: bool = False) -> InlineKeyboardMarkup:
+    """Клавиатура перехода к записям на выбранную дату"""
+    return _build_jump_dates_keyboard(datetime.now().date(), is_admin)
 
-def get_appointment_actions_keyboard(appointment_id: int, is_admin: bool = False):
+
+@lru_cache(maxsize=2)
+def _build_jump_dates_keyboard(today: date_type, is_admin: bool) -> InlineKeyboardMarkup:
+    builder = InlineKeyboardBuilder()
+
+    for date_str in _booking_dates(today):
+        builder.button(text=date_str, callback_data=AppointmentsPageCallback(
+            admin=is_admin, direction='d', cursor=int(date_key(date_str))))
+
+    builder.adjust(3)
+    back = "all_appointments" if is_admin else "my_appointments"
+    builder.row(InlineKeyboardButton(text="◀️ Назад", callback_data=back))
+    return builder.as_markup()
+
+
+@lru_cache(maxsize=256)
+def get_users_keyboard(prev_cursor: Optional[int] = None,
+                       next_cursor: Optional[int] = None) -> InlineKeyboardMarkup:
+    """Клавиатура страницы списка пользователей (админ)"""
+    builder = InlineKeyboardBuilder()
+
+    navigation = []
+    if prev_cursor is not None:
+        navigation.append(InlineKeyboardButton(
+            text="⬅️", callback_data=UsersPageCallback(direction='p', cursor=prev_cursor).pack()))
+    if next_cursor is not None:
+        navigation.append(InlineKeyboardButton(
+            text="➡️", callback_data=UsersPageCallback(direction='n', cursor=next_cursor).pack()))
+    if navigation:
+        builder.row(*navigation)
+
+    builder.row(
+        InlineKeyboardButton(text="📤 Пользователи (CSV)",
+                             callback_data=ExportCallback(table='users').pack()),
+        InlineKeyboardButton(text="📤 Записи (CSV)",
+                             callback_data=ExportCallback(table='appointments').pack()),
+    )
+    builder.row(InlineKeyboardButton(text="◀️ Назад", callback_data="main_menu"))
+    return builder.as_markup()
+
+
+@lru_cache(maxsize=1024)
+def get_appointment_actions_keyboard(appointment_id: int, is_admin: bool = False) -> InlineKeyboardMarkup:
     """Клавиатура действий для конкретной записи"""
-    keyboard = InlineKeyboardMarkup(row_width=2)
+    builder = InlineKeyboardBuilder()
 
     if is_admin:
-        buttons = [
-            InlineKeyboardButton("✏️ Редактировать", callback_data=f"edit_appointment:{appointment_id}"),
-            InlineKeyboardButton("❌ Удалить", callback_data=f"delete_appointment:{appointment_id}"),
-            InlineKeyboardButton("📅 В календарь", callback_data=f"add_to_calendar:{appointment_id}"),
-            InlineKeyboardButton("◀️ Назад", callback_data="all_appointments"),
-        ]
+        builder.button(text="✏️ Редактировать", callback_data=EditAppointmentCallback(id=appointment_id))
+        builder.button(text="❌ Удалить", callback_data=DeleteAppointmentCallback(id=appointment_id))
+        builder.button(text="📅 В календарь", callback_data=CalendarCallback(id=appointment_id))
+        builder.button(text="◀️ Назад", callback_data="all_appointments")
     else:
-        buttons = [
-            InlineKeyboardButton("❌ Отменить", callback_data=f"cancel_appointment:{appointment_id}"),
-            InlineKeyboardButton("📅 В календарь", callback_data=f"add_to_calendar:{appointment_id}"),
-            InlineKeyboardButton("◀️ Назад", callback_data="my_appointments"),
-        ]
+        builder.button(text="❌ Отменить", callback_data=CancelAppointmentCallback(id=appointment_id))
+        builder.button(text="📅 В календарь", callback_data=CalendarCallback(id=appointment_id))
+        builder.button(text="◀️ Назад", callback_data="my_appointments")
 
-    keyboard.add(*buttons)
-    return keyboard
+    builder.adjust(2)
+    return builder.as_markup()
 
 
-def get_admin_edit_keyboard(appointment_id: int):
+@lru_cache(maxsize=256)
+def get_admin_edit_keyboard(appointment_id: int) -> InlineKeyboardMarkup:
     """Клавиатура для редактирования записи (админ)"""
-    keyboard = InlineKeyboardMarkup(row_width=2)
+    builder = InlineKeyboardBuilder()
 
-    buttons = [
-        InlineKeyboardButton("👤 Имя пациента", callback_data=f"edit_patient_name:{appointment_id}"),
-        InlineKeyboardButton("👨‍⚕️ Врача", callback_data=f"edit_doctor:{appointment_id}"),
-        InlineKeyboardButton("💉 Процедуру", callback_data=f"edit_procedure:{appointment_id}"),
-        InlineKeyboardButton("📅 Дату", callback_data=f"edit_date:{appointment_id}"),
-        InlineKeyboardButton("⏰ Время", callback_data=f"edit_time:{appointment_id}"),
-        InlineKeyboardButton("◀️ Назад", callback_data=f"view_appointment:{appointment_id}"),
-    ]
+    builder.button(text="👤 Имя пациента", callback_data=f"edit_patient_name:{appointment_id}")
+    builder.button(text="👨‍⚕️ Врача", callback_data=f"edit_doctor:{appointment_id}")
+    builder.button(text="💉 Процедуру", callback_data=f"edit_procedure:{appointment_id}")
+    builder.button(text="📅 Дату", callback_data=f"edit_date:{appointment_id}")
+    builder.button(text="⏰ Время", callback_data=f"edit_time:{appointment_id}")
+    builder.button(text="◀️ Назад", callback_data=ViewAppointmentCallback(id=appointment_id))
 
-    keyboard.add(*buttons)
-    return keyboard
+    builder.adjust(2)
+    return builder.as_markup()
 
 
-def get_confirmation_keyboard():
+@lru_cache(maxsize=1)
+def get_confirmation_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура подтверждения"""
-    keyboard = InlineKeyboardMarkup(row_width=2)
-    keyboard.add(
-        InlineKeyboardButton("✅ Подтвердить", callback_data="confirm"),
-        InlineKeyboardButton("❌ Отмена", callback_data="cancel")
-    )
-    return keyboard
+    builder = InlineKeyboardBuilder()
+    builder.button(text="✅ Подтвердить", callback_data="confirm")
+    builder.button(text="❌ Отмена", callback_data="cancel")
+    builder.adjust(2)
+    return builder.as_markup()
+
+
+@lru_cache(maxsize=1)
+def get_broadcast_confirm_keyboard() -> InlineKeyboardMarkup:
+    """Клавиатура подтверждения рассылки"""
+    builder = InlineKeyboardBuilder()
+    builder.button(text="📣 Отправить всем", callback_data="broadcast_send")
+    builder.button(text="❌ Отмена", callback_data="cancel")
+    builder.adjust(2)
+    return builder.as_markup()
+
+
+@lru_cache(maxsize=1)
+def get_broadcast_progress_keyboard() -> InlineKeyboardMarkup:
+    """Клавиатура сообщения с прогрессом рассылки"""
+    builder = InlineKeyboardBuilder()
+    builder.button(text="⏹ Остановить", callback_data="broadcast_stop")
+    return builder.as_markup()
 
 
-def get_cancel_keyboard():
+@lru_cache(maxsize=1)
+def get_cancel_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура для отмены действия"""
-    keyboard = InlineKeyboardMarkup()
-    keyboard.add(InlineKeyboardButton("❌ Отмена", callback_data="cancel"))
-    return keyboard
\ No newline at end of file
+    builder = InlineKeyboardBuilder()
+    builder.button(text="❌ Отмена", callback_data="cancel")
+    return builder.as_markup()
@@ -0,0 +1,34 @@
+import logging
+from typing import Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+# Слушатель изменения записи: получает запись после изменения
+AppointmentListener = Callable[[Dict], None]
+
+
+class ListenersMixin:
+    """Подписка на изменения записей.
+
+    Слушатели вызываются синхронно после создания и каждого изменения
+    записи (в том числе отмены) с актуальным состоянием записи.
+    Класс базы данных должен создать список ``self._listeners``.
+    """
+
+    _listeners: List[AppointmentListener]
+
+    def add_listener(self, listener: AppointmentListener):
+        """Подписка на изменения записей"""
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: AppointmentListener):
+        """Отписка от изменений записей"""
+        self._listeners.remove(listener)
+
+    def _notify(self, appointment: Dict):
+        # Ошибка слушателя не должна отменять уже сохранённое изменение
+        for listener in self._listeners:
+            try:
+                listener(appointment)
+            except Exception:
+                logger.exception("Ошибка обработки изменения записи #%s", appointment.get('id'))
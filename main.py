@@ -3,15 +3,44 @@
 
 import asyncio
 import logging
+import multiprocessing
+import signal
 import sys
 from aiogram import Bot, Dispatcher, types
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
+from aiogram.methods import SendMessage
+from aiohttp import web
 
-from config import BOT_TOKEN
-from handlers import register_handlers
-from utils import cleanup_temp_files
+from config import (BOT_TOKEN, ASYNC_WRITES, WRITE_COALESCE_DELAY,
+                    FSM_STORAGE, FSM_DATABASE_FILE, FSM_STATE_TTL, FSM_CACHE_SIZE,
+                    BOT_MODE, WEBAPP_HOST, WEBAPP_PORT, MAX_CONCURRENT_UPDATES,
+                    CHAT_QUEUE_DEPTH, MAX_PENDING_UPDATES, STALE_CALLBACK_SECONDS,
+                    WORKERS, WORKER_QUEUE_SIZE, WEBHOOK_PATH, WEBHOOK_SECRET,
+                    CALENDAR_FEED_SECRET, REMINDER_HOURS, REMINDER_STATE_FILE, ADMIN_IDS,
+                    SEND_GLOBAL_RATE, SEND_CHAT_RATE, SEND_GROUP_RATE,
+                    SEND_CONCURRENCY, SEND_MAX_RETRIES,
+                    BROADCAST_STATE_FILE, BROADCAST_CONCURRENCY, METRICS_ENABLED,
+                    PROFILE_SLOW_UPDATE_MS, PROFILE_SAMPLE_RATE, PROFILE_DIR, PROFILE_KEEP,
+                    ARCHIVE_INTERVAL)
+from archive import Archiver
+from broadcast import Broadcaster, BroadcastLock
+from calendar_http import setup_calendar_routes
+from database import db
+from fsm_storage import SQLiteStorage
+import handlers
+import keyboards
+from handlers import archive, calendar_feeds, register_handlers
+from keyboards import get_broadcast_progress_keyboard
+from metrics import setup_metrics, setup_metrics_routes
+from profiling import setup_profiling
+from reminders import ReminderScheduler
+from scheduler import setup_scheduler
+from send_queue import SendQueue
+from sharding import ChatOrderedFeeder, UpdateReceiver, consume_updates, shard_for
+from utils import format_reminder
+from webhook import create_webhook_app, set_webhook
 
 # Настройка логирования
 logging.basicConfig(
@@ -22,41 +51,291 @@ logger = logging.getLogger(__name__)
 
 # Инициализация бота и диспетчера
 bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-storage = MemoryStorage()
+if FSM_STORAGE == 'sqlite':
+    storage = SQLiteStorage(FSM_DATABASE_FILE, ttl=FSM_STATE_TTL, cache_size=FSM_CACHE_SIZE)
+else:
+    storage = MemoryStorage()
 dp = Dispatcher(storage=storage)
 
+# Сколько обновлений принимается в работу одновременно. С планировщиком
+# часть из них ждёт в очередях чатов, а число работающих обработчиков
+# ограничивает сам планировщик
+UPDATE_TASKS_LIMIT = MAX_PENDING_UPDATES if CHAT_QUEUE_DEPTH > 0 else MAX_CONCURRENT_UPDATES
+
+# Число процессов бота: при WORKERS > 1 - приёмник и обработчики
+PROCESSES = WORKERS + 1 if WORKERS > 1 else 1
+
+# Очередь исходящих сообщений с учётом лимитов Telegram
+# (доступна обработчикам как параметр send_queue); общий лимит
+# бота делится между процессами, у каждого своя очередь
+send_queue = SendQueue(
+    global_rate=SEND_GLOBAL_RATE / PROCESSES,
+    chat_rate=SEND_CHAT_RATE,
+    group_rate=SEND_GROUP_RATE,
+    concurrency=SEND_CONCURRENCY,
+    max_retries=SEND_MAX_RETRIES
+)
+dp['send_queue'] = send_queue
+
+# Рассылка всем пользователям (доступна обработчикам как параметр broadcaster)
+broadcaster = Broadcaster(
+    db, send_queue, BROADCAST_STATE_FILE,
+    concurrency=BROADCAST_CONCURRENCY,
+    progress_markup=get_broadcast_progress_keyboard(),
+    # Файл состояния общий для всех обработчиков: рассылка идёт в одном из них
+    lock=BroadcastLock(f"{BROADCAST_STATE_FILE}.lock") if WORKERS > 1 else None
+)
+dp['broadcaster'] = broadcaster
+
 # Регистрация обработчиков
 register_handlers(dp)
+if CHAT_QUEUE_DEPTH > 0:
+    setup_scheduler(dp, max_active=MAX_CONCURRENT_UPDATES, max_chat_queue=CHAT_QUEUE_DEPTH,
+                    stale_after=STALE_CALLBACK_SECONDS)
+if METRICS_ENABLED:
+    setup_metrics(dp)
+if PROFILE_SLOW_UPDATE_MS > 0:
+    setup_profiling(dp, bot, db, [keyboards, handlers],
+                    threshold_ms=PROFILE_SLOW_UPDATE_MS, sample_rate=PROFILE_SAMPLE_RATE,
+                    directory=PROFILE_DIR, keep=PROFILE_KEEP)
+
+
+async def send_reminder(appointment: dict):
+    """Отправка напоминания пациенту через очередь (ошибки пишутся в лог)"""
+    send_queue.submit(SendMessage(chat_id=appointment['user_id'], text=format_reminder(appointment)))
+
+
+# Напоминания о приёме (очередь синхронизируется с базой через слушатель).
+# При WORKERS > 1 напоминания отправляет приёмник, а записи меняют
+# обработчики, поэтому очередь периодически перестраивается по базе
+reminders = ReminderScheduler(db, send_reminder, lead=REMINDER_HOURS * 3600,
+                              refresh_interval=60 if WORKERS > 1 else None,
+                              state_file=REMINDER_STATE_FILE)
+
+# Перенос прошедших и отменённых записей в архив (при WORKERS > 1 - в приёмнике)
+archiver = Archiver(db, archive, interval=ARCHIVE_INTERVAL)
+
+# Встроенный HTTP-сервер в режиме polling (нужен только для дополнительных маршрутов)
+http_runner = None
+
+
+def setup_http_routes(app: web.Application) -> bool:
+    """Дополнительные HTTP-маршруты встроенного сервера; True, если они есть"""
+    has_routes = False
+    if CALENDAR_FEED_SECRET:
+        setup_calendar_routes(app, calendar_feeds)
+        has_routes = True
+    if METRICS_ENABLED:
+        setup_metrics_routes(app)
+        has_routes = True
+    return has_routes
+
+
+async def start_site(app: web.Application, port: int = WEBAPP_PORT) -> web.AppRunner:
+    """Запуск aiohttp-приложения на встроенном сервере"""
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, WEBAPP_HOST, port).start()
+    logger.info("HTTP-сервер запущен на %s:%s", WEBAPP_HOST, port)
+    return runner
+
+
+async def start_http_server():
+    """Запуск встроенного HTTP-сервера в режиме polling"""
+    global http_runner
+    app = web.Application()
+    if not setup_http_routes(app):
+        return
+    http_runner = await start_site(app)
+
+
+# Фоновые задачи запуска: цикл событий хранит на задачи только слабые
+# ссылки, поэтому без этого набора задача могла бы быть удалена до завершения
+background_tasks = set()
+
+
+def run_in_background(coro) -> asyncio.Task:
+    """Запуск задачи в фоне с сохранением ссылки до её завершения"""
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+
+async def notify_admins(text: str):
+    """Сообщение всем администраторам через очередь отправки"""
+    notifications = [send_queue.submit(SendMessage(chat_id=admin_id, text=text))
+                     for admin_id in ADMIN_IDS]
+    results = await asyncio.gather(*notifications, return_exceptions=True)
+    failed = sum(isinstance(result, BaseException) for result in results)
+    if failed:
+        logger.warning("Не удалось уведомить администраторов: %d из %d", failed, len(ADMIN_IDS))
 
 
 async def on_startup():
     """Действия при запуске бота"""
     logger.info("Бот запущен")
-    cleanup_temp_files()
+    # Данные читаются до приёма первого обновления
+    await db.open()
+    send_queue.start(bot)
+    if ASYNC_WRITES:
+        db.start_writer(delay=WRITE_COALESCE_DELAY)
+    if BOT_MODE == 'webhook':
+        await set_webhook(bot, dp)
+    else:
+        await start_http_server()
+    if REMINDER_HOURS > 0:
+        reminders.start()
+    if ARCHIVE_INTERVAL > 0:
+        archiver.start()
+    # Продолжаем рассылку, прерванную остановкой бота
+    broadcaster.resume()
 
-    from config import ADMIN_IDS
-    for admin_id in ADMIN_IDS:
-        try:
-            await bot.send_message(admin_id, "✅ Бот клиники успешно запущен!")
-        except:
-            pass
+    # Уведомления отправляются в фоне, повторы при ошибках не задерживают запуск
+    run_in_background(notify_admins("✅ Бот клиники успешно запущен!"))
 
 
 async def on_shutdown():
     """Действия при остановке бота"""
     logger.info("Бот остановлен")
-    cleanup_temp_files()
+    await reminders.stop()
+    await archiver.stop()
+    # Курсор рассылки сохраняется до остановки очереди отправки
+    await broadcaster.shutdown()
+    await send_queue.stop()
+    # Дописываем на диск изменения, ещё не сброшенные фоновой задачей
+    await db.stop_writer()
+    if http_runner is not None:
+        await http_runner.cleanup()
     await bot.session.close()
 
 
+# Регистрация действий при запуске и остановке (вызываются из start_polling)
+dp.startup.register(on_startup)
+dp.shutdown.register(on_shutdown)
+
+
 async def main():
-    """Главная функция"""
-    await on_startup()
-    await dp.start_polling(bot)
+    """Главная функция (режим long polling)"""
+    # getUpdates не работает, пока у бота установлен вебхук
+    await bot.delete_webhook()
+    await dp.start_polling(bot, tasks_concurrency_limit=UPDATE_TASKS_LIMIT)
+
+
+def main_webhook():
+    """Запуск в режиме вебхука на встроенном aiohttp-сервере"""
+    app = create_webhook_app(dp, bot, max_concurrent_updates=UPDATE_TASKS_LIMIT)
+    setup_http_routes(app)
+    web.run_app(app, host=WEBAPP_HOST, port=WEBAPP_PORT)
+
+
+def run_worker(index: int, workers: int, updates_queue):
+    """Точка входа процесса-обработчика (WORKERS > 1)"""
+    # Ctrl+C получает вся группа процессов; обработчик останавливается
+    # по сигналу приёмника, дообработав свою очередь
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(worker_main(index, workers, updates_queue))
+
+
+async def worker_main(index: int, workers: int, updates_queue):
+    """Обработка обновлений своей доли чатов"""
+    global http_runner
+    logger.info("Обработчик %d запущен", index)
+    await db.open()
+    send_queue.start(bot)
+    if ASYNC_WRITES:
+        db.start_writer(delay=WRITE_COALESCE_DELAY)
+    # Прерванную рассылку продолжает обработчик чата администратора
+    broadcaster.resume(owns_chat=lambda chat_id: shard_for(chat_id, workers) == index)
+    if METRICS_ENABLED:
+        # Метрики обработчиков у каждого процесса свои
+        app = web.Application()
+        setup_metrics_routes(app)
+        http_runner = await start_site(app, WEBAPP_PORT + 1 + index)
+
+    # Порядок внутри чата при включённом планировщике соблюдает он
+    feeder = ChatOrderedFeeder(dp, bot, max_concurrent=UPDATE_TASKS_LIMIT,
+                               ordered=CHAT_QUEUE_DEPTH == 0)
+    try:
+        await consume_updates(updates_queue, feeder)
+    finally:
+        await broadcaster.shutdown()
+        await send_queue.stop()
+        await db.stop_writer()
+        if http_runner is not None:
+            await http_runner.cleanup()
+        await storage.close()
+        await bot.session.close()
+        logger.info("Обработчик %d остановлен", index)
+
+
+async def receiver_main(receiver: UpdateReceiver):
+    """Приём обновлений, напоминания и HTTP-маршруты (WORKERS > 1)"""
+    logger.info("Бот запущен: приёмник и %d обработчиков", WORKERS)
+    await db.open()
+    send_queue.start(bot)
+    if REMINDER_HOURS > 0:
+        reminders.start()
+    if ARCHIVE_INTERVAL > 0:
+        archiver.start()
+    app = web.Application()
+    has_routes = setup_http_routes(app)
+    if BOT_MODE == 'webhook':
+        receiver.setup_webhook_route(app, WEBHOOK_PATH, WEBHOOK_SECRET or None)
+        has_routes = True
+    runner = await start_site(app) if has_routes else None
+    run_in_background(notify_admins("✅ Бот клиники успешно запущен!"))
+    try:
+        if BOT_MODE == 'webhook':
+            await set_webhook(bot, dp)
+            await asyncio.Event().wait()
+        else:
+            await bot.delete_webhook()
+            await receiver.poll(bot, dp.resolve_used_update_types())
+    finally:
+        await reminders.stop()
+        await archiver.stop()
+        await send_queue.stop()
+        if runner is not None:
+            await runner.cleanup()
+        await bot.session.close()
+
+
+def main_sharded():
+    """Запуск приёмника и WORKERS процессов-обработчиков.
+
+    Обновления одного чата всегда попадают в один обработчик, поэтому
+    порядок и состояние диалога сохраняются. Процессы работают с общей
+    базой SQLite (записи, состояния FSM и удержания слотов).
+    """
+    if FSM_STORAGE != 'sqlite':
+        raise ValueError("При WORKERS > 1 нужно FSM_STORAGE=sqlite")
+    context = multiprocessing.get_context('spawn')
+    queues = [context.Queue(WORKER_QUEUE_SIZE) for _ in range(WORKERS)]
+    workers = [context.Process(target=run_worker, args=(index, WORKERS, updates_queue),
+                               name=f"worker-{index}")
+               for index, updates_queue in enumerate(queues)]
+    for worker in workers:
+        worker.start()
+    try:
+        asyncio.run(receiver_main(UpdateReceiver(queues)))
+    finally:
+        for updates_queue in queues:
+            updates_queue.put(None)
+        for worker in workers:
+            worker.join(timeout=30)
+            if worker.is_alive():
+                logger.warning("Обработчик %s не остановился, завершаем", worker.name)
+                worker.terminate()
 
 
 if __name__ == '__main__':
     try:
-        asyncio.run(main())
+        if WORKERS > 1:
+            main_sharded()
+        elif BOT_MODE == 'webhook':
+            main_webhook()
+        else:
+            asyncio.run(main())
     except KeyboardInterrupt:
         logger.info("Бот остановлен пользователем")
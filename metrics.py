@@ -0,0 +1,239 @@
+import bisect
+import functools
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Sequence, Tuple
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.dispatcher.event.bases import UNHANDLED, SkipHandler
+from aiogram.types import TelegramObject, Update
+from aiohttp import web
+
+from callback_router import current_handler
+
+# Метрики в текстовом формате Prometheus без внешних зависимостей:
+# счётчики и гистограммы с метками, общий реестр и маршрут /metrics.
+
+# Границы гистограмм времени (секунды) и длины обхода (элементы)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 10, 100, 1000, 10000, 100000, 1000000)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names: Sequence[str], values: Tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    """Счётчик с метками"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> Iterable[str]:
+        for labels, value in sorted(self._values.items()):
+            yield f"{self.name}{_labels(self.labelnames, labels)} {value}"
+
+
+class Histogram:
+    """Гистограмма с метками: число наблюдений по корзинам, сумма и количество"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # метки -> [счётчики корзин (последняя - +Inf), сумма]
+        self._values: Dict[Tuple, List] = {}
+
+    def observe(self, value: float, *labels):
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        # Корзина - первая граница, не меньшая значения; счётчики накопительные
+        # только при выводе, поэтому наблюдение стоит одного bisect
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def samples(self) -> Iterable[str]:
+        for labels, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float('inf') else f'le="{float(bound)!r}"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {total}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}"
+
+
+class Registry:
+    """Набор метрик, выводимых на /metrics"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# Обработчики
+UPDATES = REGISTRY.register(Counter(
+    'bot_updates_total', "Полученные обновления по типу и результату обработки (true, false, error)",
+    ('type', 'handled')))
+HANDLER_DURATION = REGISTRY.register(Histogram(
+    'bot_handler_duration_seconds', "Время обработки обновления обработчиком",
+    ('handler',)))
+HANDLER_ERRORS = REGISTRY.register(Counter(
+    'bot_handler_errors_total', "Исключения в обработчиках", ('handler', 'error')))
+UPDATES_DROPPED = REGISTRY.register(Counter(
+    'bot_updates_dropped_total', "Нажатия кнопок, отклонённые планировщиком обновлений",
+    ('reason',)))
+
+# Хранилище
+DB_WRITE_DURATION = REGISTRY.register(Histogram(
+    'db_write_duration_seconds', "Время записи данных на диск (copy - копирование "
+    "данных в цикле событий перед записью в потоке)", ('operation',)))
+DB_BYTES_WRITTEN = REGISTRY.register(Counter(
+    'db_bytes_written_total', "Записано байт на диск", ('operation',)))
+DB_SCAN_LENGTH = REGISTRY.register(Histogram(
+    'db_scan_length', "Число элементов, пройденных за один обход данных", ('operation',),
+    buckets=SIZE_BUCKETS))
+
+
+def observe_scan(operation: str):
+    """Декоратор генератора: длина обхода попадает в DB_SCAN_LENGTH"""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            scanned = 0
+            try:
+                for item in func(*args, **kwargs):
+                    scanned += 1
+                    yield item
+            finally:
+                # Учитывается и обход, прерванный вызывающим
+                DB_SCAN_LENGTH.observe(scanned, operation)
+        return wrapper
+
+    return decorator
+
+
+def handler_name(data: Dict[str, Any]) -> str:
+    """Имя обработчика, выбранного диспетчером (с учётом CallbackRouter)"""
+    handler = current_handler.get() or data['handler'].callback
+    return getattr(handler, '__name__', repr(handler))
+
+
+class HandlerScopeMiddleware(BaseMiddleware):
+    """Область current_handler на время вызова обработчика.
+
+    Метрики и трассировка читают имя обработчика после его завершения,
+    поэтому значение сбрасывает один общий внешний слой, а не каждая из них.
+    """
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        token = current_handler.set(None)
+        try:
+            return await handler(event, data)
+        finally:
+            current_handler.reset(token)
+
+
+_handler_scope = HandlerScopeMiddleware()
+
+
+def setup_handler_scope(dp: Dispatcher):
+    """Подключение области current_handler (один раз, до метрик и трассировки)"""
+    for observer in dp.observers.values():
+        if observer.event_name != 'update' and _handler_scope not in observer.middleware:
+            observer.middleware(_handler_scope)
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Время, число обновлений и ошибки по каждому обработчику.
+
+    Подключается внутренним middleware к наблюдателям событий, поэтому
+    вызывается только для обновлений, для которых найден обработчик.
+    Для callback-запросов имя берётся из маршрута CallbackRouter.
+    """
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        started = time.perf_counter()
+        try:
+            result = await handler(event, data)
+        except SkipHandler:
+            # Обработчик отказался от обновления - учтётся следующий
+            raise
+        except Exception as e:
+            name = handler_name(data)
+            HANDLER_DURATION.observe(time.perf_counter() - started, name)
+            HANDLER_ERRORS.inc(name, type(e).__name__)
+            raise
+        else:
+            HANDLER_DURATION.observe(time.perf_counter() - started, handler_name(data))
+            return result
+
+
+class UpdatesMiddleware(BaseMiddleware):
+    """Подсчёт всех обновлений, включая оставшиеся без обработчика
+    и завершившиеся ошибкой (handled="error")"""
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: Update, data: Dict[str, Any]) -> Any:
+        handled = 'error'
+        try:
+            result = await handler(event, data)
+            handled = 'false' if result is UNHANDLED else 'true'
+            return result
+        finally:
+            UPDATES.inc(event.event_type, handled)
+
+
+def setup_metrics(dp: Dispatcher):
+    """Подключение сбора метрик к диспетчеру"""
+    dp.update.outer_middleware(UpdatesMiddleware())
+    setup_handler_scope(dp)
+    metrics_middleware = MetricsMiddleware()
+    for observer in dp.observers.values():
+        if observer.event_name != 'update':
+            observer.middleware(metrics_middleware)
+
+
+def setup_metrics_routes(app: web.Application, path: str = '/metrics'):
+    """Маршрут с метриками в текстовом формате Prometheus"""
+
+    async def handle_metrics(request: web.Request) -> web.Response:
+        return web.Response(body=REGISTRY.render().encode('utf-8'),
+                            headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+    app.router.add_get(path, handle_metrics)
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Перенос данных из appointments.json в базу SQLite.
+
+Файл читается потоково: записи и пользователи обрабатываются по одной
+и вставляются пачками, поэтому весь JSON не загружается в память.
+Двоичный снимок (SNAPSHOT_FORMAT=binary) читается по столбцам. Если
+рядом со снимком есть непустой журнал (appointments.json.log при
+DATABASE_BACKEND=journal), данные загружаются целиком с применением
+журнала, как при запуске бота.
+
+Пример:
+    python migrate_to_sqlite.py appointments.json appointments.db
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+
+import snapshot
+from sqlite_database import SQLiteDatabase
+
+BATCH_SIZE = 1000
+CHUNK_SIZE = 64 * 1024
+
+
+class JSONStreamReader:
+    """Потоковое чтение JSON-документа с верхним уровнем-объектом"""
+
+    def __init__(self, f, chunk_size: int = CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self) -> bool:
+        """Дочитывание следующего фрагмента файла в буфер"""
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def _peek(self) -> str:
+        """Следующий непробельный символ ('' в конце файла)"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ''
+
+    def _expect(self, char: str):
+        found = self._peek()
+        if found != char:
+            raise ValueError(f"Ожидался символ {char!r}, найден {found!r}")
+        self.pos += 1
+
+    def _skip(self, char: str) -> bool:
+        if self._peek() == char:
+            self.pos += 1
+            return True
+        return False
+
+    def _value(self):
+        """Разбор одного JSON-значения с дочитыванием буфера при необходимости"""
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # Число на границе буфера могло быть обрезано - дочитываем и повторяем
+            if end == len(self.buf) and not self.eof and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def sections(self):
+        """Генератор пар (ключ, элемент) верхнего уровня.
+
+        Для массивов возвращается каждый элемент, для объектов - каждая
+        пара (ключ, значение), для остальных значений - само значение.
+        """
+        self._expect('{')
+        if self._skip('}'):
+            return
+        while True:
+            key = self._value()
+            self._expect(':')
+            if self._skip('['):
+                if not self._skip(']'):
+                    while True:
+                        yield key, self._value()
+                        if not self._skip(','):
+                            self._expect(']')
+                            break
+            elif self._skip('{'):
+                if not self._skip('}'):
+                    while True:
+                        member = self._value()
+                        self._expect(':')
+                        yield key, (member, self._value())
+                        if not self._skip(','):
+                            self._expect('}')
+                            break
+            else:
+                yield key, self._value()
+            if not self._skip(','):
+                self._expect('}')
+                return
+
+
+def source_sections(source: str):
+    """Разделы исходного файла в виде пар (раздел, элемент), как у JSONStreamReader"""
+    journal = f"{source}.log"
+    if os.path.exists(journal) and os.path.getsize(journal):
+        # DATABASE_BACKEND=journal: изменения после последнего сжатия есть
+        # только в журнале, поэтому данные загружаются с его применением
+        from database import JournaledDatabase
+        database = JournaledDatabase(source, fsync=False)
+        database.close()
+        data = database.data
+    elif snapshot.is_snapshot(source):
+        data = snapshot.load(source)
+    else:
+        with open(source, 'r', encoding='utf-8') as f:
+            yield from JSONStreamReader(f).sections()
+        return
+    for appointment in data['appointments']:
+        yield 'appointments', appointment
+    for item in data['users'].items():
+        yield 'users', item
+    yield 'next_id', data['next_id']
+
+
+def migrate(source: str, target: str) -> dict:
+    """Перенос данных из JSON-файла source в базу SQLite target"""
+    database = SQLiteDatabase(target)
+    conn = database.conn
+    stats = {'users': 0, 'appointments': 0, 'conflicts': 0}
+    next_id = 1
+
+    existing = conn.execute(
+        "SELECT (SELECT COUNT(*) FROM users) + (SELECT COUNT(*) FROM appointments)"
+    ).fetchone()[0]
+    if existing:
+        database.close()
+        raise RuntimeError(f"База {target} уже содержит данные")
+
+    users_batch = []
+    appointments_batch = []
+
+    def flush():
+        conn.executemany(
+            "INSERT OR IGNORE INTO users (user_id, username, first_name, registered_at, blocked) "
+            "VALUES (?, ?, ?, ?, ?)",
+            users_batch
+        )
+        for row in appointments_batch:
+            try:
+                conn.execute(
+                    "INSERT INTO appointments (id, user_id, patient_name, doctor, procedure, "
+                    "date, time, created_at, status) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    row
+                )
+            except sqlite3.IntegrityError:
+                # Двойная запись на один слот в старых данных: первая запись
+                # остаётся активной, остальные помечаются для ручного разбора
+                conn.execute(
+                    "INSERT INTO appointments (id, user_id, patient_name, doctor, procedure, "
+                    "date, time, created_at, status) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'conflict')",
+                    row[:-1]
+                )
+                stats['conflicts'] += 1
+                print(f"⚠️ Запись #{row[0]} занимает уже занятый слот, статус 'conflict'",
+                      file=sys.stderr)
+        users_batch.clear()
+        appointments_batch.clear()
+
+    with conn:
+        for key, item in source_sections(source):
+            if key == 'appointments':
+                appointments_batch.append((
+                    item['id'], item['user_id'], item['patient_name'], item['doctor'],
+                    item['procedure'], item['date'], item['time'],
+                    item['created_at'], item['status']
+                ))
+                stats['appointments'] += 1
+                next_id = max(next_id, item['id'] + 1)
+            elif key == 'users':
+                user_id, user = item
+                users_batch.append((
+                    int(user_id), user['username'], user['first_name'], user['registered_at'],
+                    int(bool(user.get('blocked')))
+                ))
+                stats['users'] += 1
+            elif key == 'next_id':
+                next_id = max(next_id, item)
+            if len(users_batch) + len(appointments_batch) >= BATCH_SIZE:
+                flush()
+        flush()
+
+        # Новые записи должны продолжать нумерацию исходного файла
+        updated = conn.execute(
+            "UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'appointments'",
+            (next_id - 1,)
+        ).rowcount
+        if not updated:
+            conn.execute(
+                "INSERT INTO sqlite_sequence (name, seq) VALUES ('appointments', ?)",
+                (next_id - 1,)
+            )
+
+    database.close()
+    stats['next_id'] = next_id
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Перенос appointments.json в SQLite")
+    parser.add_argument('source', nargs='?', default='appointments.json',
+                        help="исходный JSON-файл")
+    parser.add_argument('target', nargs='?', default='appointments.db',
+                        help="файл базы SQLite")
+    args = parser.parse_args()
+
+    stats = migrate(args.source, args.target)
+    print(f"✅ Перенесено пользователей: {stats['users']}, записей: {stats['appointments']} "
+          f"(конфликтов: {stats['conflicts']}), следующий номер записи: {stats['next_id']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,29 @@
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+
+class AppointmentsPage(NamedTuple):
+    """Страница списка записей, упорядоченного по дате, времени и номеру.
+
+    Курсоры - номера первой и последней записи страницы; None означает,
+    что в этом направлении записей больше нет.
+    """
+    items: List[Dict]
+    prev_cursor: Optional[int]
+    next_cursor: Optional[int]
+
+
+class UsersPage(NamedTuple):
+    """Страница списка пользователей: пары (user_id, данные) и курсоры соседних страниц"""
+    items: List[Tuple[str, Dict]]
+    prev_cursor: Optional[int]
+    next_cursor: Optional[int]
+
+
+def date_key(date: str) -> str:
+    """Дата 'ДД.ММ.ГГГГ' в виде 'ГГГГММДД' для сортировки"""
+    return date[6:10] + date[3:5] + date[0:2]
+
+
+def order_key(appointment: Dict) -> Tuple[str, str, int]:
+    """Ключ упорядочивания записи в списках"""
+    return date_key(appointment['date']), appointment['time'], appointment['id']
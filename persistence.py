@@ -0,0 +1,131 @@
+import asyncio
+import logging
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class WriteError(Exception):
+    """Изменения не удалось записать на диск (см. AsyncWriter.durable)"""
+
+
+class AsyncWriter:
+    """Фоновая запись изменений базы данных.
+
+    Изменения применяются к данным в памяти сразу, а на диск их сбрасывает
+    отдельная задача: все изменения, накопившиеся за время ``delay``,
+    записываются одной групповой операцией через
+    ``database._write_records_async``. При ошибке запись повторяется;
+    после ``fail_after`` неудач подряд ожидающие durable() получают
+    WriteError (изменения остаются в очереди и повторяются дальше), а во
+    время остановки попыток не больше ``close_retries``, чтобы stop() не
+    зависал при постоянно недоступном диске.
+    """
+
+    def __init__(self, database, delay: float = 0.05, retry_delay: float = 1.0,
+                 fail_after: int = 5, close_retries: int = 3):
+        self.database = database
+        self.delay = delay
+        self.retry_delay = retry_delay
+        self.fail_after = fail_after
+        self.close_retries = close_retries
+        self._pending: List[Dict] = []
+        # Порядковые номера отправленных и уже записанных изменений
+        self._submitted = 0
+        self._written = 0
+        self._waiters: List[Tuple[int, asyncio.Future]] = []
+        self._wakeup = asyncio.Event()
+        self._closing = False
+        self._task = None
+
+    def start(self):
+        """Запуск фоновой задачи записи"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Запись оставшихся изменений и остановка фоновой задачи"""
+        if self._task is None:
+            return
+        self._closing = True
+        self._wakeup.set()
+        await self._task
+        self._task = None
+
+    def submit(self, record: Dict):
+        """Постановка изменения в очередь на запись"""
+        self._pending.append(record)
+        self._submitted += 1
+        self._wakeup.set()
+
+    async def durable(self):
+        """Ожидание записи на диск всех изменений, отправленных до вызова.
+
+        WriteError - запись раз за разом не удаётся (диск заполнен,
+        недоступен для записи и т. п.).
+        """
+        target = self._submitted
+        if self._written >= target:
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((target, future))
+        await future
+
+    async def _run(self):
+        failures = close_failures = 0
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if not self._pending:
+                if self._closing:
+                    return
+                continue
+            if self.delay and not self._closing:
+                # Даём накопиться пачке изменений, чтобы записать их разом
+                await asyncio.sleep(self.delay)
+
+            records, self._pending = self._pending, []
+            target = self._written + len(records)
+            try:
+                await self.database._write_records_async(records)
+            except Exception:
+                self._pending[:0] = records
+                failures += 1
+                if failures % self.fail_after == 0:
+                    # Обработчики не должны ждать диск бесконечно
+                    self._fail_waiters()
+                if self._closing:
+                    close_failures += 1
+                    if close_failures > self.close_retries:
+                        logger.exception("Ошибка записи изменений на диск при остановке, "
+                                         "не записано изменений: %d", len(self._pending))
+                        self._fail_waiters()
+                        return
+                logger.exception("Ошибка записи изменений на диск, повтор через %s с",
+                                 self.retry_delay)
+                await asyncio.sleep(self.retry_delay)
+                self._wakeup.set()
+                continue
+
+            failures = 0
+            self._written = target
+            self._notify_waiters()
+            if self._pending or self._closing:
+                self._wakeup.set()
+
+    def _notify_waiters(self):
+        waiting = []
+        for target, future in self._waiters:
+            if target <= self._written:
+                if not future.done():
+                    future.set_result(None)
+            else:
+                waiting.append((target, future))
+        self._waiters = waiting
+
+    def _fail_waiters(self):
+        error = WriteError("Изменения не записаны на диск")
+        for _, future in self._waiters:
+            if not future.done():
+                future.set_exception(error)
+        self._waiters = []
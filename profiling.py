@@ -0,0 +1,270 @@
+import cProfile
+import functools
+import inspect
+import logging
+import os
+import random
+import time
+from contextvars import ContextVar
+from datetime import datetime
+from types import ModuleType
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods.base import TelegramMethod, TelegramType
+from aiogram.types import TelegramObject, Update
+
+from metrics import handler_name, setup_handler_scope
+
+logger = logging.getLogger(__name__)
+
+# Разбивка времени обновления: код обработчика (и всё остальное), вызовы
+# базы данных, построение клавиатур, ожидание ответов Bot API
+CATEGORIES = ('handler', 'db', 'keyboards', 'api')
+
+
+class UpdateTrace:
+    """Время обработки одного обновления по категориям.
+
+    Время каждой категории - собственное: пока идёт вызов базы внутри
+    построения клавиатуры, время идёт базе, а не клавиатуре. Ожидание
+    внутри вызова (await) засчитывается категории этого вызова.
+    """
+
+    __slots__ = ('totals', 'calls', 'handler', 'finished', '_stack', '_category', '_mark')
+
+    def __init__(self, now: float):
+        self.totals: Dict[str, float] = dict.fromkeys(CATEGORIES, 0.0)
+        self.calls: Dict[str, int] = dict.fromkeys(CATEGORIES, 0)
+        self.handler: Optional[str] = None
+        self.finished = False
+        self._stack = []
+        self._category = 'handler'
+        self._mark = now
+
+    def enter(self, category: str, now: float):
+        self.totals[self._category] += now - self._mark
+        if category != self._category:
+            self.calls[category] += 1
+        self._stack.append(self._category)
+        self._category = category
+        self._mark = now
+
+    def exit(self, now: float):
+        self.totals[self._category] += now - self._mark
+        self._category = self._stack.pop()
+        self._mark = now
+
+    def finish(self, now: float):
+        self.totals[self._category] += now - self._mark
+        self.finished = True
+
+
+# Трасса обновления, обрабатываемого в текущем контексте
+current_trace: ContextVar[Optional[UpdateTrace]] = ContextVar('current_trace', default=None)
+
+
+def _active_trace() -> Optional[UpdateTrace]:
+    trace = current_trace.get()
+    # Задачи, запущенные из обработчика, наследуют контекст и могут
+    # работать дольше самого обновления
+    return None if trace is None or trace.finished else trace
+
+
+def traced(func: Callable, category: str) -> Callable:
+    """Обёртка функции, засчитывающая её время категории category"""
+    if inspect.isgeneratorfunction(func):
+        @functools.wraps(func)
+        def generator_wrapper(*args, **kwargs):
+            iterator = func(*args, **kwargs)
+            try:
+                while True:
+                    trace = _active_trace()
+                    if trace is None:
+                        yield from iterator
+                        return
+                    trace.enter(category, time.perf_counter())
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        return
+                    finally:
+                        trace.exit(time.perf_counter())
+                    yield item
+            finally:
+                iterator.close()
+        return generator_wrapper
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def coroutine_wrapper(*args, **kwargs):
+            trace = _active_trace()
+            if trace is None:
+                return await func(*args, **kwargs)
+            trace.enter(category, time.perf_counter())
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                trace.exit(time.perf_counter())
+        return coroutine_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        trace = _active_trace()
+        if trace is None:
+            return func(*args, **kwargs)
+        trace.enter(category, time.perf_counter())
+        try:
+            return func(*args, **kwargs)
+        finally:
+            trace.exit(time.perf_counter())
+    return wrapper
+
+
+def trace_database(database):
+    """Подмена публичных методов экземпляра базы на отслеживаемые"""
+    for name in dir(type(database)):
+        if name.startswith('_'):
+            continue
+        method = getattr(database, name)
+        if inspect.ismethod(method):
+            setattr(database, name, traced(method, 'db'))
+
+
+def trace_keyboards(modules: Iterable[ModuleType]):
+    """Подмена функций построения клавиатур во всех модулях, которые их импортировали"""
+    replaced = {}
+    for module in modules:
+        for name, value in list(vars(module).items()):
+            if not (name.startswith('get_') and name.endswith('_keyboard') and callable(value)):
+                continue
+            if id(value) not in replaced:
+                replaced[id(value)] = traced(value, 'keyboards')
+            setattr(module, name, replaced[id(value)])
+
+
+class TraceRequestMiddleware(BaseRequestMiddleware):
+    """Время ожидания ответов Bot API в трассе обновления"""
+
+    async def __call__(self, make_request: NextRequestMiddlewareType[TelegramType],
+                       bot: Bot, method: TelegramMethod[TelegramType]) -> Any:
+        trace = _active_trace()
+        if trace is None:
+            return await make_request(bot, method)
+        trace.enter('api', time.perf_counter())
+        try:
+            return await make_request(bot, method)
+        finally:
+            trace.exit(time.perf_counter())
+
+
+class TraceHandlerMiddleware(BaseMiddleware):
+    """Запоминает имя обработчика (с учётом CallbackRouter) в трассе.
+
+    current_handler не устанавливает и не сбрасывает: это делает общий
+    HandlerScopeMiddleware, иначе сброс здесь скрыл бы имя от метрик.
+    """
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        try:
+            return await handler(event, data)
+        finally:
+            trace = current_trace.get()
+            if trace is not None:
+                trace.handler = handler_name(data)
+
+
+class SlowUpdateProfiler(BaseMiddleware):
+    """Журнал медленных обновлений с разбивкой времени и дампы cProfile.
+
+    Обновления дольше threshold_ms пишутся в журнал с разбивкой на
+    обработчик, базу, клавиатуры и Bot API. Доля sample_rate обновлений
+    выполняется под cProfile; если такое обновление оказалось медленным,
+    профиль сохраняется в directory (хранятся последние keep файлов).
+    cProfile профилирует поток целиком, поэтому в дамп попадают и другие
+    обновления, выполнявшиеся в это время; одновременно профилируется
+    не больше одного обновления.
+    """
+
+    def __init__(self, threshold_ms: float, sample_rate: float = 0.0,
+                 directory: str = 'profiles', keep: int = 50):
+        self.threshold = threshold_ms / 1000
+        self.sample_rate = sample_rate
+        self.directory = directory
+        self.keep = keep
+        self._profiling = False
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: Update, data: Dict[str, Any]) -> Any:
+        started = time.perf_counter()
+        trace = UpdateTrace(started)
+        token = current_trace.set(trace)
+
+        profiler = None
+        if self.sample_rate and not self._profiling and random.random() < self.sample_rate:
+            profiler = cProfile.Profile()
+            self._profiling = True
+            profiler.enable()
+        try:
+            return await handler(event, data)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                self._profiling = False
+            now = time.perf_counter()
+            trace.finish(now)
+            current_trace.reset(token)
+            if now - started >= self.threshold:
+                self._report(event, trace, now - started, profiler)
+
+    def _report(self, event: Update, trace: UpdateTrace, elapsed: float,
+                profiler: Optional[cProfile.Profile]):
+        totals, calls = trace.totals, trace.calls
+        logger.warning(
+            "Медленное обновление %s (%s, %s): %.1f мс - обработчик %.1f мс, "
+            "база %.1f мс (%d вызовов), клавиатуры %.1f мс (%d), Bot API %.1f мс (%d запросов)",
+            event.update_id, event.event_type, trace.handler or '-', elapsed * 1000,
+            totals['handler'] * 1000, totals['db'] * 1000, calls['db'],
+            totals['keyboards'] * 1000, calls['keyboards'], totals['api'] * 1000, calls['api']
+        )
+        if profiler is not None:
+            self._dump(profiler, event, trace)
+
+    def _dump(self, profiler: cProfile.Profile, event: Update, trace: UpdateTrace):
+        """Сохранение профиля с удалением самых старых файлов"""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            filename = (f"{datetime.now():%Y%m%d_%H%M%S_%f}_{event.update_id}_"
+                        f"{trace.handler or event.event_type}.prof")
+            profiler.dump_stats(os.path.join(self.directory, filename))
+            # Имена начинаются с времени, поэтому сортировка - по возрасту
+            dumps = sorted(name for name in os.listdir(self.directory) if name.endswith('.prof'))
+            for name in dumps[:max(len(dumps) - self.keep, 0)]:
+                os.remove(os.path.join(self.directory, name))
+        except OSError as e:
+            logger.error("Не удалось сохранить профиль обновления %s: %s", event.update_id, e)
+        else:
+            logger.warning("Профиль обновления %s сохранён в %s", event.update_id, filename)
+
+
+def setup_profiling(dp: Dispatcher, bot: Bot, database, keyboard_modules: Iterable[ModuleType],
+                    threshold_ms: float, sample_rate: float = 0.0,
+                    directory: str = 'profiles', keep: int = 50):
+    """Включение трассировки медленных обновлений.
+
+    Вызывается только в режиме отладки: обёртки методов базы, функций
+    клавиатур и запросов к Bot API устанавливаются здесь, поэтому без
+    этого вызова накладных расходов нет.
+    """
+    trace_database(database)
+    trace_keyboards(keyboard_modules)
+    bot.session.middleware(TraceRequestMiddleware())
+    dp.update.outer_middleware(SlowUpdateProfiler(threshold_ms, sample_rate, directory, keep))
+    setup_handler_scope(dp)
+    handler_middleware = TraceHandlerMiddleware()
+    for observer in dp.observers.values():
+        if observer.event_name != 'update':
+            observer.middleware(handler_middleware)
+    logger.info("Трассировка обновлений дольше %s мс включена", threshold_ms)
@@ -0,0 +1,197 @@
+import asyncio
+import heapq
+import json
+import logging
+import os
+import time as time_module
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pagination import date_key
+
+logger = logging.getLogger(__name__)
+
+# Максимальный сон планировщика: защищает от перевода системных часов
+MAX_SLEEP = 60.0
+
+
+def appointment_start(appointment: Dict) -> Optional[float]:
+    """Время начала приёма (timestamp) или None, если дата некорректна"""
+    try:
+        start = datetime.strptime(f"{appointment['date']} {appointment['time']}", "%d.%m.%Y %H:%M")
+    except (KeyError, ValueError):
+        return None
+    return start.timestamp()
+
+
+class ReminderScheduler:
+    """Напоминания пациентам за lead секунд до приёма.
+
+    Очередь напоминаний - куча (время напоминания, номер записи).
+    Словарь _due хранит актуальное время напоминания для каждой записи;
+    элементы кучи, которые с ним не совпадают (запись перенесли или
+    отменили), пропускаются при извлечении. Очередь обновляется через
+    подписку на изменения базы (add_listener), а фоновая задача спит до
+    ближайшего напоминания - записи целиком не просматриваются.
+
+    Если до приёма осталось меньше lead (поздняя запись или напоминание,
+    пропущенное, пока бот был остановлен), напоминание отправляется сразу.
+    Отправленные напоминания запоминаются в state_file, чтобы после
+    перестроения очереди или перезапуска они не повторялись.
+
+    Если записи меняют другие процессы (WORKERS > 1), слушатель их не
+    видит: тогда очередь перестраивается по базе раз в refresh_interval
+    секунд.
+    """
+
+    def __init__(self, database, send: Callable[[Dict], Awaitable], lead: float,
+                 clock: Callable[[], float] = time_module.time,
+                 refresh_interval: Optional[float] = None,
+                 state_file: Optional[str] = None):
+        self.database = database
+        self.send = send
+        self.lead = lead
+        self.clock = clock
+        self.refresh_interval = refresh_interval
+        self.state_file = state_file
+        # appointment_id -> начало приёма, о котором уже напомнили
+        self._sent: Dict[int, float] = self._load_sent()
+        self._next_refresh = float('inf')
+        self._heap: List[Tuple[float, int]] = []
+        # appointment_id -> время напоминания
+        self._due: Dict[int, float] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    def _load_sent(self) -> Dict[int, float]:
+        if not self.state_file or not os.path.exists(self.state_file):
+            return {}
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                sent = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Не удалось прочитать отправленные напоминания: %s", e)
+            return {}
+        now = self.clock()
+        return {int(key): start for key, start in sent.items() if start > now}
+
+    def _save_sent(self):
+        """Атомарная запись отправленных напоминаний (прошедшие приёмы отбрасываются)"""
+        now = self.clock()
+        self._sent = {key: start for key, start in self._sent.items() if start > now}
+        if not self.state_file:
+            return
+        temp_file = f"{self.state_file}.tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(self._sent, f)
+        os.replace(temp_file, self.state_file)
+
+    def _reminder_time(self, appointment: Dict) -> Optional[float]:
+        if appointment['status'] != 'active':
+            return None
+        start = appointment_start(appointment)
+        now = self.clock()
+        if start is None or start <= now or self._sent.get(appointment['id']) == start:
+            return None
+        return max(start - self.lead, now)
+
+    def schedule(self, appointment: Dict):
+        """Постановка, перенос или снятие напоминания по записи (слушатель базы)"""
+        appointment_id = appointment['id']
+        due = self._reminder_time(appointment)
+        if due is None:
+            self._due.pop(appointment_id, None)
+            return
+        if self._due.get(appointment_id) == due:
+            return
+
+        self._due[appointment_id] = due
+        heapq.heappush(self._heap, (due, appointment_id))
+        # Устаревшие элементы копятся при переносах - периодически сжимаем кучу
+        if len(self._heap) > 2 * len(self._due) + 1024:
+            self._heap = [(time, key) for key, time in self._due.items()]
+            heapq.heapify(self._heap)
+        # Будим задачу, только если новое напоминание стало ближайшим
+        if self._heap[0] == (due, appointment_id):
+            self._wakeup.set()
+
+    def rebuild(self):
+        """Построение очереди по активным будущим записям"""
+        first_date = datetime.fromtimestamp(self.clock()).strftime("%d.%m.%Y")
+        self._due = {}
+        for appointment in self.database.iter_upcoming_appointments(date_key(first_date)):
+            due = self._reminder_time(appointment)
+            if due is not None:
+                self._due[appointment['id']] = due
+        self._heap = [(time, key) for key, time in self._due.items()]
+        heapq.heapify(self._heap)
+        logger.info("Запланировано напоминаний: %d", len(self._due))
+
+    def start(self):
+        """Построение очереди и запуск фоновой задачи"""
+        if self._task is not None:
+            return
+        self.rebuild()
+        if self.refresh_interval:
+            self._next_refresh = self.clock() + self.refresh_interval
+        self.database.add_listener(self.schedule)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановка фоновой задачи"""
+        if self._task is None:
+            return
+        self.database.remove_listener(self.schedule)
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def _pop_due(self, now: float) -> List[int]:
+        """Номера записей, время напоминания которых наступило"""
+        ready = []
+        while self._heap and self._heap[0][0] <= now:
+            due, appointment_id = heapq.heappop(self._heap)
+            if self._due.get(appointment_id) == due:
+                del self._due[appointment_id]
+                ready.append(appointment_id)
+        return ready
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            if self.clock() >= self._next_refresh:
+                self.rebuild()
+                self._next_refresh = self.clock() + self.refresh_interval
+            sent = False
+            for appointment_id in self._pop_due(self.clock()):
+                appointment = self.database.get_appointment(appointment_id)
+                if not appointment or appointment['status'] != 'active':
+                    continue
+                # Отмечаем до отправки: изменение записи во время await не
+                # должно поставить напоминание в очередь повторно
+                self._sent[appointment_id] = appointment_start(appointment)
+                try:
+                    await self.send(appointment)
+                    sent = True
+                except Exception:
+                    self._sent.pop(appointment_id, None)
+                    logger.exception("Не удалось отправить напоминание по записи #%s", appointment_id)
+            if sent:
+                try:
+                    self._save_sent()
+                except OSError as e:
+                    logger.error("Не удалось сохранить отправленные напоминания: %s", e)
+
+            timeout = min(MAX_SLEEP, max(self._next_refresh - self.clock(), 0))
+            if self._heap:
+                timeout = min(max(self._heap[0][0] - self.clock(), 0), timeout)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,110 @@
+import heapq
+import time as time_module
+from typing import Dict, List, Optional, Tuple
+
+# Слот записи: (врач, дата, время)
+Slot = Tuple[str, str, str]
+
+
+class SlotUnavailableError(Exception):
+    """Слот уже занят активной записью"""
+
+
+class SlotReservations:
+    """Кратковременные удержания слотов на время оформления записи.
+
+    Каждый пользователь может удерживать не больше одного слота. Истёкшие
+    удержания снимаются через min-кучу по времени истечения: при каждой
+    операции из неё извлекаются только просроченные элементы.
+    """
+
+    def __init__(self, ttl: float = 300, clock=time_module.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self._holds: Dict[Slot, Tuple[int, float]] = {}
+        self._by_holder: Dict[int, Slot] = {}
+        self._expiry: List[Tuple[float, Slot, int]] = []
+
+    def __len__(self) -> int:
+        self._sweep()
+        return len(self._holds)
+
+    def _sweep(self):
+        """Снятие истёкших удержаний"""
+        now = self.clock()
+        while self._expiry and self._expiry[0][0] <= now:
+            expires_at, slot, holder = heapq.heappop(self._expiry)
+            # Элемент кучи мог устареть: удержание продлено или снято
+            if self._holds.get(slot) == (holder, expires_at):
+                del self._holds[slot]
+                del self._by_holder[holder]
+
+    def holder(self, slot: Slot) -> Optional[int]:
+        """Пользователь, удерживающий слот"""
+        self._sweep()
+        hold = self._holds.get(slot)
+        return hold[0] if hold else None
+
+    def hold(self, holder: int, slot: Slot) -> bool:
+        """Удержание слота (или продление своего удержания)"""
+        self._sweep()
+        hold = self._holds.get(slot)
+        if hold is not None and hold[0] != holder:
+            return False
+        previous = self._by_holder.get(holder)
+        if previous is not None and previous != slot:
+            del self._holds[previous]
+        expires_at = self.clock() + self.ttl
+        self._holds[slot] = (holder, expires_at)
+        self._by_holder[holder] = slot
+        heapq.heappush(self._expiry, (expires_at, slot, holder))
+        return True
+
+    def release(self, holder: int) -> Optional[Slot]:
+        """Снятие удержания пользователя"""
+        slot = self._by_holder.pop(holder, None)
+        if slot is not None:
+            del self._holds[slot]
+        return slot
+
+
+class ReservationMixin:
+    """Бронирование слотов через удержания для классов базы данных.
+
+    Класс базы данных должен создать ``self.reservations`` и реализовать
+    ``is_appointment_available`` и ``create_appointment`` (последний
+    выбрасывает SlotUnavailableError, если слот уже занят).
+    """
+
+    reservations: SlotReservations
+
+    def reserve_slot(self, user_id: int, doctor: str, date: str, time: str) -> bool:
+        """Удержание свободного слота на время подтверждения записи"""
+        if not self.is_appointment_available(doctor, date, time):
+            return False
+        return self.reservations.hold(user_id, (doctor, date, time))
+
+    def book_reserved_slot(self, user_id: int, patient_name: str,
+                           doctor: str, procedure: str,
+                           date: str, time: str) -> Optional[int]:
+        """Превращение удержания в запись.
+
+        Возвращает номер записи или None, если удержание истекло либо
+        слот успел занять кто-то другой.
+        """
+        slot = (doctor, date, time)
+        if self.reservations.holder(slot) != user_id:
+            return None
+        try:
+            appointment_id = self.create_appointment(
+                user_id, patient_name, doctor, procedure, date, time
+            )
+        except SlotUnavailableError:
+            return None
+        finally:
+            self.reservations.release(user_id)
+        return appointment_id
+
+    def release_slot(self, user_id: int):
+        """Отказ от удерживаемого слота"""
+        self.reservations.release(user_id)
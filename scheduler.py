@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import CallbackQuery, TelegramObject, Update
+
+from metrics import UPDATES_DROPPED
+
+logger = logging.getLogger(__name__)
+
+BUSY_TEXT = "⏳ Подождите, предыдущее действие ещё выполняется"
+
+
+class _ChatQueue:
+    """Очередь обновлений одного чата"""
+
+    __slots__ = ('tail', 'depth', 'callbacks')
+
+    def __init__(self):
+        # Завершается, когда обработано последнее принятое обновление чата
+        self.tail: Optional[asyncio.Future] = None
+        self.depth = 0
+        # (сообщение, данные кнопки) нажатий, ждущих или обрабатываемых
+        self.callbacks: Set[Tuple[Any, Optional[str]]] = set()
+
+
+class UpdateScheduler(BaseMiddleware):
+    """Планировщик обновлений: по порядку внутри чата, с общим ограничением.
+
+    Обновления одного чата обрабатываются по одному в порядке поступления,
+    поэтому быстрые нажатия не выполняют выбор времени и подтверждение
+    записи одновременно. Одновременно работает не больше max_active
+    обработчиков. Нажатие кнопки не обрабатывается, а получает ответ
+    «подождите», если такое же нажатие уже в очереди, если в очереди чата
+    уже max_chat_queue обновлений или если оно ждало дольше stale_after
+    секунд. Сообщения не отбрасываются: их ограничивает общий лимит
+    принятых в работу обновлений (см. main.py).
+    """
+
+    def __init__(self, max_active: int = 100, max_chat_queue: int = 5,
+                 stale_after: float = 10.0, busy_text: str = BUSY_TEXT,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_chat_queue = max_chat_queue
+        self.stale_after = stale_after
+        self.busy_text = busy_text
+        self._clock = clock
+        self._active = asyncio.Semaphore(max_active)
+        self._chats: Dict[int, _ChatQueue] = {}
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: Update, data: Dict[str, Any]) -> Any:
+        chat, user = data.get('event_chat'), data.get('event_from_user')
+        key = chat.id if chat else user.id if user else None
+        if key is None:
+            async with self._active:
+                return await handler(event, data)
+
+        queue = self._chats.get(key)
+        if queue is None:
+            queue = self._chats[key] = _ChatQueue()
+        callback = event.callback_query
+        signature = None
+        if callback is not None:
+            signature = (callback.message.message_id if callback.message else callback.inline_message_id,
+                         callback.data)
+            if signature in queue.callbacks:
+                return await self._drop(callback, 'duplicate')
+            if queue.depth >= self.max_chat_queue:
+                return await self._drop(callback, 'queue_full')
+            queue.callbacks.add(signature)
+
+        previous = queue.tail
+        done = asyncio.get_running_loop().create_future()
+        queue.tail = done
+        queue.depth += 1
+        accepted = self._clock()
+        try:
+            if previous is not None:
+                # wait, а не await: отмена ожидающего не отменяет предыдущее
+                await asyncio.wait([previous])
+            async with self._active:
+                if callback is not None and self._clock() - accepted > self.stale_after:
+                    return await self._drop(callback, 'stale')
+                return await handler(event, data)
+        finally:
+            done.set_result(None)
+            queue.depth -= 1
+            queue.callbacks.discard(signature)
+            if not queue.depth:
+                del self._chats[key]
+
+    async def _drop(self, callback: CallbackQuery, reason: str) -> None:
+        UPDATES_DROPPED.inc(reason)
+        try:
+            await callback.answer(self.busy_text)
+        except TelegramAPIError as e:
+            # Устаревший запрос Telegram уже не принимает ответ
+            logger.debug("Не удалось ответить на нажатие %s: %s", callback.id, e)
+
+
+def setup_scheduler(dp: Dispatcher, max_active: int, max_chat_queue: int,
+                    stale_after: float) -> UpdateScheduler:
+    """Подключение планировщика обновлений к диспетчеру.
+
+    Вызывается до подключения метрик и трассировки, чтобы время ожидания
+    в очереди чата не засчитывалось обработчику.
+    """
+    scheduler = UpdateScheduler(max_active, max_chat_queue, stale_after)
+    dp.update.outer_middleware(scheduler)
+    return scheduler
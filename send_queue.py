@@ -0,0 +1,221 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time as time_module
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+from aiogram.methods.base import TelegramMethod
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Ведро токенов с резервированием.
+
+    reserve() сразу забирает токен (счётчик может уйти в минус) и
+    возвращает, сколько нужно подождать до момента, когда этот токен
+    действительно накопится. Так очередь заранее знает время отправки
+    каждого сообщения и не опрашивает ведро в цикле.
+    """
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float]):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """Резервирование токена; возвращает задержку в секундах"""
+        now = self.clock()
+        self._refill(now)
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def block(self, seconds: float):
+        """Запрет выдачи токенов на указанное время (после 429)"""
+        now = self.clock()
+        self._refill(now)
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+    def is_idle(self) -> bool:
+        self._refill(self.clock())
+        return self.tokens >= self.capacity
+
+
+class SendJob:
+    __slots__ = ('method', 'chat_id', 'future', 'attempt')
+
+    def __init__(self, method: TelegramMethod, chat_id: Any, future: asyncio.Future):
+        self.method = method
+        self.chat_id = chat_id
+        self.future = future
+        self.attempt = 0
+
+
+class SendQueue:
+    """Очередь исходящих запросов к Bot API с учётом лимитов Telegram.
+
+    Каждый запрос проходит через ведро токенов своего чата (личные чаты
+    и группы - с разными лимитами) и общее ведро бота. Очередь - куча по
+    времени, когда у чата появится токен, поэтому медленный чат не
+    задерживает остальные. Одновременно выполняется не больше
+    concurrency запросов. На 429 отправка приостанавливается на
+    retry_after и запрос повторяется, сетевые ошибки и 5xx повторяются с
+    экспоненциальной задержкой, остальные ошибки возвращаются вызывающему.
+    """
+
+    # Сколько ведер чатов хранить до очистки неактивных
+    MAX_CHAT_BUCKETS = 10000
+
+    def __init__(self, global_rate: float = 30, chat_rate: float = 1, group_rate: float = 20 / 60,
+                 concurrency: int = 8, max_retries: int = 5,
+                 clock: Callable[[], float] = time_module.monotonic):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.clock = clock
+        self._global = TokenBucket(global_rate, global_rate, clock)
+        self._chats: Dict[Any, TokenBucket] = {}
+        # (время готовности, порядковый номер, задание)
+        self._heap: List[Tuple[float, int, SendJob]] = []
+        self._counter = itertools.count()
+        self._paused_until = 0.0
+        self._wakeup = asyncio.Event()
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._in_flight = set()
+        self._bot: Optional[Bot] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._heap) + len(self._in_flight)
+
+    def start(self, bot: Bot):
+        """Запуск отправки от имени бота"""
+        if self._task is None:
+            self._bot = bot
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 5.0):
+        """Остановка: ожидание очереди не дольше timeout, остальное отменяется"""
+        if self._task is None:
+            return
+        deadline = self.clock() + timeout
+        while len(self) and self.clock() < deadline:
+            await asyncio.sleep(0.05)
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        if self._in_flight:
+            await asyncio.wait(self._in_flight, timeout=max(deadline - self.clock(), 0))
+        for _, _, job in self._heap:
+            job.future.cancel()
+        self._heap.clear()
+
+    def _chat_bucket(self, chat_id: Any) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self.MAX_CHAT_BUCKETS:
+                self._chats = {key: value for key, value in self._chats.items() if not value.is_idle()}
+            # Отрицательный chat_id - группа или канал, @username - канал
+            is_group = not isinstance(chat_id, int) or chat_id < 0
+            rate = self.group_rate if is_group else self.chat_rate
+            bucket = self._chats[chat_id] = TokenBucket(rate, 1, self.clock)
+        return bucket
+
+    def _push(self, job: SendJob, delay: float):
+        ready = self.clock() + delay
+        heapq.heappush(self._heap, (ready, next(self._counter), job))
+        if self._heap[0][2] is job:
+            self._wakeup.set()
+
+    def submit(self, method: TelegramMethod) -> asyncio.Future:
+        """Постановка запроса в очередь; future получит результат запроса"""
+        future = asyncio.get_running_loop().create_future()
+        # Ошибка сохраняется в future и пишется в лог, даже если её никто не ждёт
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        chat_id = getattr(method, 'chat_id', None)
+        job = SendJob(method, chat_id, future)
+        delay = self._chat_bucket(chat_id).reserve() if chat_id is not None else 0.0
+        self._push(job, delay)
+        return future
+
+    async def send(self, method: TelegramMethod) -> Any:
+        """Отправка запроса через очередь с ожиданием результата"""
+        return await self.submit(method)
+
+    async def _sleep_until(self, moment: float):
+        """Сон до момента moment или до появления более раннего задания"""
+        delay = moment - self.clock()
+        if delay <= 0:
+            return
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+            ready = max(self._heap[0][0], self._paused_until)
+            if ready > self.clock():
+                await self._sleep_until(ready)
+                continue
+
+            _, _, job = heapq.heappop(self._heap)
+            if job.future.done():
+                continue
+            delay = self._global.reserve()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self._semaphore.acquire()
+            task = asyncio.create_task(self._execute(job))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _execute(self, job: SendJob):
+        try:
+            result = await self._bot(job.method)
+        except TelegramRetryAfter as e:
+            # Лимит превышен: приостанавливаем всю отправку и этот чат
+            logger.warning("Flood control: повтор через %s с (chat_id=%s)", e.retry_after, job.chat_id)
+            self._paused_until = max(self._paused_until, self.clock() + e.retry_after)
+            if job.chat_id is not None:
+                self._chat_bucket(job.chat_id).block(e.retry_after)
+            self._retry(job, e, e.retry_after)
+        except (TelegramNetworkError, TelegramServerError) as e:
+            self._retry(job, e, min(2 ** job.attempt, 60))
+        except Exception as e:
+            logger.warning("Не удалось выполнить %s (chat_id=%s): %s",
+                           type(job.method).__name__, job.chat_id, e)
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            self._semaphore.release()
+
+    def _retry(self, job: SendJob, error: Exception, delay: float):
+        job.attempt += 1
+        if job.attempt > self.max_retries:
+            logger.warning("Отказ после %d попыток (chat_id=%s): %s", job.attempt, job.chat_id, error)
+            if not job.future.done():
+                job.future.set_exception(error)
+            return
+        self._push(job, delay)
@@ -0,0 +1,173 @@
+import asyncio
+import hmac
+import logging
+import queue as queue_module
+from functools import partial
+from typing import Any, Dict, List, Optional, Sequence
+
+from aiogram import Bot, Dispatcher
+from aiogram.exceptions import TelegramNetworkError, TelegramServerError
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Несколько процессов: приёмник получает обновления (polling или вебхук) и
+# раскладывает их по очередям процессов-обработчиков по хэшу чата. Все
+# обновления одного чата попадают в один процесс и обрабатываются там по
+# порядку, поэтому диалог FSM пользователя живёт в одном процессе.
+
+
+def shard_for(key: int, shards: int) -> int:
+    """Номер обработчика для ключа (jump consistent hash, Lamping & Veach).
+
+    Равномерно распределяет ключи и при добавлении обработчика
+    переносит на новый только 1/N ключей.
+    """
+    key &= 0xFFFFFFFFFFFFFFFF
+    bucket, candidate = -1, 0
+    while candidate < shards:
+        bucket = candidate
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        candidate = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+def update_shard_key(update: Dict[str, Any]) -> int:
+    """Ключ маршрутизации обновления: id чата, а если его нет - id пользователя"""
+    for event in update.values():
+        if not isinstance(event, dict):
+            continue
+        chat = event.get('chat') or (event.get('message') or {}).get('chat')
+        if chat:
+            return chat['id']
+        user = event.get('from') or event.get('user')
+        if user:
+            return user['id']
+    return 0
+
+
+class UpdateReceiver:
+    """Приём обновлений и раскладка по очередям обработчиков"""
+
+    def __init__(self, queues: Sequence):
+        self.queues = list(queues)
+
+    async def route(self, update: Dict[str, Any]):
+        """Передача обновления обработчику его чата (ждёт, если очередь полна)"""
+        target = self.queues[shard_for(update_shard_key(update), len(self.queues))]
+        try:
+            target.put_nowait(update)
+        except queue_module.Full:
+            await asyncio.get_running_loop().run_in_executor(None, target.put, update)
+
+    async def poll(self, bot: Bot, allowed_updates: Optional[List[str]] = None, timeout: int = 30):
+        """Long polling: получение обновлений и передача обработчикам"""
+        offset = None
+        backoff = 1.0
+        while True:
+            try:
+                updates = await bot.get_updates(offset=offset, timeout=timeout,
+                                                allowed_updates=allowed_updates,
+                                                request_timeout=timeout + 10)
+            except (TelegramNetworkError, TelegramServerError) as e:
+                logger.warning("Ошибка получения обновлений: %s, повтор через %.0f с", e, backoff)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+                continue
+            backoff = 1.0
+            for update in updates:
+                await self.route(update.model_dump(mode='json', by_alias=True, exclude_none=True))
+                offset = update.update_id + 1
+
+    def setup_webhook_route(self, app: web.Application, path: str, secret_token: Optional[str] = None):
+        """Приём обновлений через вебхук"""
+
+        async def handle_update(request: web.Request) -> web.Response:
+            if secret_token and not hmac.compare_digest(
+                    request.headers.get('X-Telegram-Bot-Api-Secret-Token', ''), secret_token):
+                raise web.HTTPUnauthorized()
+            await self.route(await request.json())
+            return web.Response()
+
+        app.router.add_post(path, handle_update)
+
+
+class ChatOrderedFeeder:
+    """Обработка обновлений: параллельно для разных чатов, по порядку внутри чата.
+
+    Для каждого чата хранится задача его последнего обновления; новая
+    задача сначала дожидается её. Одновременно обрабатывается не больше
+    max_concurrent обновлений, а принимается в работу не больше
+    max_pending (см. wait_for_capacity). При ordered=False порядок внутри
+    чата не соблюдается (его обеспечивает UpdateScheduler).
+    """
+
+    def __init__(self, dp: Dispatcher, bot: Bot, max_concurrent: int = 100,
+                 max_pending: Optional[int] = None, ordered: bool = True):
+        self.dp = dp
+        self.bot = bot
+        self.ordered = ordered
+        self.max_pending = max_pending or max_concurrent * 10
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._tails: Dict[int, asyncio.Task] = {}
+        self._pending = set()
+        self._capacity = asyncio.Event()
+        self._capacity.set()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def submit(self, key: int, update: Dict[str, Any]):
+        previous = self._tails.get(key) if self.ordered else None
+        task = asyncio.create_task(self._process(previous, update))
+        if self.ordered:
+            self._tails[key] = task
+        self._pending.add(task)
+        if len(self._pending) >= self.max_pending:
+            self._capacity.clear()
+        task.add_done_callback(partial(self._forget, key))
+
+    async def _process(self, previous: Optional[asyncio.Task], update: Dict[str, Any]):
+        if previous is not None:
+            # Ошибка предыдущего обновления уже записана в журнал
+            await asyncio.wait([previous])
+        async with self._semaphore:
+            try:
+                await self.dp.feed_raw_update(self.bot, update)
+            except Exception:
+                logger.exception("Ошибка обработки обновления %s", update.get('update_id'))
+
+    def _forget(self, key: int, task: asyncio.Task):
+        self._pending.discard(task)
+        if self._tails.get(key) is task:
+            del self._tails[key]
+        if len(self._pending) < self.max_pending:
+            self._capacity.set()
+
+    async def wait_for_capacity(self):
+        await self._capacity.wait()
+
+    async def join(self):
+        """Ожидание всех принятых обновлений"""
+        if self._pending:
+            await asyncio.wait(list(self._pending))
+
+
+async def consume_updates(updates_queue, feeder: ChatOrderedFeeder):
+    """Чтение очереди процесса-обработчика до сигнала остановки (None)"""
+    loop = asyncio.get_running_loop()
+    while True:
+        await feeder.wait_for_capacity()
+        update = await loop.run_in_executor(None, updates_queue.get)
+        # Забираем накопившиеся обновления без лишних переходов в поток
+        while update is not None:
+            feeder.submit(update_shard_key(update), update)
+            if len(feeder) >= feeder.max_pending:
+                break
+            try:
+                update = updates_queue.get_nowait()
+            except queue_module.Empty:
+                break
+        if update is None:
+            break
+    await feeder.join()
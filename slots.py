@@ -0,0 +1,6 @@
+from config import AVAILABLE_TIMES
+
+# Маска занятости дня врача: бит i установлен, если занято AVAILABLE_TIMES[i]
+TIME_BITS = {time: 1 << i for i, time in enumerate(AVAILABLE_TIMES)}
+FULL_MASK = (1 << len(AVAILABLE_TIMES)) - 1
+
@@ -0,0 +1,200 @@
+import json
+import mmap
+import struct
+import sys
+from array import array
+from typing import Any, Dict, List
+
+# Двоичный снимок данных Database: таблицы записей и пользователей
+# хранятся по столбцам. Файл - сигнатура, длина заголовка (uint32),
+# заголовок JSON с описанием столбцов и блоки столбцов.
+#
+# Database хранит строки словарями, поэтому load() декодирует все
+# столбцы сразу: загрузка лишь немного быстрее JSON (около 1.2-1.4 раза,
+# см. bench_startup.py). Выигрыш снимка - размер файла (примерно втрое
+# меньше) и время записи; отдельный столбец без разбора остального
+# файла можно прочитать через SnapshotReader.column().
+#
+# Типы столбцов:
+#   'i' - целые числа: массив int64;
+#   'd' - любые значения JSON через словарь: массив JSON различных
+#         значений и массив uint32 их номеров. Номер, равный длине
+#         словаря, означает отсутствие поля в строке.
+
+MAGIC = b'HBSNAP01'
+_HEADER = struct.Struct('<I')
+_INT64_MIN, _INT64_MAX = -2 ** 63, 2 ** 63 - 1
+
+
+class _Missing:
+    """Отсутствующее поле строки"""
+
+    def __repr__(self):
+        return 'MISSING'
+
+
+MISSING = _Missing()
+
+
+def is_snapshot(filename: str) -> bool:
+    """Файл в формате двоичного снимка (а не JSON)"""
+    with open(filename, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class _BlockWriter:
+    """Блоки столбцов и их смещения от конца заголовка"""
+
+    def __init__(self):
+        self.blocks: List[bytes] = []
+        self.position = 0
+
+    def add(self, data: bytes) -> List[int]:
+        self.blocks.append(data)
+        self.position += len(data)
+        return [self.position - len(data), len(data)]
+
+
+def _encode_column(values: List[Any], writer: _BlockWriter) -> Dict:
+    """Кодирование столбца, возвращается его описание для заголовка"""
+    if all(type(value) is int and _INT64_MIN <= value <= _INT64_MAX for value in values):
+        return {'type': 'i', 'values': writer.add(array('q', values).tobytes())}
+
+    codes: Dict[tuple, int] = {}
+    table = []
+    indexes = []
+    missing = False
+    for value in values:
+        if value is MISSING:
+            missing = True
+            indexes.append(None)
+            continue
+        # Ключ с типом: True и 1 - разные значения; списки и словари
+        # нехешируемы и сравниваются по тексту JSON
+        if isinstance(value, (dict, list)):
+            key = (value.__class__, json.dumps(value, ensure_ascii=False))
+        else:
+            key = (value.__class__, value)
+        code = codes.get(key)
+        if code is None:
+            code = codes[key] = len(table)
+            table.append(value)
+        indexes.append(code)
+    if missing:
+        indexes = [len(table) if code is None else code for code in indexes]
+    return {
+        'type': 'd',
+        'table': writer.add(json.dumps(table, ensure_ascii=False, separators=(',', ':')).encode('utf-8')),
+        'codes': writer.add(array('I', indexes).tobytes()),
+        'missing': missing
+    }
+
+
+def _encode_table(rows: List[Dict], writer: _BlockWriter) -> Dict:
+    names = list(dict.fromkeys(name for row in rows for name in row))
+    return {
+        'rows': len(rows),
+        'columns': {name: _encode_column([row.get(name, MISSING) for row in rows], writer)
+                    for name in names}
+    }
+
+
+def encode(data: Dict) -> bytes:
+    """Снимок данных Database ('appointments', 'users', 'next_id')"""
+    writer = _BlockWriter()
+    # Порядок пользователей - порядок регистрации, ключ словаря становится столбцом
+    users = [dict(user, user_id=user_id) for user_id, user in data['users'].items()]
+    header = {
+        'byteorder': sys.byteorder,
+        'next_id': data['next_id'],
+        'tables': {
+            'appointments': _encode_table(data['appointments'], writer),
+            'users': _encode_table(users, writer),
+        }
+    }
+    header_data = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    return b''.join([MAGIC, _HEADER.pack(len(header_data)), header_data] + writer.blocks)
+
+
+class SnapshotReader:
+    """Чтение снимка через mmap: столбец декодируется при первом обращении к нему,
+    data() и rows() декодируют все столбцы таблицы"""
+
+    def __init__(self, filename: str):
+        with open(filename, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            self._map.close()
+            raise ValueError(f"{filename}: не двоичный снимок")
+        start = len(MAGIC) + _HEADER.size
+        (header_length,) = _HEADER.unpack_from(self._map, len(MAGIC))
+        self.header = json.loads(self._map[start:start + header_length])
+        self._base = start + header_length
+        self._swap = self.header['byteorder'] != sys.byteorder
+        self._columns: Dict[tuple, list] = {}
+
+    @property
+    def next_id(self) -> int:
+        return self.header['next_id']
+
+    def __len__(self) -> int:
+        return self.header['tables']['appointments']['rows']
+
+    def _block(self, span: List[int]) -> memoryview:
+        offset, length = span
+        return memoryview(self._map)[self._base + offset:self._base + offset + length]
+
+    def _array(self, typecode: str, span: List[int]) -> array:
+        values = array(typecode)
+        block = self._block(span)
+        values.frombytes(block)
+        block.release()
+        if self._swap:
+            values.byteswap()
+        return values
+
+    def column(self, table: str, name: str) -> list:
+        """Значения столбца (MISSING - поле отсутствует)"""
+        key = (table, name)
+        if key not in self._columns:
+            description = self.header['tables'][table]['columns'][name]
+            if description['type'] == 'i':
+                values = self._array('q', description['values']).tolist()
+            else:
+                block = self._block(description['table'])
+                dictionary = json.loads(bytes(block))
+                block.release()
+                dictionary.append(MISSING)
+                values = list(map(dictionary.__getitem__, self._array('I', description['codes'])))
+            self._columns[key] = values
+        return self._columns[key]
+
+    def rows(self, table: str) -> List[Dict]:
+        """Строки таблицы в виде словарей"""
+        columns = self.header['tables'][table]['columns']
+        names = list(columns)
+        values = [self.column(table, name) for name in names]
+        if not any(description.get('missing') for description in columns.values()):
+            return [dict(zip(names, row)) for row in zip(*values)]
+        return [{name: value for name, value in zip(names, row) if value is not MISSING}
+                for row in zip(*values)]
+
+    def data(self) -> Dict:
+        """Данные в формате Database.data"""
+        users = {}
+        for user in self.rows('users'):
+            users[user.pop('user_id')] = user
+        return {'appointments': self.rows('appointments'), 'users': users, 'next_id': self.next_id}
+
+    def close(self):
+        self._columns.clear()
+        self._map.close()
+
+
+def load(filename: str) -> Dict:
+    """Загрузка данных из снимка (декодируются все столбцы)"""
+    reader = SnapshotReader(filename)
+    try:
+        return reader.data()
+    finally:
+        reader.close()
@@ -0,0 +1,476 @@
+import sqlite3
+import time as time_module
+from datetime import datetime
+from typing import Iterator, List, Dict, Optional, Tuple
+
+from config import SLOT_HOLD_TTL
+from listeners import ListenersMixin
+from metrics import observe_scan
+from pagination import AppointmentsPage, UsersPage, order_key
+from reservations import ReservationMixin, Slot, SlotReservations, SlotUnavailableError
+from slots import TIME_BITS
+
+# Ключ сортировки даты 'ДД.ММ.ГГГГ' -> 'ГГГГММДД' (совпадает с pagination.date_key).
+# Запросы должны использовать в точности это выражение, чтобы работали индексы
+DATE_KEY = "substr(date, 7, 4) || substr(date, 4, 2) || substr(date, 1, 2)"
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    username TEXT,
+    first_name TEXT,
+    registered_at TEXT NOT NULL,
+    -- Пользователь заблокировал бота: рассылки его пропускают
+    blocked INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS appointments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    patient_name TEXT NOT NULL,
+    doctor TEXT NOT NULL,
+    procedure TEXT NOT NULL,
+    date TEXT NOT NULL,
+    time TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    status TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_appointments_user_id ON appointments (user_id);
+CREATE INDEX IF NOT EXISTS idx_appointments_slot ON appointments (doctor, date, time);
+CREATE INDEX IF NOT EXISTS idx_appointments_status ON appointments (status);
+
+-- На один слот (врач, дата, время) может приходиться только одна активная запись
+CREATE UNIQUE INDEX IF NOT EXISTS uq_appointments_active_slot
+    ON appointments (doctor, date, time) WHERE status = 'active';
+
+-- Упорядоченные индексы активных записей для постраничного вывода
+CREATE INDEX IF NOT EXISTS idx_appointments_active_order
+    ON appointments ({DATE_KEY}, time, id) WHERE status = 'active';
+CREATE INDEX IF NOT EXISTS idx_appointments_user_active_order
+    ON appointments (user_id, {DATE_KEY}, time, id) WHERE status = 'active';
+
+-- Удержания слотов, общие для нескольких процессов (см. SQLiteSlotReservations)
+CREATE TABLE IF NOT EXISTS slot_holds (
+    doctor TEXT NOT NULL,
+    date TEXT NOT NULL,
+    time TEXT NOT NULL,
+    holder INTEGER NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (doctor, date, time)
+);
+
+CREATE INDEX IF NOT EXISTS idx_slot_holds_holder ON slot_holds (holder);
+CREATE INDEX IF NOT EXISTS idx_slot_holds_expires_at ON slot_holds (expires_at);
+"""
+
+# Поля записи, которые можно изменять через update_appointment
+APPOINTMENT_FIELDS = (
+    'user_id', 'patient_name', 'doctor', 'procedure',
+    'date', 'time', 'created_at', 'status'
+)
+
+
+class SQLiteSlotReservations:
+    """Удержания слотов в таблице slot_holds (интерфейс SlotReservations).
+
+    Нужны, когда с базой работают несколько процессов: удержание,
+    сделанное в одном процессе, видно остальным. Проверка и запись
+    удержания выполняются в одной транзакции, SQLite сериализует их
+    между процессами. Время - системное (time.time), общее для процессов.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, ttl: float = 300, clock=time_module.time):
+        self.conn = conn
+        self.ttl = ttl
+        self.clock = clock
+
+    def __len__(self) -> int:
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM slot_holds WHERE expires_at > ?", (self.clock(),)
+        ).fetchone()[0]
+
+    def holder(self, slot: Slot) -> Optional[int]:
+        """Пользователь, удерживающий слот"""
+        row = self.conn.execute(
+            "SELECT holder FROM slot_holds WHERE doctor = ? AND date = ? AND time = ? "
+            "AND expires_at > ?", (*slot, self.clock())
+        ).fetchone()
+        return row[0] if row else None
+
+    def hold(self, holder: int, slot: Slot) -> bool:
+        """Удержание слота (или продление своего удержания)"""
+        now = self.clock()
+        with self.conn:
+            self.conn.execute("DELETE FROM slot_holds WHERE expires_at <= ?", (now,))
+            # Чужое удержание не перезаписывается: rowcount будет 0
+            cursor = self.conn.execute(
+                "INSERT INTO slot_holds (doctor, date, time, holder, expires_at) "
+                "VALUES (?, ?, ?, ?, ?) ON CONFLICT (doctor, date, time) "
+                "DO UPDATE SET expires_at = excluded.expires_at WHERE holder = excluded.holder",
+                (*slot, holder, now + self.ttl)
+            )
+            if cursor.rowcount == 0:
+                return False
+            self.conn.execute(
+                "DELETE FROM slot_holds WHERE holder = ? "
+                "AND NOT (doctor = ? AND date = ? AND time = ?)", (holder, *slot)
+            )
+        return True
+
+    def release(self, holder: int) -> Optional[Slot]:
+        """Снятие удержания пользователя"""
+        with self.conn:
+            row = self.conn.execute(
+                "SELECT doctor, date, time FROM slot_holds WHERE holder = ?", (holder,)
+            ).fetchone()
+            if row is None:
+                return None
+            self.conn.execute("DELETE FROM slot_holds WHERE holder = ?", (holder,))
+        return tuple(row)
+
+
+class SQLiteDatabase(ReservationMixin, ListenersMixin):
+    """База данных на SQLite с тем же интерфейсом, что и Database"""
+
+    def __init__(self, filename='appointments.db', shared_reservations: bool = False):
+        self.filename = filename
+        # Подписчики на изменения записей (см. add_listener)
+        self._listeners = []
+        self.conn = sqlite3.connect(filename)
+        self.conn.row_factory = sqlite3.Row
+        # WAL позволяет читать параллельно с записью и не переписывать файл целиком
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._upgrade_schema()
+        # Удержания слотов на время оформления записи: в памяти процесса
+        # или в базе, если с ней работают несколько процессов
+        if shared_reservations:
+            self.reservations = SQLiteSlotReservations(self.conn, SLOT_HOLD_TTL)
+        else:
+            self.reservations = SlotReservations(SLOT_HOLD_TTL)
+
+    def _upgrade_schema(self):
+        """Добавление столбцов, которых нет в базах, созданных раньше"""
+        columns = {row['name'] for row in self.conn.execute("PRAGMA table_info(users)")}
+        if 'blocked' not in columns:
+            with self.conn:
+                self.conn.execute("ALTER TABLE users ADD COLUMN blocked INTEGER NOT NULL DEFAULT 0")
+
+    def close(self):
+        """Закрытие соединения с базой"""
+        self.conn.close()
+
+    # SQLite в режиме WAL сам выполняет короткие дозаписи без полной
+    # перезаписи файла, поэтому фоновая запись ему не нужна
+    def start_writer(self, delay: float = 0.05):
+        """Совместимость с Database.start_writer"""
+
+    async def stop_writer(self):
+        """Совместимость с Database.stop_writer"""
+
+    async def durable(self):
+        """Изменения фиксируются сразу при выполнении запроса"""
+
+    async def open(self):
+        """Данные не загружаются в память: запросы идут в базу"""
+
+    def add_user(self, user_id: int, username: str, first_name: str):
+        """Добавление нового пользователя"""
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO users (user_id, username, first_name, registered_at) "
+                "VALUES (?, ?, ?, ?)",
+                (user_id, username, first_name, datetime.now().isoformat())
+            )
+            # Пользователь вернулся - снова получает рассылки
+            self.conn.execute(
+                "UPDATE users SET blocked = 0 WHERE user_id = ? AND blocked = 1", (user_id,)
+            )
+
+    def set_user_blocked(self, user_id: int, blocked: bool = True) -> bool:
+        """Пометка пользователя, заблокировавшего бота (рассылки его пропускают)"""
+        with self.conn:
+            cursor = self.conn.execute(
+                "UPDATE users SET blocked = ? WHERE user_id = ? AND blocked != ?",
+                (int(blocked), user_id, int(blocked))
+            )
+        return cursor.rowcount > 0
+
+    def create_appointment(self, user_id: int, patient_name: str,
+                           doctor: str, procedure: str,
+                           date: str, time: str) -> int:
+        """Создание новой записи"""
+        try:
+            with self.conn:
+                cursor = self.conn.execute(
+                    "INSERT INTO appointments (user_id, patient_name, doctor, procedure, "
+                    "date, time, created_at, status) VALUES (?, ?, ?, ?, ?, ?, ?, 'active')",
+                    (user_id, patient_name, doctor, procedure, date, time,
+                     datetime.now().isoformat())
+                )
+        except sqlite3.IntegrityError as e:
+            # Сработал уникальный индекс активных слотов
+            raise SlotUnavailableError(f"{doctor} {date} {time}") from e
+        if self._listeners:
+            self._notify(self.get_appointment(cursor.lastrowid))
+        return cursor.lastrowid
+
+    def get_appointments(self, user_id: Optional[int] = None) -> List[Dict]:
+        """Получение записей (всех или для конкретного пользователя)"""
+        if user_id:
+            rows = self.conn.execute(
+                "SELECT * FROM appointments WHERE user_id = ? AND status = 'active' ORDER BY id",
+                (user_id,)
+            )
+        else:
+            rows = self.conn.execute(
+                "SELECT * FROM appointments WHERE status = 'active' ORDER BY id"
+            )
+        return [dict(row) for row in rows]
+
+    def get_appointment(self, appointment_id: int) -> Optional[Dict]:
+        """Получение конкретной записи"""
+        row = self.conn.execute(
+            "SELECT * FROM appointments WHERE id = ?", (appointment_id,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def _page_rows(self, user_id: Optional[int], bound: Optional[tuple],
+                   descending: bool, limit: int) -> List[Dict]:
+        """Выборка по упорядоченному индексу начиная от границы.
+
+        bound - ключ (дата, время, id), строго после (или до, при descending)
+        которого начинается выборка, либо (дата,) - начало с указанной даты.
+        """
+        op, order = ('<', 'DESC') if descending else ('>', 'ASC')
+        if user_id:
+            sql = ("SELECT * FROM appointments INDEXED BY idx_appointments_user_active_order "
+                   "WHERE status = 'active' AND user_id = ?")
+            params = [user_id]
+        else:
+            sql = ("SELECT * FROM appointments INDEXED BY idx_appointments_active_order "
+                   "WHERE status = 'active'")
+            params = []
+        if bound is not None and len(bound) == 1:
+            sql += f" AND {DATE_KEY} {op}= ?"
+            params.append(bound[0])
+        elif bound is not None:
+            # Условие на первый столбец индекса задаёт начало диапазона поиска
+            sql += f" AND {DATE_KEY} {op}= ? AND ({DATE_KEY}, time, id) {op} (?, ?, ?)"
+            params.extend((bound[0], *bound))
+        sql += f" ORDER BY {DATE_KEY} {order}, time {order}, id {order} LIMIT ?"
+        rows = self.conn.execute(sql, (*params, limit))
+        return [dict(row) for row in rows]
+
+    def get_appointments_page(self, user_id: Optional[int] = None,
+                              after: Optional[int] = None, before: Optional[int] = None,
+                              from_date: Optional[str] = None,
+                              limit: int = 10) -> AppointmentsPage:
+        """Страница активных записей (всех или пользователя) по курсору.
+
+        after/before - номер записи, после/до которой начинается страница,
+        from_date - дата 'ГГГГММДД', с которой начинается страница (если
+        после неё записей нет, возвращается последняя страница).
+        """
+        cursor = after if after is not None else before
+        cursor_appointment = self.get_appointment(cursor) if cursor is not None else None
+
+        if cursor_appointment is not None and after is None:
+            rows = self._page_rows(user_id, order_key(cursor_appointment), True, limit)[::-1]
+        elif cursor_appointment is not None:
+            rows = self._page_rows(user_id, order_key(cursor_appointment), False, limit)
+        elif from_date:
+            rows = self._page_rows(user_id, (from_date,), False, limit)
+            if not rows:
+                # После даты записей нет - показываем последнюю страницу
+                rows = self._page_rows(user_id, None, True, limit)[::-1]
+        else:
+            rows = self._page_rows(user_id, None, False, limit)
+
+        # Наличие соседних страниц проверяется точечным поиском по индексу
+        has_prev = bool(rows) and bool(self._page_rows(user_id, order_key(rows[0]), True, 1))
+        has_next = bool(rows) and bool(self._page_rows(user_id, order_key(rows[-1]), False, 1))
+        return AppointmentsPage(
+            items=rows,
+            prev_cursor=rows[0]['id'] if has_prev else None,
+            next_cursor=rows[-1]['id'] if has_next else None
+        )
+
+    def update_appointment(self, appointment_id: int, **kwargs) -> bool:
+        """Обновление записи (SlotUnavailableError, если новый слот занят)"""
+        unknown = set(kwargs) - set(APPOINTMENT_FIELDS)
+        if unknown:
+            raise ValueError(f"Неизвестные поля записи: {', '.join(sorted(unknown))}")
+        if not kwargs:
+            return self.get_appointment(appointment_id) is not None
+        assignments = ', '.join(f"{field} = ?" for field in kwargs)
+        try:
+            with self.conn:
+                cursor = self.conn.execute(
+                    f"UPDATE appointments SET {assignments} WHERE id = ?",
+                    (*kwargs.values(), appointment_id)
+                )
+        except sqlite3.IntegrityError as e:
+            # Сработал уникальный индекс активных слотов
+            updated = dict(self.get_appointment(appointment_id) or {}, **kwargs)
+            raise SlotUnavailableError(
+                f"{updated.get('doctor')} {updated.get('date')} {updated.get('time')}"
+            ) from e
+        if cursor.rowcount == 0:
+            return False
+        if self._listeners:
+            self._notify(self.get_appointment(appointment_id))
+        return True
+
+    def delete_appointment(self, appointment_id: int) -> bool:
+        """Удаление записи"""
+        return self.update_appointment(appointment_id, status='deleted')
+
+    def archivable_appointments(self, before_date: str, limit: int = 1000) -> List[Dict]:
+        """Записи для переноса в архив: отменённые и с датой раньше 'ГГГГММДД'"""
+        rows = self.conn.execute(
+            f"SELECT * FROM appointments WHERE status = 'active' AND {DATE_KEY} < ? "
+            f"ORDER BY {DATE_KEY}, time, id LIMIT ?",
+            (before_date, limit)
+        ).fetchall()
+        if len(rows) < limit:
+            rows += self.conn.execute(
+                "SELECT * FROM appointments WHERE status != 'active' ORDER BY id LIMIT ?",
+                (limit - len(rows),)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def remove_archived(self, appointment_ids: List[int]) -> int:
+        """Удаление перенесённых в архив записей; возвращает число удалённых"""
+        removed = 0
+        with self.conn:
+            # Не больше 500 параметров на запрос (ограничение старых версий SQLite - 999)
+            for start in range(0, len(appointment_ids), 500):
+                chunk = appointment_ids[start:start + 500]
+                cursor = self.conn.execute(
+                    f"DELETE FROM appointments WHERE id IN ({', '.join('?' * len(chunk))})", chunk
+                )
+                removed += cursor.rowcount
+        return removed
+
+    @staticmethod
+    def _user_from_row(row) -> Dict:
+        return {
+            'username': row['username'],
+            'first_name': row['first_name'],
+            'registered_at': row['registered_at'],
+            'blocked': bool(row['blocked'])
+        }
+
+    def get_users(self) -> Dict:
+        """Получение всех пользователей"""
+        rows = self.conn.execute("SELECT * FROM users ORDER BY user_id")
+        return {str(row['user_id']): self._user_from_row(row) for row in rows}
+
+    def get_users_page(self, after: Optional[int] = None, before: Optional[int] = None,
+                       limit: int = 20) -> UsersPage:
+        """Страница пользователей по возрастанию user_id (курсор - user_id)"""
+        if before is not None:
+            rows = self.conn.execute(
+                "SELECT * FROM users WHERE user_id < ? ORDER BY user_id DESC LIMIT ?",
+                (before, limit)
+            ).fetchall()[::-1]
+        else:
+            rows = self.conn.execute(
+                "SELECT * FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?",
+                (after if after is not None else -1, limit)
+            ).fetchall()
+
+        has_prev = bool(rows) and self.conn.execute(
+            "SELECT 1 FROM users WHERE user_id < ? LIMIT 1", (rows[0]['user_id'],)
+        ).fetchone() is not None
+        has_next = bool(rows) and self.conn.execute(
+            "SELECT 1 FROM users WHERE user_id > ? LIMIT 1", (rows[-1]['user_id'],)
+        ).fetchone() is not None
+        return UsersPage(
+            items=[(str(row['user_id']), self._user_from_row(row)) for row in rows],
+            prev_cursor=rows[0]['user_id'] if has_prev else None,
+            next_cursor=rows[-1]['user_id'] if has_next else None
+        )
+
+    @observe_scan('iter_users')
+    def iter_users(self, after: Optional[int] = None,
+                   batch_size: int = 1000) -> Iterator[Tuple[int, str, Dict]]:
+        """Потоковый обход пользователей пачками: (курсор, user_id, данные)"""
+        cursor = after if after is not None else -1
+        while True:
+            rows = self.conn.execute(
+                "SELECT * FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?",
+                (cursor, batch_size)
+            ).fetchall()
+            for row in rows:
+                yield row['user_id'], str(row['user_id']), self._user_from_row(row)
+            if len(rows) < batch_size:
+                return
+            cursor = rows[-1]['user_id']
+
+    @observe_scan('iter_appointments')
+    def iter_appointments(self, batch_size: int = 1000) -> Iterator[Dict]:
+        """Потоковый обход всех записей пачками, включая отменённые"""
+        cursor = 0
+        while True:
+            rows = self.conn.execute(
+                "SELECT * FROM appointments WHERE id > ? ORDER BY id LIMIT ?",
+                (cursor, batch_size)
+            ).fetchall()
+            for row in rows:
+                yield dict(row)
+            if len(rows) < batch_size:
+                return
+            cursor = rows[-1]['id']
+
+    @observe_scan('iter_active_appointments')
+    def iter_active_appointments(self, user_id: Optional[int] = None,
+                                 doctor: Optional[str] = None) -> Iterator[Dict]:
+        """Потоковый обход активных записей пользователя или врача по индексу"""
+        if user_id is not None:
+            rows = self.conn.execute(
+                "SELECT * FROM appointments WHERE user_id = ? AND status = 'active' ORDER BY id",
+                (user_id,)
+            )
+        else:
+            # Использует idx_appointments_slot (doctor - первая колонка)
+            rows = self.conn.execute(
+                "SELECT * FROM appointments WHERE doctor = ? AND status = 'active'",
+                (doctor,)
+            )
+        for row in rows:
+            yield dict(row)
+
+    @observe_scan('iter_upcoming_appointments')
+    def iter_upcoming_appointments(self, from_date: str, batch_size: int = 1000) -> Iterator[Dict]:
+        """Потоковый обход активных записей с даты 'ГГГГММДД' в порядке времени приёма"""
+        bound = (from_date,)
+        while True:
+            rows = self._page_rows(None, bound, False, batch_size)
+            yield from rows
+            if len(rows) < batch_size:
+                return
+            bound = order_key(rows[-1])
+
+    def is_appointment_available(self, doctor: str, date: str, time: str) -> bool:
+        """Проверка доступности времени"""
+        row = self.conn.execute(
+            "SELECT 1 FROM appointments "
+            "WHERE doctor = ? AND date = ? AND time = ? AND status = 'active' LIMIT 1",
+            (doctor, date, time)
+        ).fetchone()
+        return row is None
+
+    def occupied_mask(self, doctor: str, date: str) -> int:
+        """Маска занятого времени врача на дату (см. slots.TIME_BITS)"""
+        rows = self.conn.execute(
+            "SELECT time FROM appointments WHERE doctor = ? AND date = ? AND status = 'active'",
+            (doctor, date)
+        )
+        mask = 0
+        for (time,) in rows:
+            mask |= TIME_BITS.get(time, 0)
+        return mask
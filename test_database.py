@@ -0,0 +1,67 @@
+"""Восстановление JournaledDatabase из журнала после сбоя при сжатии"""
+
+from datetime import date, timedelta
+
+from database import JournaledDatabase
+
+
+def _book(database: JournaledDatabase) -> int:
+    day = (date.today() - timedelta(days=1)).strftime('%d.%m.%Y')
+    return database.create_appointment(1, "Пациент", "Врач", "Процедура", day, "10:00")
+
+
+def _crash_before_truncate(database: JournaledDatabase):
+    # Снимок записан, а журнал не очищен: сбой внутри compact()
+    database.save_data()
+    database.close()
+
+
+def test_replay_skips_update_of_archived_appointment(tmp_path):
+    filename = str(tmp_path / 'appointments.json')
+    database = JournaledDatabase(filename, fsync=False)
+    appointment_id = _book(database)
+    database.compact()
+    database.delete_appointment(appointment_id)
+    assert database.remove_archived([appointment_id]) == 1
+    _crash_before_truncate(database)
+
+    reopened = JournaledDatabase(filename, fsync=False)
+    assert reopened.get_appointment(appointment_id) is None
+    assert reopened.get_appointments() == []
+    reopened.close()
+
+
+def test_replay_does_not_restore_archived_appointment(tmp_path):
+    filename = str(tmp_path / 'appointments.json')
+    database = JournaledDatabase(filename, fsync=False)
+    appointment_id = _book(database)
+    assert database.remove_archived([appointment_id]) == 1
+    _crash_before_truncate(database)
+
+    reopened = JournaledDatabase(filename, fsync=False)
+    assert reopened.get_appointment(appointment_id) is None
+    assert reopened.data['appointments'] == []
+    # Номер архивной записи не выдаётся повторно
+    assert _book(reopened) == appointment_id + 1
+    reopened.close()
+
+
+def test_archivable_appointments_uses_indexes(tmp_path):
+    database = JournaledDatabase(str(tmp_path / 'appointments.json'), fsync=False)
+    past_id = _book(database)
+    future_day = (date.today() + timedelta(days=1)).strftime('%d.%m.%Y')
+    cancelled_id = database.create_appointment(1, "Пациент", "Врач", "Процедура", future_day, "10:00")
+    kept_id = database.create_appointment(1, "Пациент", "Врач", "Процедура", future_day, "11:00")
+    database.delete_appointment(cancelled_id)
+    today = date.today().strftime('%Y%m%d')
+
+    assert [a['id'] for a in database.archivable_appointments(today)] == [past_id, cancelled_id]
+    assert [a['id'] for a in database.archivable_appointments(today, limit=1)] == [past_id]
+    # Вернувшаяся в активные запись перестаёт быть кандидатом в архив
+    database.update_appointment(cancelled_id, status='active')
+    assert [a['id'] for a in database.archivable_appointments(today)] == [past_id]
+    database.delete_appointment(cancelled_id)
+    assert database.remove_archived([past_id, cancelled_id]) == 2
+    assert database.archivable_appointments(today) == []
+    assert [a['id'] for a in database.get_appointments()] == [kept_id]
+    database.close()
@@ -0,0 +1,89 @@
+"""Очередь напоминаний ReminderScheduler"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+from database import Database
+from reminders import ReminderScheduler, appointment_start
+
+HOUR = 3600
+NOW = datetime(2026, 2, 1, 9, 0)
+
+
+class Clock:
+    def __init__(self):
+        self.now = NOW.timestamp()
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _book(database: Database, start: datetime) -> int:
+    return database.create_appointment(1, "Пациент", "Врач", "Процедура",
+                                       start.strftime('%d.%m.%Y'), start.strftime('%H:%M'))
+
+
+def _scheduler(tmp_path, database: Database, clock: Clock, sent: list) -> ReminderScheduler:
+    async def send(appointment):
+        sent.append(appointment['id'])
+    return ReminderScheduler(database, send, lead=2 * HOUR, clock=clock,
+                             state_file=str(tmp_path / 'reminders.json'))
+
+
+def test_schedule_follows_database_changes(tmp_path):
+    database = Database(str(tmp_path / 'appointments.json'))
+    clock = Clock()
+    scheduler = _scheduler(tmp_path, database, clock, [])
+    appointment_id = _book(database, NOW + timedelta(days=1))
+    scheduler.rebuild()
+    database.add_listener(scheduler.schedule)
+    start = appointment_start(database.get_appointment(appointment_id))
+    assert scheduler._due == {appointment_id: start - 2 * HOUR}
+
+    # Перенос меняет время напоминания, старый элемент кучи пропускается
+    database.update_appointment(appointment_id, time="12:00")
+    moved = appointment_start(database.get_appointment(appointment_id)) - 2 * HOUR
+    assert scheduler._due == {appointment_id: moved}
+    assert scheduler._pop_due(start - 2 * HOUR) == []
+    assert scheduler._pop_due(moved) == [appointment_id]
+
+    # Поздняя запись - напоминание сразу, прошедшая и отменённая - без напоминания
+    late_id = _book(database, NOW + timedelta(hours=1))
+    assert scheduler._due[late_id] == clock.now
+    database.delete_appointment(late_id)
+    assert late_id not in scheduler._due
+    _book(database, NOW - timedelta(hours=1))
+    assert len(scheduler) == 0
+
+
+def test_rebuild_sends_missed_reminders_once(tmp_path):
+    database = Database(str(tmp_path / 'appointments.json'))
+    clock = Clock()
+    sent = []
+    # Напоминание должно было уйти, пока бот не работал
+    missed_id = _book(database, NOW + timedelta(hours=1))
+    later_id = _book(database, NOW + timedelta(days=1))
+
+    async def run(scheduler: ReminderScheduler):
+        scheduler.start()
+        await asyncio.sleep(0.05)
+        await scheduler.stop()
+
+    scheduler = _scheduler(tmp_path, database, clock, sent)
+    asyncio.run(run(scheduler))
+    assert sent == [missed_id]
+    assert list(scheduler._due) == [later_id]
+
+    # Изменение записи и перестроение очереди не повторяют напоминание
+    database.update_appointment(missed_id, procedure="Другая процедура")
+    scheduler.rebuild()
+    assert missed_id not in scheduler._due
+
+    # После перезапуска отправленное читается из state_file
+    asyncio.run(run(_scheduler(tmp_path, database, clock, sent)))
+    assert sent == [missed_id]
+
+    # Перенос на другое время - новое напоминание
+    database.update_appointment(missed_id, time="09:30")
+    asyncio.run(run(_scheduler(tmp_path, database, clock, sent)))
+    assert sent == [missed_id, missed_id]
@@ -0,0 +1,72 @@
+"""Двоичный снимок: кодирование и чтение без потерь"""
+
+import snapshot
+from database import Database
+
+
+def _data():
+    return {
+        'appointments': [
+            {'id': 1, 'user_id': 10, 'doctor': 'Врач', 'date': '01.02.2026', 'time': '10:00',
+             'status': 'active', 'reminded': True},
+            # Поля нет в строке, значения разных типов в одном столбце
+            {'id': 2, 'user_id': 2 ** 70, 'doctor': 'Врач', 'date': '01.02.2026', 'time': '11:00',
+             'status': 'deleted', 'reminded': 1},
+            {'id': 3, 'user_id': 10, 'doctor': None, 'date': '02.02.2026', 'time': '10:00',
+             'status': 'active', 'note': {'text': 'ключ', 'tags': ['a', 'б']}},
+        ],
+        'users': {
+            '10': {'username': 'user', 'first_name': 'Имя', 'blocked': False},
+            '20': {'username': None, 'first_name': 'Другой'},
+        },
+        'next_id': 4
+    }
+
+
+def test_encode_load_round_trip(tmp_path):
+    filename = tmp_path / 'appointments.json'
+    data = _data()
+    filename.write_bytes(snapshot.encode(data))
+
+    assert snapshot.is_snapshot(str(filename))
+    loaded = snapshot.load(str(filename))
+    assert loaded == data
+    # True и 1 в одном столбце не смешиваются
+    assert [type(a.get('reminded')) for a in loaded['appointments']] == [bool, int, type(None)]
+    assert list(loaded['users']) == ['10', '20']
+
+
+def test_reader_column(tmp_path):
+    filename = tmp_path / 'appointments.json'
+    filename.write_bytes(snapshot.encode(_data()))
+
+    reader = snapshot.SnapshotReader(str(filename))
+    try:
+        assert len(reader) == 3
+        assert reader.next_id == 4
+        assert reader.column('appointments', 'id') == [1, 2, 3]
+        assert reader.column('appointments', 'reminded')[2] is snapshot.MISSING
+    finally:
+        reader.close()
+
+
+def test_empty_snapshot(tmp_path):
+    filename = tmp_path / 'appointments.json'
+    data = {'appointments': [], 'users': {}, 'next_id': 1}
+    filename.write_bytes(snapshot.encode(data))
+    assert snapshot.load(str(filename)) == data
+
+
+def test_database_switches_format(tmp_path):
+    filename = str(tmp_path / 'appointments.json')
+    database = Database(filename, snapshot_format='binary')
+    database.add_user(10, 'user', 'Имя')
+    database.create_appointment(10, "Пациент", "Врач", "Процедура", "01.02.2026", "10:00")
+    assert snapshot.is_snapshot(filename)
+
+    # Формат при чтении определяется по файлу, запись - по настройке
+    reopened = Database(filename, snapshot_format='json')
+    assert reopened.data == database.data
+    reopened.save_data()
+    assert not snapshot.is_snapshot(filename)
+    assert Database(filename).data == database.data
@@ -0,0 +1,74 @@
+"""Уникальность активного слота в SQLiteDatabase"""
+
+import sqlite3
+
+import pytest
+
+from reservations import SlotUnavailableError
+from sqlite_database import SQLiteDatabase
+
+DAY = "01.02.2026"
+
+
+@pytest.fixture
+def database(tmp_path):
+    database = SQLiteDatabase(str(tmp_path / 'appointments.db'))
+    yield database
+    database.close()
+
+
+def _book(database: SQLiteDatabase, time: str = "10:00", doctor: str = "Врач") -> int:
+    return database.create_appointment(1, "Пациент", doctor, "Процедура", DAY, time)
+
+
+def test_create_rejects_booked_slot(database):
+    appointment_id = _book(database)
+    with pytest.raises(SlotUnavailableError):
+        _book(database)
+    # Другой врач или время - свободный слот
+    _book(database, doctor="Другой врач")
+    _book(database, time="11:00")
+    assert len(database.get_appointments()) == 3
+    assert database.get_appointment(appointment_id)['status'] == 'active'
+
+
+def test_cancelled_slot_can_be_booked_again(database):
+    appointment_id = _book(database)
+    assert database.delete_appointment(appointment_id)
+    assert database.is_appointment_available("Врач", DAY, "10:00")
+    second_id = _book(database)
+    # Отменённую запись нельзя вернуть в уже занятый слот
+    with pytest.raises(SlotUnavailableError):
+        database.update_appointment(appointment_id, status='active')
+    assert database.get_appointment(appointment_id)['status'] == 'deleted'
+    assert database.get_appointment(second_id)['status'] == 'active'
+
+
+def test_update_rejects_move_to_booked_slot(database):
+    first_id = _book(database)
+    second_id = _book(database, time="11:00")
+    with pytest.raises(SlotUnavailableError):
+        database.update_appointment(second_id, time="10:00")
+    assert database.get_appointment(second_id)['time'] == "11:00"
+    # Изменение других полей записи не конфликтует с её собственным слотом
+    assert database.update_appointment(first_id, procedure="Другая процедура")
+
+
+def test_constraint_holds_across_connections(tmp_path):
+    filename = str(tmp_path / 'appointments.db')
+    first = SQLiteDatabase(filename)
+    second = SQLiteDatabase(filename)
+    try:
+        _book(first)
+        with pytest.raises(SlotUnavailableError):
+            _book(second)
+        # Ограничение в схеме, а не в коде: прямая вставка тоже отклоняется
+        with pytest.raises(sqlite3.IntegrityError):
+            with second.conn:
+                second.conn.execute(
+                    "INSERT INTO appointments (user_id, patient_name, doctor, procedure, "
+                    "date, time, created_at, status) VALUES (1, '', 'Врач', '', ?, '10:00', '', 'active')",
+                    (DAY,))
+    finally:
+        first.close()
+        second.close()
@@ -1,6 +1,6 @@
-from datetime import datetime
 from typing import Dict
-import os
+
+from aiogram import html
 
 
 def format_appointment(appointment: Dict, is_admin: bool = False) -> str:
@@ -26,45 +26,24 @@ def format_appointment(appointment: Dict, is_admin: bool = False) -> str:
     return text
 
 
-def generate_calendar_event(appointment: Dict) -> str:
-    """Генерация файла для календаря (.ics)"""
-    try:
-        date_str = f"{appointment['date']} {appointment['time']}"
-        event_date = datetime.strptime(date_str, "%d.%m.%Y %H:%M")
-
-        # Форматируем дату для .ics
-        start_time = event_date.strftime("%Y%m%dT%H%M%S")
-        end_time = event_date.replace(hour=event_date.hour + 1).strftime("%Y%m%dT%H%M%S")
-
-        ics_content = f"""BEGIN:VCALENDAR
-VERSION:2.0
-PRODID:-//Clinic Bot//EN
-BEGIN:VEVENT
-UID:{appointment['id']}@clinicbot
-DTSTART:{start_time}
-DTEND:{end_time}
-SUMMARY:Прием у {appointment['doctor']}
-DESCRIPTION:Пациент: {appointment['patient_name']}\\nПроцедура: {appointment['procedure']}
-LOCATION:Клиника «Здоровье»
-STATUS:CONFIRMED
-END:VEVENT
-END:VCALENDAR"""
-
-        filename = f"appointment_{appointment['id']}.ics"
-        with open(filename, 'w', encoding='utf-8') as f:
-            f.write(ics_content)
-
-        return filename
-    except Exception as e:
-        print(f"Ошибка создания календаря: {e}")
-        return None
+def format_user(user_id: str, user_data: Dict) -> str:
+    """Форматирование информации о пользователе для списка"""
+    text = f"ID: {user_id}\n"
+    text += f"Имя: {html.quote(user_data['first_name'] or '')}\n"
+    if user_data['username']:
+        text += f"Username: @{html.quote(user_data['username'])}\n"
+    text += f"Регистрация: {user_data['registered_at'][:10]}\n"
+    text += "-" * 20 + "\n"
+    return text
 
 
-def cleanup_temp_files():
-    """Очистка временных файлов"""
-    for file in os.listdir('.'):
-        if file.startswith('appointment_') and file.endswith('.ics'):
-            try:
-                os.remove(file)
-            except:
-                pass
\ No newline at end of file
+def format_reminder(appointment: Dict) -> str:
+    """Текст напоминания о приёме"""
+    return (
+        f"⏰ Напоминаем о записи #{appointment['id']}\n\n"
+        f"👨‍⚕️ Врач: {appointment['doctor']}\n"
+        f"💉 Процедура: {appointment['procedure']}\n"
+        f"📅 Дата: {appointment['date']}\n"
+        f"⏰ Время: {appointment['time']}\n\n"
+        f"Если вы не сможете прийти, отмените запись в разделе «Мои записи»."
+    )
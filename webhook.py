@@ -0,0 +1,57 @@
+import asyncio
+from typing import Any, Dict
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from config import (WEBHOOK_BASE_URL, WEBHOOK_PATH, WEBHOOK_SECRET,
+                    WEBHOOK_MAX_CONNECTIONS, MAX_CONCURRENT_UPDATES)
+
+
+class LimitedRequestHandler(SimpleRequestHandler):
+    """Обработчик вебхука с ограничением числа одновременно обрабатываемых обновлений.
+
+    Место на семафоре занимается до создания задачи обновления: при
+    заполненном лимите запрос ждёт ответа, а Telegram не отправляет
+    больше WEBHOOK_MAX_CONNECTIONS запросов одновременно, поэтому
+    всплеск нагрузки не создаёт неограниченное число задач.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot,
+                 max_concurrent_updates: int = MAX_CONCURRENT_UPDATES, **kwargs: Any):
+        super().__init__(dispatcher=dispatcher, bot=bot, **kwargs)
+        self._semaphore = asyncio.Semaphore(max_concurrent_updates)
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        update = await request.json(loads=bot.session.json_loads)
+        await self._semaphore.acquire()
+        task = asyncio.create_task(self._background_feed_update(bot=bot, update=update))
+        self._background_feed_update_tasks.add(task)
+        task.add_done_callback(self._background_feed_update_tasks.discard)
+        task.add_done_callback(lambda _: self._semaphore.release())
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+def create_webhook_app(dp: Dispatcher, bot: Bot,
+                       max_concurrent_updates: int = MAX_CONCURRENT_UPDATES) -> web.Application:
+    """Создание aiohttp-приложения, принимающего обновления через вебхук"""
+    app = web.Application()
+    LimitedRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=WEBHOOK_SECRET or None,
+        max_concurrent_updates=max_concurrent_updates
+    ).register(app, path=WEBHOOK_PATH)
+    # Запуск и остановка приложения вызывают startup/shutdown диспетчера
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def set_webhook(bot: Bot, dp: Dispatcher):
+    """Регистрация вебхука в Telegram"""
+    await bot.set_webhook(
+        url=f"{WEBHOOK_BASE_URL.rstrip('/')}{WEBHOOK_PATH}",
+        secret_token=WEBHOOK_SECRET or None,
+        max_connections=WEBHOOK_MAX_CONNECTIONS,
+        allowed_updates=dp.resolve_used_update_types()
+    )